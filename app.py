@@ -1,134 +1,314 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 import boto3
-import base64
+import os
 import uuid
+from botocore.config import Config
 from datetime import datetime
 from flask_cors import CORS
+import json_response
+import request_profiler
+from attendance_state import AttendanceState
+from attendance_utils import sort_newest_first, summarize_attendance
+from idempotency import IdempotencyConflict, idempotency_key, run_idempotent
+from gallery import is_known_shard
+from image_utils import check_image_quality, decode_image_data, quality_counters
+from person_index import search_keys
+from rekognition_governor import governed
+from storage import AWS_REGION, get_storage
+from stream_sessions import STREAM_SESSION_TTL, STREAMING_ENABLED, SessionStore, make_recognizer
 
 app = Flask(__name__)
 CORS(app)  # allow frontend requests
+request_profiler.init_app(app)  # opt-in via PROFILING_ENABLED=1
+json_response.init_app(app)  # fast encoder + gzip/br for large responses
 
-# AWS setup
-s3 = boto3.client("s3", region_name="us-east-1")  # S3 client
-dynamodb = boto3.resource("dynamodb", region_name="us-east-1")
-table = dynamodb.Table("face-metadata")  # DynamoDB table
-bucket_name = "facial-recognition-data-bucket"  # S3 bucket
+# Storage and AWS setup (clients are created once per process and shared by
+# all threads). STORAGE_BACKEND=edge keeps images and records on this node.
+storage = get_storage()
+aws_config = Config(max_pool_connections=int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "10")))
+rekognition = governed(boto3.client("rekognition", region_name=AWS_REGION, config=aws_config))
+stream_sessions = SessionStore(make_recognizer(rekognition, storage))  # streaming kiosk sessions
+attendance_state = AttendanceState(storage)  # debounces repeated marks per person
+STREAM_HEARTBEAT = 15  # seconds between keep-alive comments on idle event streams
+# Person lookups are revalidated with If-None-Match; a match costs a 304 and
+# no body. Kept private because the records are personal data.
+PERSON_CACHE_CONTROL = os.environ.get("PERSON_CACHE_CONTROL", "private, max-age=60, must-revalidate")
+PEOPLE_BATCH_MAX = int(os.environ.get("PEOPLE_BATCH_MAX", "1000"))  # faceIds per /get_faces call
+
+def idempotent_json(scope, data, handler):
+    """
+    Run handler() -> (status_code, payload) once per Idempotency-Key; a retry
+    with the same key gets the stored response back
+    """
+    try:
+        key = idempotency_key(request.headers.get("Idempotency-Key"), data)
+        status_code, payload, replayed = run_idempotent(storage.idempotency, scope, key, data, handler)
+    except IdempotencyConflict as e:
+        response = jsonify({"error": str(e), "retry": e.retry})
+        if e.retry:
+            response.headers["Retry-After"] = "1"
+        return response, e.status_code
+    response = jsonify(payload)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return response, status_code
+
+def cacheable_json(payload, version=None):
+    """
+    JSON response answered 304 when the client's copy matches. The ETag is
+    taken from the records' version attribute; rows written before versions
+    existed fall back to a hash of the payload. Werkzeug only answers GET
+    (and HEAD) conditionally, and the records are still read either way:
+    a 304 saves the body, not the DynamoDB call.
+    """
+    response = jsonify(payload)
+    tag = json_response.etag(version) if version is not None else json_response.etag(payload)
+    response.set_etag(tag, weak=True)  # weak: the body may be compressed
+    response.headers["Cache-Control"] = PERSON_CACHE_CONTROL
+    return response.make_conditional(request)
 
 # ✅ Homepage route
 @app.route("/", methods=["GET"])
 def home():
     return jsonify({"message": "Server running ✅"})
 
+# ✅ Health check for load balancers (never touches AWS)
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    return jsonify({"status": "ok", "pid": os.getpid()})
+
+# ✅ Process-local counters (quality gate rejections and AWS calls saved)
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return jsonify({"qualityGate": quality_counters()})
+
 # ✅ Register route
 @app.route("/register", methods=["POST"])
 def register():
     try:
         data = request.get_json()
-
-        first_name = data.get("firstName")
-        last_name = data.get("lastName")
-        dob = data.get("dateOfBirth")
-        phone = data.get("phoneNumber")
-        image_data = data.get("image")  # base64 string
-
-        if not all([first_name, last_name, dob, phone, image_data]):
-            return jsonify({"error": "Missing fields"}), 400
-
-        # Generate unique faceId
-        face_id = str(uuid.uuid4())
-
-        # Decode base64 image
-        if "," in image_data:
-            image_data = image_data.split(",")[1]
-        image_bytes = base64.b64decode(image_data)
-        image_key = f"faces/{face_id}.jpg"
-
-        # Upload to S3
-        s3.put_object(
-            Bucket=bucket_name,
-            Key=image_key,
-            Body=image_bytes,
-            ContentType="image/jpeg"
-        )
-
-        # Insert into DynamoDB
-        table.put_item(
-            Item={
-                "faceId": face_id,
-                "firstName": first_name,
-                "lastName": last_name,
-                "dateOfBirth": dob,
-                "phoneNumber": phone,
-                "imageKey": image_key
-            }
-        )
-
-        return jsonify({"message": "Registration successful ✅", "faceId": face_id})
+        return idempotent_json("register", data, lambda: register_person(data))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def register_person(data):
+    first_name = data.get("firstName")
+    last_name = data.get("lastName")
+    dob = data.get("dateOfBirth")
+    phone = data.get("phoneNumber")
+    image_data = data.get("image")  # base64 string
+
+    if not all([first_name, last_name, dob, phone, image_data]):
+        return 400, {"error": "Missing fields"}
+
+    # Generate unique faceId
+    face_id = str(uuid.uuid4())
+
+    # Decode base64 image
+    image_bytes = decode_image_data(image_data)
+    rejection = check_image_quality(image_bytes, saved_calls=1)
+    if rejection:
+        return 400, {"error": rejection["message"], "reason": rejection["reason"]}
+
+    # Store the image under its content hash (skipped if already stored)
+    image_key = storage.put_image(image_bytes)
+
+    # Save the metadata
+    storage.put_person({
+        "faceId": face_id,
+        "firstName": first_name,
+        "lastName": last_name,
+        "dateOfBirth": dob,
+        "phoneNumber": phone,
+        "s3Key": image_key,
+        **search_keys(first_name, last_name, phone)  # admin lookup indexes
+    })
+
+    return 200, {"message": "Registration successful ✅", "faceId": face_id}
+
 
 # ✅ Optional: Fetch face metadata by faceId
 @app.route("/get_face/<face_id>", methods=["GET"])
 def get_face(face_id):
     try:
-        response = table.get_item(Key={"faceId": face_id})
-        item = response.get("Item")
+        item = storage.get_person(face_id)
         if not item:
             return jsonify({"error": "Face not found"}), 404
-        return jsonify(item)
+        return cacheable_json(item, item.get("version"))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def people_version(people, missing):
+    """Version of a /get_faces result, or None if any record predates versions"""
+    versions = [person.get("version") for person in people.values()]
+    if not all(versions):
+        return None
+    return sorted(f"{face_id}:{person['version']}" for face_id, person in people.items()) + sorted(missing)
+
+# ✅ Fetch many faces at once (GET ?faceIds=a,b,c or POST {"faceIds": [...]}).
+# Only GET is cacheable: a POST is always answered 200 with the full body.
+@app.route("/get_faces", methods=["GET", "POST"])
+def get_faces():
+    try:
+        if request.method == "POST":
+            face_ids = (request.get_json(silent=True) or {}).get("faceIds") or []
+        else:
+            face_ids = [f for f in request.args.get("faceIds", "").split(",") if f]
+        if not isinstance(face_ids, list) or not all(isinstance(f, str) for f in face_ids):
+            return jsonify({"error": "faceIds must be a list of strings"}), 400
+        if len(face_ids) > PEOPLE_BATCH_MAX:
+            return jsonify({"error": f"At most {PEOPLE_BATCH_MAX} faceIds per request"}), 400
+
+        people = storage.get_people(face_ids)
+        missing = [f for f in dict.fromkeys(face_ids) if f not in people]
+        return cacheable_json({
+            "success": True,
+            "people": people,
+            "missing": missing
+        }, people_version(people, missing))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# ✅ Streaming sessions: the kiosk posts frames continuously and receives
+# match events; faces are tracked between frames so each person is only
+# recognised when they first appear (or their match has gone stale)
+@app.route("/stream/sessions", methods=["POST"])
+def create_stream_session():
+    if not STREAMING_ENABLED:
+        return jsonify({"error": "Streaming is disabled on this server"}), 404
+    data = request.get_json(silent=True) or {}
+    shard = data.get("shard", "")
+    if not isinstance(shard, str) or not is_known_shard(shard):
+        return jsonify({"error": "Unknown gallery shard"}), 400
+    session = stream_sessions.create(shard)
+    if not session:
+        return jsonify({"error": "Too many streaming sessions"}), 503
+    return jsonify({"sessionId": session.id, "idleTimeout": STREAM_SESSION_TTL}), 201
+
+@app.route("/stream/sessions/<session_id>/frames", methods=["POST"])
+def stream_frame(session_id):
+    try:
+        session = stream_sessions.get(session_id)
+        if not session:
+            return jsonify({"error": "Session not found"}), 404
+        
+        data = request.get_json()
+        if not data or not data.get("image"):
+            return jsonify({"error": "No image provided"}), 400
+        
+        # Optional face boxes from a detector on the kiosk (ratios, as Rekognition)
+        boxes = data.get("boxes")
+        if boxes is not None:
+            try:
+                boxes = [{k: float(box[k]) for k in ("Left", "Top", "Width", "Height")} for box in boxes]
+            except (KeyError, TypeError, ValueError):
+                return jsonify({"error": "Invalid face boxes"}), 400
+        
+        events, tracks = session.process_frame(decode_image_data(data["image"]), boxes)
+        return jsonify({"events": events, "tracks": tracks})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/stream/sessions/<session_id>/events", methods=["GET"])
+def stream_events(session_id):
+    session = stream_sessions.get(session_id)
+    if not session:
+        return jsonify({"error": "Session not found"}), 404
+    try:
+        after = int(request.headers.get("Last-Event-ID") or request.args.get("after", 0))
+    except ValueError:
+        return jsonify({"error": "Last-Event-ID must be an event number"}), 400
+    
+    # Server-sent events over a chunked response
+    def generate():
+        seq = after
+        while not session.closed:
+            events = session.wait_events(seq, STREAM_HEARTBEAT)
+            if not events:
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                seq = event["seq"]
+                yield f"id: {seq}\nevent: {event['type']}\ndata: {json_response.dumps(event).decode()}\n\n"
+    
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/stream/sessions/<session_id>", methods=["DELETE"])
+def close_stream_session(session_id):
+    session = stream_sessions.close(session_id)
+    if not session:
+        return jsonify({"error": "Session not found"}), 404
+    return jsonify({"success": True, "stats": session.stats})
+
 # ✅ Attendance endpoints
 @app.route("/attendance", methods=["POST"])
 def mark_attendance():
     try:
         data = request.get_json()
-        
-        face_id = data.get("faceId")
-        person_data = data.get("person", {})
-        attendance_type = data.get("type", "checkin")
-        confidence = data.get("confidence", 0.0)
-        
-        if not face_id:
-            return jsonify({"error": "Face ID is required"}), 400
-        
-        # Create attendance record
-        attendance_id = f"att_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{face_id}"
-        timestamp = datetime.utcnow().isoformat()
-        date = timestamp.split('T')[0]
-        time = timestamp.split('T')[1].split('.')[0]
-        
-        attendance_record = {
-            "attendanceId": attendance_id,
-            "faceId": face_id,
-            "firstName": person_data.get("firstName", "Unknown"),
-            "lastName": person_data.get("lastName", "Unknown"),
-            "dateOfBirth": person_data.get("dateOfBirth", ""),
-            "phoneNumber": person_data.get("phoneNumber", ""),
-            "type": attendance_type,
-            "confidence": confidence,
-            "timestamp": timestamp,
-            "date": date,
-            "time": time,
-            "createdAt": timestamp
-        }
-        
-        # Save to DynamoDB (using a separate attendance table)
-        attendance_table = dynamodb.Table("attendance-records")
-        attendance_table.put_item(Item=attendance_record)
-        
-        return jsonify({
-            "success": True,
-            "attendanceId": attendance_id,
-            "record": attendance_record,
-            "message": f"Attendance {attendance_type} recorded successfully"
-        })
-        
+        return idempotent_json("attendance", data, lambda: record_attendance(data))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def record_attendance(data):
+    face_id = data.get("faceId")
+    person_data = data.get("person", {})
+    requested_type = data.get("type")  # checkin, checkout, or omitted/"auto" to toggle
+    confidence = data.get("confidence", 0.0)
+    
+    if not face_id:
+        return 400, {"error": "Face ID is required"}
+    
+    # Repeats of the person's current state within the debounce window are no-ops
+    state, previous = attendance_state.transition(face_id, requested_type)
+    if state is None:
+        return 200, {
+            "success": True,
+            "written": False,
+            "type": previous["type"],
+            "state": previous,
+            "message": f"Already {'checked in' if previous['type'] == 'checkin' else 'checked out'}"
+        }
+    attendance_type = state["type"]
+    
+    # Create attendance record
+    # Microseconds keep a checkin and checkout in the same second apart
+    attendance_id = f"att_{datetime.fromisoformat(state['timestamp']).strftime('%Y%m%d_%H%M%S_%f')}_{face_id}"
+    timestamp = state["timestamp"]
+    date = timestamp.split('T')[0]
+    time = timestamp.split('T')[1].split('.')[0]
+    
+    attendance_record = {
+        "attendanceId": attendance_id,
+        "faceId": face_id,
+        "firstName": person_data.get("firstName", "Unknown"),
+        "lastName": person_data.get("lastName", "Unknown"),
+        "dateOfBirth": person_data.get("dateOfBirth", ""),
+        "phoneNumber": person_data.get("phoneNumber", ""),
+        "type": attendance_type,
+        "confidence": confidence,
+        "timestamp": timestamp,
+        "date": date,
+        "time": time,
+        "createdAt": timestamp
+    }
+    
+    # Save to the attendance table
+    try:
+        storage.put_attendance(attendance_record)
+    except Exception:
+        attendance_state.revert(face_id, state, previous)
+        raise
+    
+    return 200, {
+        "success": True,
+        "written": True,
+        "type": attendance_type,
+        "attendanceId": attendance_id,
+        "record": attendance_record,
+        "message": f"Attendance {attendance_type} recorded successfully"
+    }
+
 @app.route("/attendance/records", methods=["GET"])
 def get_attendance_records():
     try:
@@ -136,34 +316,15 @@ def get_attendance_records():
         status_filter = request.args.get("status", "all")
         limit = int(request.args.get("limit", 100))
         
-        attendance_table = dynamodb.Table("attendance-records")
-        
-        # Build scan parameters
-        scan_params = {"Limit": limit}
-        
-        # Add filters
-        filter_expressions = []
-        expression_values = {}
-        
-        if date_filter:
-            filter_expressions.append("date = :date")
-            expression_values[":date"] = date_filter
-        
-        if status_filter != "all":
-            filter_expressions.append("#type = :type")
-            expression_values[":type"] = status_filter
-            expression_values["#type"] = "type"  # 'type' is a reserved word
-        
-        if filter_expressions:
-            scan_params["FilterExpression"] = " AND ".join(filter_expressions)
-            scan_params["ExpressionAttributeValues"] = expression_values
-        
-        # Scan table
-        response = attendance_table.scan(**scan_params)
-        records = response.get("Items", [])
+        records = storage.attendance_records(date=date_filter, record_type=status_filter, limit=limit)
         
         # Sort by timestamp (newest first)
-        records.sort(key=lambda x: x["timestamp"], reverse=True)
+        sort_newest_first(records)
+        
+        # ?fields=a,b trims records to those fields; ?exclude=personal drops
+        # dateOfBirth and phoneNumber
+        records = json_response.project(records, fields=json_response.parse_fields(request.args.get("fields")),
+                                        exclude=json_response.parse_exclude(request.args.get("exclude")))
         
         return jsonify({
             "success": True,
@@ -179,41 +340,11 @@ def get_attendance_stats():
     try:
         date_filter = request.args.get("date", datetime.utcnow().strftime("%Y-%m-%d"))
         
-        attendance_table = dynamodb.Table("attendance-records")
-        
         # Get records for the specified date
-        response = attendance_table.scan(
-            FilterExpression="date = :date",
-            ExpressionAttributeValues={":date": date_filter}
-        )
-        
-        records = response.get("Items", [])
+        records = storage.attendance_for_date(date_filter)
         
         # Calculate statistics
-        total_records = len(records)
-        checkin_count = len([r for r in records if r["type"] == "checkin"])
-        checkout_count = len([r for r in records if r["type"] == "checkout"])
-        
-        # Count unique people who checked in today
-        unique_people = len(set(r["faceId"] for r in records if r["type"] == "checkin"))
-        
-        # Count currently checked in (people whose last record is check-in)
-        last_records_by_person = {}
-        for record in records:
-            face_id = record["faceId"]
-            if face_id not in last_records_by_person or record["timestamp"] > last_records_by_person[face_id]["timestamp"]:
-                last_records_by_person[face_id] = record
-        
-        currently_checked_in = len([r for r in last_records_by_person.values() if r["type"] == "checkin"])
-        
-        stats = {
-            "date": date_filter,
-            "totalRecords": total_records,
-            "checkinCount": checkin_count,
-            "checkoutCount": checkout_count,
-            "uniquePeople": unique_people,
-            "currentlyCheckedIn": currently_checked_in
-        }
+        stats = summarize_attendance(records, date_filter)
         
         return jsonify({
             "success": True,
@@ -225,4 +356,5 @@ def get_attendance_stats():
 
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    # Development server only; use serve.py in production
+    app.run(debug=os.environ.get("FLASK_DEBUG", "1") == "1")
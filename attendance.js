@@ -7,6 +7,7 @@ class AttendanceSystem {
         this.startBtn = document.getElementById('startWebcam');
         this.stopBtn = document.getElementById('stopWebcam');
         this.markBtn = document.getElementById('markAttendance');
+        this.continuousBtn = document.getElementById('continuousMode');
         this.backBtn = document.getElementById('backBtn');
         this.resultDiv = document.getElementById('attendanceResult');
         this.resultContent = document.getElementById('resultContent');
@@ -20,9 +21,29 @@ class AttendanceSystem {
         // AWS Configuration
         this.awsConfig = {
             region: 'us-east-1',
-            apiGatewayUrl: 'https://58z5i6ahil.execute-api.us-east-1.amazonaws.com/prod'
+            apiGatewayUrl: 'https://58z5i6ahil.execute-api.us-east-1.amazonaws.com/prod',
+            galleryShard: '' // This kiosk's site/department gallery shard ('' = default collection)
         };
         
+        // Burst capture: the server scores the frames and recognizes only the best one
+        this.burstConfig = {
+            frames: 3,
+            intervalMs: 150
+        };
+        
+        // Continuous mode: frames are streamed to a session on the app server,
+        // which tracks faces between frames and pushes match events back
+        this.streamConfig = {
+            serverUrl: window.location.origin, // App server with STREAMING_ENABLED=1; replace if the page is hosted elsewhere
+            intervalMs: 400,
+            remarkAfterMs: 60000 // ignore repeat matches of the same person for this long
+        };
+        this.streamSession = null;
+        this.eventSource = null;
+        this.streaming = false;
+        this.lastMarked = new Map();
+        this.faceDetector = ('FaceDetector' in window) ? new window.FaceDetector({ fastMode: true }) : null;
+        
         this.initializeEventListeners();
         this.loadAttendanceRecords();
         this.updateStats();
@@ -32,6 +53,7 @@ class AttendanceSystem {
         this.startBtn.addEventListener('click', () => this.startWebcam());
         this.stopBtn.addEventListener('click', () => this.stopWebcam());
         this.markBtn.addEventListener('click', () => this.markAttendance());
+        this.continuousBtn.addEventListener('click', () => this.toggleContinuous());
         this.backBtn.addEventListener('click', () => this.goBack());
         
         // Filter controls
@@ -63,6 +85,7 @@ class AttendanceSystem {
                 this.startBtn.textContent = 'Start Camera';
                 this.stopBtn.disabled = false;
                 this.markBtn.disabled = false;
+                this.continuousBtn.disabled = false;
             });
             
         } catch (error) {
@@ -74,6 +97,9 @@ class AttendanceSystem {
     }
     
     stopWebcam() {
+        this.stopContinuous();
+        this.continuousBtn.disabled = true;
+        
         if (this.stream) {
             this.stream.getTracks().forEach(track => track.stop());
             this.stream = null;
@@ -106,15 +132,30 @@ class AttendanceSystem {
         return this.capturedImage;
     }
     
+    async captureBurst() {
+        const frames = [];
+        for (let i = 0; i < this.burstConfig.frames; i++) {
+            if (i > 0) {
+                await new Promise(resolve => setTimeout(resolve, this.burstConfig.intervalMs));
+            }
+            const frame = this.captureImage();
+            if (!frame) {
+                break;
+            }
+            frames.push(frame);
+        }
+        return frames;
+    }
+    
     async markAttendance() {
         if (!this.stream) {
             this.showMessage('Please start the camera first.', 'error');
             return;
         }
         
-        // Capture image first
-        const imageData = this.captureImage();
-        if (!imageData) {
+        // Capture a short burst of frames first
+        const frames = await this.captureBurst();
+        if (frames.length === 0) {
             return;
         }
         
@@ -123,35 +164,12 @@ class AttendanceSystem {
             this.setLoading(true);
             
             // Call AWS API Gateway for face verification
-            const verificationResult = await this.verifyFaceAPI(imageData);
+            const verificationResult = await this.verifyFaceAPI(frames);
             
             if (verificationResult.match) {
-                // Determine if this is check-in or check-out
-                const attendanceType = this.determineAttendanceType(verificationResult.faceId);
-                
-                // Create attendance record
-                const attendanceRecord = {
-                    id: Date.now().toString(),
-                    faceId: verificationResult.faceId,
-                    person: verificationResult.person,
-                    timestamp: new Date().toISOString(),
-                    type: attendanceType, // 'checkin' or 'checkout'
-                    confidence: verificationResult.confidence,
-                    date: new Date().toISOString().split('T')[0],
-                    time: new Date().toTimeString().split(' ')[0]
-                };
-                
-                // Save attendance record locally and to backend
-                this.saveAttendanceRecord(attendanceRecord);
-                await this.saveAttendanceToBackend(attendanceRecord);
-                
-                // Update UI
-                this.displayAttendanceResult(attendanceRecord);
-                this.addRecordToTable(attendanceRecord);
-                this.updateStats();
-                
-                this.showMessage(`${attendanceType === 'checkin' ? 'Checked in' : 'Checked out'} successfully!`, 'success');
-                
+                await this.recordAttendance(verificationResult);
+            } else if (verificationResult.reason) {
+                this.showMessage(verificationResult.message, 'error');
             } else {
                 this.showMessage('Face not recognized. Please ensure you are registered in the system.', 'error');
             }
@@ -164,23 +182,213 @@ class AttendanceSystem {
         }
     }
     
+    async recordAttendance(match) {
+        // Create attendance record (the type is a local guess, used when the
+        // backend cannot be reached)
+        const attendanceRecord = {
+            id: Date.now().toString(),
+            faceId: match.faceId,
+            person: match.person,
+            timestamp: new Date().toISOString(),
+            type: this.determineAttendanceType(match.faceId), // 'checkin' or 'checkout'
+            confidence: match.confidence,
+            date: new Date().toISOString().split('T')[0],
+            time: new Date().toTimeString().split(' ')[0]
+        };
+        
+        // The backend toggles check-in/check-out per person and ignores
+        // repeats of the current state, so its answer wins
+        const result = await this.saveAttendanceToBackend(attendanceRecord);
+        if (result && result.written === false) {
+            this.showMessage(`${match.person.firstName} is already ${result.type === 'checkin' ? 'checked in' : 'checked out'}`, 'info');
+            return;
+        }
+        if (result && result.type) {
+            attendanceRecord.type = result.type;
+        }
+        const attendanceType = attendanceRecord.type;
+        this.saveAttendanceRecord(attendanceRecord);
+        
+        // Update UI
+        this.displayAttendanceResult(attendanceRecord);
+        this.addRecordToTable(attendanceRecord);
+        this.updateStats();
+        
+        this.showMessage(`${attendanceType === 'checkin' ? 'Checked in' : 'Checked out'} successfully!`, 'success');
+    }
+    
+    toggleContinuous() {
+        if (this.streaming) {
+            this.stopContinuous();
+        } else {
+            this.startContinuous();
+        }
+    }
+    
+    async openStreamSession() {
+        const response = await fetch(`${this.streamConfig.serverUrl}/stream/sessions`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ shard: this.awsConfig.galleryShard })
+        });
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        this.streamSession = (await response.json()).sessionId;
+        
+        // Match events are pushed over server-sent events
+        if (this.eventSource) {
+            this.eventSource.close();
+        }
+        this.eventSource = new EventSource(`${this.streamConfig.serverUrl}/stream/sessions/${this.streamSession}/events`);
+        this.eventSource.addEventListener('match', (event) => this.handleStreamMatch(JSON.parse(event.data)));
+    }
+    
+    async startContinuous() {
+        try {
+            await this.openStreamSession();
+        } catch (error) {
+            console.error('Failed to start streaming session:', error);
+            this.showMessage('Continuous mode is unavailable. Use Mark Attendance instead.', 'error');
+            return;
+        }
+        
+        this.streaming = true;
+        this.continuousBtn.textContent = 'Stop Continuous';
+        this.markBtn.disabled = true;
+        this.showMessage('Continuous attendance started. Step in front of the camera.', 'info');
+        
+        while (this.streaming) {
+            try {
+                await this.sendStreamFrame();
+            } catch (error) {
+                console.error('Streaming frame failed:', error);
+            }
+            await new Promise(resolve => setTimeout(resolve, this.streamConfig.intervalMs));
+        }
+    }
+    
+    async sendStreamFrame() {
+        const frame = this.captureImage();
+        if (!frame) {
+            return;
+        }
+        
+        const payload = { image: frame };
+        if (this.faceDetector) {
+            // Let the server skip its own detection: send boxes as frame ratios
+            const faces = await this.faceDetector.detect(this.canvas);
+            payload.boxes = faces.map(face => ({
+                Left: face.boundingBox.x / this.canvas.width,
+                Top: face.boundingBox.y / this.canvas.height,
+                Width: face.boundingBox.width / this.canvas.width,
+                Height: face.boundingBox.height / this.canvas.height
+            }));
+        }
+        
+        const response = await fetch(`${this.streamConfig.serverUrl}/stream/sessions/${this.streamSession}/frames`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(payload)
+        });
+        
+        // Session expired or served by another process: start a new one
+        if (response.status === 404) {
+            await this.openStreamSession();
+            return;
+        }
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        
+        // If the event stream is down, fall back to the events in the reply
+        const result = await response.json();
+        if (!this.eventSource || this.eventSource.readyState !== EventSource.OPEN) {
+            result.events.filter(event => event.type === 'match').forEach(event => this.handleStreamMatch(event));
+        }
+    }
+    
+    handleStreamMatch(match) {
+        const now = Date.now();
+        const last = this.lastMarked.get(match.faceId);
+        if (last && now - last < this.streamConfig.remarkAfterMs) {
+            return;
+        }
+        this.lastMarked.set(match.faceId, now);
+        this.recordAttendance(match);
+    }
+    
+    stopContinuous() {
+        if (!this.streaming && !this.streamSession) {
+            return;
+        }
+        this.streaming = false;
+        if (this.eventSource) {
+            this.eventSource.close();
+            this.eventSource = null;
+        }
+        if (this.streamSession) {
+            fetch(`${this.streamConfig.serverUrl}/stream/sessions/${this.streamSession}`, { method: 'DELETE' })
+                .catch(error => console.error('Failed to close streaming session:', error));
+            this.streamSession = null;
+        }
+        this.continuousBtn.textContent = 'Start Continuous';
+        this.markBtn.disabled = !this.stream;
+    }
+    
+    newIdempotencyKey() {
+        if (crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+    }
+    
+    // POST JSON, retrying network errors, 5xx and "in progress" answers
+    // with the same Idempotency-Key
+    async postWithRetry(url, payload, idempotencyKey, attempts = 3) {
+        for (let attempt = 1; ; attempt++) {
+            try {
+                const response = await fetch(url, {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                        'Idempotency-Key': idempotencyKey,
+                    },
+                    body: JSON.stringify(payload)
+                });
+                const retryable = response.status >= 500 ||
+                    (response.status === 409 && (await response.clone().json().catch(() => ({}))).retry);
+                if (!retryable || attempt >= attempts) {
+                    return response;
+                }
+            } catch (error) {
+                if (attempt >= attempts) {
+                    throw error;
+                }
+            }
+            await new Promise(resolve => setTimeout(resolve, 500 * 2 ** (attempt - 1)));
+        }
+    }
+    
     async saveAttendanceToBackend(record) {
         try {
-            const response = await fetch(`${this.awsConfig.apiGatewayUrl}/attendance`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify({
-                    faceId: record.faceId,
-                    person: record.person,
-                    type: record.type,              // checkin / checkout
-                    confidence: record.confidence,  // confidence score
-                    timestamp: record.timestamp,    // full ISO timestamp
-                    date: record.date,              // YYYY-MM-DD
-                    time: record.time               // HH:MM:SS
-                })
-            });
+            // Retries reuse the record's key, so a lost response never
+            // turns into a second attendance record
+            record.idempotencyKey = record.idempotencyKey || this.newIdempotencyKey();
+            const response = await this.postWithRetry(`${this.awsConfig.apiGatewayUrl}/attendance`, {
+                action: 'mark_attendance',
+                faceId: record.faceId,
+                person: record.person,
+                type: 'auto',                   // backend picks checkin / checkout
+                confidence: record.confidence,  // confidence score
+                timestamp: record.timestamp,    // full ISO timestamp
+                date: record.date,              // YYYY-MM-DD
+                time: record.time               // HH:MM:SS
+            }, record.idempotencyKey);
     
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
@@ -188,10 +396,12 @@ class AttendanceSystem {
     
             const result = await response.json();
             console.log('✅ Attendance saved to backend:', result);
+            return result;
     
         } catch (error) {
             console.error('❌ Failed to save attendance to backend:', error);
             this.showMessage('Failed to save attendance to backend', 'error');
+            return null;
         }
     }
     
@@ -213,16 +423,24 @@ class AttendanceSystem {
         return lastRecord.type === 'checkin' ? 'checkout' : 'checkin';
     }
     
-    async verifyFaceAPI(imageData) {
+    async verifyFaceAPI(frames) {
         try {
             const response = await fetch(`${this.awsConfig.apiGatewayUrl}/verify`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({ image: imageData })
+                body: JSON.stringify({ images: frames, shard: this.awsConfig.galleryShard })
             });
             
+            // Image rejected by the server-side quality check: recapture
+            if (response.status === 400) {
+                const rejected = await response.json();
+                if (rejected.reason) {
+                    return rejected;
+                }
+            }
+            
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
@@ -237,11 +455,11 @@ class AttendanceSystem {
         } catch (error) {
             console.error('API call failed:', error);
             // Fallback to simulation if API is not available
-            return await this.simulateVerification(imageData);
+            return await this.simulateVerification(frames);
         }
     }
     
-    async simulateVerification(imageData) {
+    async simulateVerification(frames) {
         // Simulate API call delay
         await new Promise(resolve => setTimeout(resolve, 1500));
         
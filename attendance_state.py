@@ -0,0 +1,115 @@
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+# Each person has one current-state record (last type and when it was
+# written). A mark that repeats the current state within the debounce window
+# is collapsed into a no-op instead of writing another attendance record.
+ATTENDANCE_DEBOUNCE_SECONDS = float(os.environ.get("ATTENDANCE_DEBOUNCE_SECONDS", "300"))
+ATTENDANCE_STATE_CACHE_SIZE = int(os.environ.get("ATTENDANCE_STATE_CACHE_SIZE", "10000"))
+ATTENDANCE_TYPES = ("checkin", "checkout")
+AUTO = "auto"
+
+
+def next_type(state, requested, now, window=ATTENDANCE_DEBOUNCE_SECONDS):
+    """
+    The attendance type to record, or None for a no-op. requested is
+    'checkin', 'checkout' or None/'auto' to toggle: a person checked in
+    today checks out, anyone else checks in.
+    """
+    current = state.get("type") if state else None
+    if current:
+        age = (now - datetime.fromisoformat(state["timestamp"])).total_seconds()
+        # Auto marks within the window repeat whatever happened last (the
+        # same person still standing at the kiosk); explicit ones only
+        # collapse when they ask for the current state
+        if age < window and requested in (None, AUTO, current):
+            return None
+    if requested in ATTENDANCE_TYPES:
+        return requested
+    if current == "checkin" and state["date"] == now.date().isoformat():
+        return "checkout"
+    return "checkin"
+
+
+class AttendanceState:
+    """
+    Current attendance state per person, read through an in-process LRU
+    cache. The store (a storage backend) writes state conditionally on the
+    previous timestamp, so concurrent workers cannot both record the same
+    transition; a worker whose write loses re-reads and decides again.
+    Another worker or container may have changed the state since it was
+    cached, so a no-op is only returned after a consistent read of the
+    store agrees; the cache saves the read on marks that are written.
+    """
+
+    def __init__(self, store, window=ATTENDANCE_DEBOUNCE_SECONDS, cache_size=ATTENDANCE_STATE_CACHE_SIZE):
+        self.store = store
+        self.window = window
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.cache_lock = threading.Lock()
+        # Striped locks: marks for one person in this process are decided in turn
+        self.locks = [threading.Lock() for _ in range(64)]
+
+    def _cached(self, face_id):
+        with self.cache_lock:
+            if face_id in self.cache:
+                self.cache.move_to_end(face_id)
+                return self.cache[face_id]
+        return None
+
+    def _remember(self, face_id, state):
+        with self.cache_lock:
+            self.cache[face_id] = state
+            self.cache.move_to_end(face_id)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def transition(self, face_id, requested=None, now=None):
+        """
+        Decide and claim the next state for face_id. Returns (state, previous):
+        state is the new state to record an attendance row for, or None when
+        the mark is a no-op (previous is then the current state).
+        """
+        now = now or datetime.utcnow()
+        with self.locks[hash(face_id) % len(self.locks)]:
+            state = self._cached(face_id)
+            fresh = state is None
+            if fresh:
+                state = self.store.get_attendance_state(face_id)
+            for _ in range(4):
+                attendance_type = next_type(state, requested, now, self.window)
+                if attendance_type is None:
+                    if not fresh:
+                        # Confirm against the store before dropping the mark
+                        state, fresh = self.store.get_attendance_state(face_id), True
+                        continue
+                    self._remember(face_id, state)
+                    return None, state
+                timestamp = now.isoformat()
+                new_state = {
+                    "faceId": face_id,
+                    "type": attendance_type,
+                    "timestamp": timestamp,
+                    "date": timestamp.split("T")[0]
+                }
+                expected = state["timestamp"] if state else None
+                if self.store.put_attendance_state(new_state, expected):
+                    self._remember(face_id, new_state)
+                    return new_state, state
+                # Another worker changed it since it was cached or read
+                state, fresh = self.store.get_attendance_state(face_id), True
+            raise RuntimeError(f"Attendance state for {face_id} is changing too fast to update")
+
+    def revert(self, face_id, state, previous):
+        """Undo a transition whose attendance record could not be written"""
+        restored = previous or {"faceId": face_id, "type": None, "timestamp": state["timestamp"],
+                                "date": state["date"]}
+        with self.locks[hash(face_id) % len(self.locks)]:
+            if self.store.put_attendance_state(restored, state["timestamp"]):
+                self._remember(face_id, restored)
+            else:
+                with self.cache_lock:
+                    self.cache.pop(face_id, None)
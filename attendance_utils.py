@@ -0,0 +1,37 @@
+from operator import itemgetter
+
+by_timestamp = itemgetter("timestamp")
+
+
+def sort_newest_first(records):
+    """Sort attendance records in place by timestamp, newest first"""
+    records.sort(key=by_timestamp, reverse=True)
+    return records
+
+
+def summarize_attendance(records, date):
+    """Compute the daily attendance statistics for a list of records"""
+    total_records = len(records)
+    checkin_count = len([r for r in records if r["type"] == "checkin"])
+    checkout_count = len([r for r in records if r["type"] == "checkout"])
+
+    # Count unique people who checked in today
+    unique_people = len(set(r["faceId"] for r in records if r["type"] == "checkin"))
+
+    # Count currently checked in (people whose last record is check-in)
+    last_records_by_person = {}
+    for record in records:
+        face_id = record["faceId"]
+        if face_id not in last_records_by_person or record["timestamp"] > last_records_by_person[face_id]["timestamp"]:
+            last_records_by_person[face_id] = record
+
+    currently_checked_in = len([r for r in last_records_by_person.values() if r["type"] == "checkin"])
+
+    return {
+        "date": date,
+        "totalRecords": total_records,
+        "checkinCount": checkin_count,
+        "checkoutCount": checkout_count,
+        "uniquePeople": unique_people,
+        "currentlyCheckedIn": currently_checked_in
+    }
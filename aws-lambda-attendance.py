@@ -1,23 +1,25 @@
 import json
-import boto3
 from datetime import datetime
 from decimal import Decimal
+from json_response import (is_preflight, lambda_response as response_json, parse_exclude, parse_fields,
+                           preflight_response, project)
+from attendance_state import AttendanceState
+from idempotency import lambda_idempotent
+from log_utils import get_logger, summarize_event
+from storage import AWSStorage
 
-# DynamoDB setup
-dynamodb = boto3.resource("dynamodb")
-TABLE_NAME = "attendance-records"   # 👈 Change if your table name is different
-table = dynamodb.Table(TABLE_NAME)
+log = get_logger("attendance")
 
-# ✅ Custom encoder for Decimal
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return float(obj)  # Convert Decimal to float for JSON response
-        return super(DecimalEncoder, self).default(obj)
+# DynamoDB setup (table names come from ATTENDANCE_TABLE / METADATA_TABLE)
+storage = AWSStorage()
+attendance_state = AttendanceState(storage)  # per-person state, cached per container
 
 def lambda_handler(event, context):
     try:
-        print("🔍 Incoming event:", json.dumps(event))
+        log.begin(context)
+        if is_preflight(event):
+            return preflight_response()
+        log.info("🔍 Incoming event", event=summarize_event(event))
 
         # Parse body
         body = event.get("body", "{}")
@@ -25,32 +27,34 @@ def lambda_handler(event, context):
             try:
                 data = json.loads(body)
             except json.JSONDecodeError:
-                print("❌ Failed to decode body JSON:", body)
+                log.warning("❌ Failed to decode body JSON", body=body)
                 data = {}
         else:
             data = body
 
         action = data.get("action", "")
-        print(f"👉 Action received: {action}")
+        log.info("👉 Action received", action=action)
 
         if action == "mark_attendance":
-            return mark_attendance(data)
+            # Retries with the same Idempotency-Key replay the first response
+            return lambda_idempotent(storage.idempotency, "attendance", event, data,
+                                     lambda: mark_attendance(data))
         elif action == "get_records":
-            return get_attendance_records()
+            return get_attendance_records(data, event)
         elif action == "get_stats":
             return get_attendance_stats()
         else:
             return response_json(400, {"success": False, "error": "Invalid action specified"})
 
     except Exception as e:
-        print("❌ Lambda error:", str(e))
+        log.error("❌ Lambda error", error=str(e))
         return response_json(500, {"success": False, "error": str(e)})
 
 def mark_attendance(data):
     try:
         face_id = data.get("faceId")
         person_data = data.get("person", {})
-        attendance_type = data.get("type", "checkin")
+        requested_type = data.get("type")  # checkin, checkout, or omitted/"auto" to toggle
 
         confidence = data.get("confidence", None)
         confidence_value = Decimal(str(confidence)) if confidence is not None else None
@@ -58,10 +62,24 @@ def mark_attendance(data):
         if not face_id:
             return response_json(400, {"success": False, "error": "Face ID is required"})
 
-        timestamp = datetime.utcnow().isoformat()
+        # Repeats of the person's current state within the debounce window are no-ops
+        state, previous = attendance_state.transition(face_id, requested_type)
+        if state is None:
+            log.info("⏭️ Repeated mark collapsed", faceId=face_id, type=previous["type"])
+            return response_json(200, {
+                "success": True,
+                "written": False,
+                "type": previous["type"],
+                "state": previous,
+                "message": f"Already {'checked in' if previous['type'] == 'checkin' else 'checked out'}"
+            })
+        attendance_type = state["type"]
+
+        timestamp = state["timestamp"]
         date = timestamp.split("T")[0]
         time = timestamp.split("T")[1].split(".")[0]
-        attendance_id = f"att_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}_{face_id}"
+        # Microseconds keep a checkin and checkout in the same second apart
+        attendance_id = f"att_{datetime.fromisoformat(state['timestamp']).strftime('%Y%m%d_%H%M%S_%f')}_{face_id}"
 
         attendance_record = {
             "attendanceId": attendance_id,
@@ -78,40 +96,48 @@ def mark_attendance(data):
             "createdAt": timestamp
         }
 
-        print("📝 Inserting record:", attendance_record)
-        table.put_item(Item=attendance_record)
-        print("✅ Inserted successfully")
+        log.debug("📝 Inserting record", record=attendance_record)
+        try:
+            storage.put_attendance(attendance_record)
+        except Exception:
+            attendance_state.revert(face_id, state, previous)
+            raise
+        log.info("✅ Inserted successfully", attendanceId=attendance_id, type=attendance_type)
 
         return response_json(200, {
             "success": True,
+            "written": True,
+            "type": attendance_type,
             "attendanceId": attendance_id,
             "record": attendance_record,
             "message": f"Attendance {attendance_type} recorded successfully"
         })
 
     except Exception as e:
-        print("❌ Error inserting attendance:", str(e))
+        log.error("❌ Error inserting attendance", error=str(e))
         return response_json(500, {"success": False, "error": f"Failed to mark attendance: {str(e)}"})
 
-def get_attendance_records():
+def get_attendance_records(data, event):
     try:
-        response = table.scan()
-        records = response.get("Items", [])
-        return response_json(200, {"success": True, "count": len(records), "records": records})
+        record_type = data.get("status", "all")
+        limit = int(data.get("limit", 100))
+        page = {}
+        if data.get("date"):
+            records = storage.attendance_records(date=data["date"], record_type=record_type, limit=limit)
+        else:
+            # Undated reads are paged: pass nextCursor back as "cursor" until
+            # it is null to read the whole table
+            records, page["nextCursor"] = storage.attendance_page(
+                record_type=record_type, limit=limit, cursor=data.get("cursor"))
+        # "fields" trims records to those fields; "exclude": "personal" drops
+        # dateOfBirth and phoneNumber
+        records = project(records, fields=parse_fields(data.get("fields")),
+                          exclude=parse_exclude(data.get("exclude")))
+        return response_json(200, {"success": True, "count": len(records), "records": records, **page}, event)
     except Exception as e:
-        print("❌ Error getting records:", str(e))
+        log.error("❌ Error getting records", error=str(e))
         return response_json(500, {"success": False, "error": str(e)})
 
 def get_attendance_stats():
     # Placeholder for stats (like daily checkins, etc.)
     return response_json(200, {"success": True, "message": "Stats placeholder"})
-
-def response_json(status_code, body_dict):
-    return {
-        "statusCode": status_code,
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*"
-        },
-        "body": json.dumps(body_dict, cls=DecimalEncoder)
-    }
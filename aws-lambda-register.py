@@ -1,14 +1,52 @@
 import json
 import boto3
 import base64
+import os
 import uuid
 from datetime import datetime
+from gallery import UnknownShard, collection_for, search_gallery, shard_for_registration
+from idempotency import lambda_idempotent
+from image_store import forget, is_content_key, put_image, read_image, restore_image
+from image_utils import check_image_quality, decode_image_data, quality_counters, quality_gate_active
+from json_response import CORS_HEADERS, is_preflight, preflight_response
+from log_utils import get_logger, summarize_event
+from person_index import delete_image_if_unreferenced, new_version, search_keys
+from rekognition_governor import RekognitionThrottled, governed, governor_metrics
+from storage import AWS_REGION, AWSStorage
+
+log = get_logger("register")
+
+# Region, bucket and table names come from AWS_REGION / BUCKET_NAME / METADATA_TABLE
+storage = AWSStorage()
+rekognition = governed(boto3.client('rekognition', region_name=AWS_REGION))
+
+# Duplicate-person handling: 'reject' refuses a registration whose face is
+# already in the collection, 'attach' adds the image to the existing person,
+# 'off' disables the pre-index search
+DUPLICATE_POLICY = os.environ.get('DUPLICATE_POLICY', 'reject')
+DUPLICATE_THRESHOLD = float(os.environ.get('DUPLICATE_THRESHOLD', '95'))
+
+# Every response, success or not, carries the same CORS headers
+JSON_HEADERS = {'Content-Type': 'application/json', **CORS_HEADERS}
+
+
+def find_duplicate(rekognition, shard, image):
+    """Return the closest existing face above DUPLICATE_THRESHOLD, if any"""
+    response = search_gallery(rekognition, image, home_shard=shard, threshold=DUPLICATE_THRESHOLD)
+    matches = response.get('FaceMatches', [])
+    return matches[0] if matches else None
+
 
 def lambda_handler(event, context):
     """
     Fixed Lambda function to register faces with better error handling
     """
     try:
+        log.begin(context)
+        if is_preflight(event):
+            return preflight_response()
+        log.info("Incoming event", event=summarize_event(event))
+
         # Parse request body
         if event.get('isBase64Encoded', False):
             body = base64.b64decode(event['body']).decode('utf-8')
@@ -16,7 +54,26 @@ def lambda_handler(event, context):
             body = event.get('body', '{}')
         
         data = json.loads(body)
-        
+
+        # A retried request with the same Idempotency-Key gets the first
+        # response back instead of indexing the face again
+        return lambda_idempotent(storage.idempotency, 'register', event, data, lambda: register_face(data))
+
+    except Exception as e:
+        log.error("Unexpected error", error=str(e))
+        return {
+            'statusCode': 500,
+            'headers': JSON_HEADERS,
+            'body': json.dumps({
+                'success': False,
+                'error': f'Registration failed: {str(e)}'
+            })
+        }
+
+
+def register_face(data):
+    """Register one face from a parsed request body; returns the API Gateway response"""
+    try:
         # Extract data
         first_name = data.get('firstName', '')
         last_name = data.get('lastName', '')
@@ -24,109 +81,214 @@ def lambda_handler(event, context):
         phone_number = data.get('phoneNumber', '')
         image_data = data.get('image', '')
         
-        print(f"Registering face for: {first_name} {last_name}")
+        log.info("Registering face", firstName=first_name, lastName=last_name)
         
         # Generate unique face ID
         face_id = str(uuid.uuid4())
         
-        # Initialize AWS services
-        s3_client = boto3.client('s3', region_name='us-east-1')
-        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-        rekognition = boto3.client('rekognition', region_name='us-east-1')
-        
-        # Configuration
-        bucket_name = 'facial-recognition-data-bucket'
-        collection_id = 'face-collection'
-        
-        # Decode and upload image to S3
-        print("Uploading image to S3...")
-        image_bytes = base64.b64decode(image_data.split(',')[1])
-        s3_key = f"faces/{face_id}.jpg"
+        s3_client = storage.s3
+        bucket_name = storage.bucket_name
+        try:
+            shard = shard_for_registration(data)
+        except UnknownShard as e:
+            return {
+                'statusCode': 400,
+                'headers': JSON_HEADERS,
+                'body': json.dumps({
+                    'success': False,
+                    'error': str(e)
+                })
+            }
+        collection_id = collection_for(shard)
         
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=s3_key,
-            Body=image_bytes,
-            ContentType='image/jpeg'
-        )
-        print(f"Image uploaded to S3: {s3_key}")
+        if data.get('s3Key'):
+            # The browser already uploaded the image with a presigned URL;
+            # Rekognition reads it straight from S3. Only content keys: the
+            # uploads/ prefix expires, which would leave the person's s3Key
+            # pointing at a deleted image.
+            s3_key = data['s3Key']
+            if not is_content_key(s3_key):
+                return {
+                    'statusCode': 400,
+                    'headers': JSON_HEADERS,
+                    'body': json.dumps({
+                        'success': False,
+                        'error': 'Invalid image key'
+                    })
+                }
+            image_source = {'S3Object': {'Bucket': bucket_name, 'Name': s3_key}}
+            image_bytes, uploaded = None, False
+            # The quality gate needs the pixels: one in-region GET, against
+            # the detect_faces and index_faces calls a rejection saves
+            rejection = None
+            if quality_gate_active():
+                rejection = check_image_quality(read_image(s3_client, bucket_name, s3_key), saved_calls=2)
+        else:
+            # Decode the image and reject unusable captures before any paid call
+            # (S3 put, detect_faces and index_faces)
+            image_bytes = decode_image_data(image_data)
+            rejection = check_image_quality(image_bytes, saved_calls=3)
+
+        if rejection:
+            log.info("Image rejected by quality gate", reason=rejection['reason'],
+                     metrics=rejection['metrics'], counters=quality_counters())
+            return {
+                'statusCode': 400,
+                'headers': JSON_HEADERS,
+                'body': json.dumps({
+                    'success': False,
+                    'reason': rejection['reason'],
+                    'error': rejection['message']
+                })
+            }
+
+        if image_bytes is not None:
+            # Upload image to S3 under its content hash (skipped if already stored)
+            log.debug("Uploading image to S3...")
+            s3_key, uploaded = put_image(s3_client, bucket_name, image_bytes)
+            log.info("Image stored in S3", s3Key=s3_key, size=len(image_bytes), uploaded=uploaded)
+            image_source = {'Bytes': image_bytes}
         
         # Ensure collection exists
-        print(f"Ensuring collection '{collection_id}' exists...")
+        log.debug("Ensuring collection exists", collectionId=collection_id)
         try:
             rekognition.describe_collection(CollectionId=collection_id)
-            print("Collection already exists")
+            log.debug("Collection already exists")
         except rekognition.exceptions.ResourceNotFoundException:
-            print("Creating collection...")
+            log.info("Creating collection", collectionId=collection_id)
             rekognition.create_collection(CollectionId=collection_id)
-            print("Collection created successfully")
+            log.info("Collection created successfully")
         
         # Index face in Rekognition collection
-        print("Indexing face in Rekognition...")
+        log.debug("Indexing face in Rekognition...")
         rekognition_face_id = None
         indexing_success = False
         
         try:
             # First, try to detect faces in the image
             detect_response = rekognition.detect_faces(
-                Image={'Bytes': image_bytes},
+                Image=image_source,
                 Attributes=['ALL']
             )
             
-            print(f"Face detection response: {json.dumps(detect_response, default=str)}")
+            log.info("Face detection response", faces=len(detect_response['FaceDetails']))
+            log.debug("Face detection detail", response=detect_response)
             
             if not detect_response['FaceDetails']:
-                print("No faces detected in the image")
+                log.warning("No faces detected in the image")
                 return {
                     'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
+                    'headers': JSON_HEADERS,
                     'body': json.dumps({
                         'success': False,
                         'error': 'No face detected in the uploaded image. Please ensure your face is clearly visible and well-lit.'
                     })
                 }
             
+            # Search the gallery first so the same person is not indexed twice
+            duplicate = None
+            if DUPLICATE_POLICY != 'off':
+                duplicate = find_duplicate(rekognition, shard, image_source)
+            if duplicate:
+                existing_face_id = duplicate['Face'].get('ExternalImageId')
+                similarity = duplicate['Similarity']
+                log.info("Duplicate person detected", existingFaceId=existing_face_id,
+                         similarity=similarity, policy=DUPLICATE_POLICY)
+                if DUPLICATE_POLICY == 'attach' and existing_face_id:
+                    storage.metadata_table.update_item(
+                        Key={'faceId': existing_face_id},
+                        UpdateExpression='SET additionalImages = list_append(if_not_exists(additionalImages, :empty), :image), '
+                                         'version = :version',
+                        ExpressionAttributeValues={':empty': [], ':image': [s3_key], ':version': new_version()}
+                    )
+                    return {
+                        'statusCode': 200,
+                        'headers': JSON_HEADERS,
+                        'body': json.dumps({
+                            'success': True,
+                            'faceId': existing_face_id,
+                            'rekognitionFaceId': duplicate['Face']['FaceId'],
+                            's3Key': s3_key,
+                            'bucketName': bucket_name,
+                            'status': 'attached',
+                            'similarity': similarity,
+                            'message': 'This person is already registered. The image was added to their record.'
+                        })
+                    }
+                if uploaded:
+                    # Nothing references the image this request just stored
+                    s3_client.delete_object(Bucket=bucket_name, Key=s3_key)
+                    forget(s3_key)
+                else:
+                    # Uploaded by the browser (or already stored): keep it
+                    # only if a registration references it, as
+                    # faces/sha256/ has no lifecycle rule
+                    delete_image_if_unreferenced(storage.metadata_table, s3_client, bucket_name, s3_key)
+                return {
+                    'statusCode': 409,
+                    'headers': JSON_HEADERS,
+                    'body': json.dumps({
+                        'success': False,
+                        'existingFaceId': existing_face_id,
+                        'similarity': similarity,
+                        'error': 'This person is already registered.'
+                    })
+                }
+
             # If faces are detected, proceed with indexing
-            index_response = rekognition.index_faces(
-                CollectionId=collection_id,
-                Image={'S3Object': {'Bucket': bucket_name, 'Name': s3_key}},
-                ExternalImageId=face_id,
-                MaxFaces=1,
-                QualityFilter='AUTO',
-                DetectionAttributes=['ALL']
-            )
+            index_request = {
+                'CollectionId': collection_id,
+                'Image': {'S3Object': {'Bucket': bucket_name, 'Name': s3_key}},
+                'ExternalImageId': face_id,
+                'MaxFaces': 1,
+                'QualityFilter': 'AUTO',
+                'DetectionAttributes': ['ALL']
+            }
+            try:
+                index_response = rekognition.index_faces(**index_request)
+            except rekognition.exceptions.InvalidS3ObjectException:
+                if image_bytes is None:
+                    raise
+                # The upload was skipped on a cached key whose object another
+                # process has deleted since (remove-faces.py, dedup-faces.py)
+                log.warning("Cached image missing from S3, uploading again", s3Key=s3_key)
+                restore_image(s3_client, bucket_name, image_bytes)
+                index_response = rekognition.index_faces(**index_request)
             
-            print(f"Index response: {json.dumps(index_response, default=str)}")
+            log.info("Index response", faceRecords=len(index_response['FaceRecords']))
+            log.debug("Index response detail", response=index_response)
             
             if index_response['FaceRecords']:
                 rekognition_face_id = index_response['FaceRecords'][0]['Face']['FaceId']
                 indexing_success = True
-                print(f"Face indexed successfully. Rekognition Face ID: {rekognition_face_id}")
+                log.info("Face indexed successfully", rekognitionFaceId=rekognition_face_id)
             else:
-                print("No face records returned from indexing")
+                log.warning("No face records returned from indexing")
                 return {
                     'statusCode': 400,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
+                    'headers': JSON_HEADERS,
                     'body': json.dumps({
                         'success': False,
                         'error': 'Failed to index face. Please try with a clearer image.'
                     })
                 }
                 
+        except RekognitionThrottled as throttled:
+            log.warning("Rekognition throttled", error=str(throttled), governor=governor_metrics())
+            return {
+                'statusCode': 503,
+                'headers': dict(JSON_HEADERS, **{'Retry-After': '1'}),
+                'body': json.dumps({
+                    'success': False,
+                    'retry': True,
+                    'error': 'Face recognition is busy, please try again in a moment'
+                })
+            }
         except Exception as rekognition_error:
-            print(f"Rekognition error: {str(rekognition_error)}")
+            log.error("Rekognition error", error=str(rekognition_error))
             return {
                 'statusCode': 500,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
+                'headers': JSON_HEADERS,
                 'body': json.dumps({
                     'success': False,
                     'error': f'Rekognition error: {str(rekognition_error)}'
@@ -134,8 +296,8 @@ def lambda_handler(event, context):
             }
         
         # Store metadata in DynamoDB
-        print("Storing metadata in DynamoDB...")
-        table = dynamodb.Table('face-metadata')
+        log.debug("Storing metadata in DynamoDB...")
+        table = storage.metadata_table
         
         # Determine status based on indexing success
         status = 'indexed' if indexing_success else 'failed_indexing'
@@ -149,39 +311,35 @@ def lambda_handler(event, context):
             'dateOfBirth': date_of_birth,
             'phoneNumber': phone_number,
             's3Key': s3_key,
+            'galleryShard': shard,
             'createdAt': datetime.utcnow().isoformat(),
-            'status': status
+            'status': status,
+            'version': new_version(),
+            **search_keys(first_name, last_name, phone_number)  # admin lookup indexes
         })
         
-        print(f"Metadata stored with status: {status}")
+        log.info("Metadata stored", faceId=face_id, status=status)
         
         return {
             'statusCode': 200,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Headers': 'Content-Type',
-                'Access-Control-Allow-Methods': 'POST, OPTIONS'
-            },
+            'headers': JSON_HEADERS,
             'body': json.dumps({
                 'success': True,
                 'faceId': face_id,
                 'rekognitionFaceId': rekognition_face_id,
                 's3Key': s3_key,
                 'bucketName': bucket_name,
+                'galleryShard': shard,
                 'status': status,
                 'message': f'Face registered successfully. Status: {status}'
             })
         }
         
     except Exception as e:
-        print(f"Unexpected error: {str(e)}")
+        log.error("Unexpected error", error=str(e))
         return {
             'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
+            'headers': JSON_HEADERS,
             'body': json.dumps({
                 'success': False,
                 'error': f'Registration failed: {str(e)}'
@@ -0,0 +1,85 @@
+import base64
+import json
+import os
+import uuid
+import boto3
+from botocore.config import Config
+from image_store import UPLOAD_PREFIX, content_key_for_digest, object_exists
+from json_response import lambda_response as response_json
+from log_utils import get_logger, summarize_event
+
+log = get_logger("upload-url")
+
+# Presigned URLs must be SigV4 and regional for browser PUTs to succeed.
+# The bucket needs a CORS rule allowing PUT from the site, and a lifecycle
+# rule expiring uploads/ (transient verify frames).
+BUCKET_NAME = os.environ.get("BUCKET_NAME", "facial-recognition-data-bucket")
+UPLOAD_URL_EXPIRES = int(os.environ.get("UPLOAD_URL_EXPIRES", "300"))
+# A verify burst gets all its URLs from one call (keep in line with BURST_MAX_FRAMES)
+UPLOAD_MAX_FRAMES = int(os.environ.get("UPLOAD_MAX_FRAMES", "5"))
+s3 = boto3.client("s3", region_name="us-east-1", config=Config(signature_version="s3v4"))
+
+
+def upload_for(key, params, headers):
+    """Presigning is local (no AWS call), so issuing several URLs is cheap"""
+    return {
+        "s3Key": key,
+        "uploadUrl": s3.generate_presigned_url("put_object", Params=params, ExpiresIn=UPLOAD_URL_EXPIRES),
+        "headers": headers
+    }
+
+
+def lambda_handler(event, context):
+    """
+    Issue a presigned S3 PUT URL so the browser uploads the image directly.
+
+    register: the client sends the SHA-256 of the image (hex) and gets the
+    content-addressed key; if that object already exists no upload is needed.
+    S3 verifies the uploaded bytes against the checksum, so a client cannot
+    store other content under a hash key.
+    verify: the client gets one-off keys under uploads/verify/, "count" of
+    them (default 1) so a whole burst needs a single round trip; they are
+    listed in "uploads", and the first is also returned at the top level.
+    """
+    try:
+        log.begin(context)
+        log.info("Incoming event", event=summarize_event(event))
+
+        body = event.get("body", "{}")
+        data = json.loads(body) if isinstance(body, str) else (body or {})
+        purpose = data.get("purpose", "verify")
+
+        if purpose == "register":
+            digest = str(data.get("sha256", "")).lower()
+            if len(digest) != 64 or any(c not in "0123456789abcdef" for c in digest):
+                return response_json(400, {"success": False, "error": "A hex SHA-256 of the image is required"})
+            key = content_key_for_digest(digest)
+            if object_exists(s3, BUCKET_NAME, key):
+                log.info("Image already stored", s3Key=key)
+                return response_json(200, {"success": True, "s3Key": key, "exists": True})
+            checksum = base64.b64encode(bytes.fromhex(digest)).decode()
+            params = {"Bucket": BUCKET_NAME, "Key": key, "ContentType": "image/jpeg", "ChecksumSHA256": checksum}
+            headers = {"Content-Type": "image/jpeg", "x-amz-checksum-sha256": checksum}
+            uploads = [upload_for(key, params, headers)]
+        elif purpose == "verify":
+            count = data.get("count", 1)
+            if not isinstance(count, int) or not 1 <= count <= UPLOAD_MAX_FRAMES:
+                return response_json(400, {"success": False,
+                                           "error": f"count must be between 1 and {UPLOAD_MAX_FRAMES}"})
+            headers = {"Content-Type": "image/jpeg"}
+            uploads = []
+            for _ in range(count):
+                key = f"{UPLOAD_PREFIX}verify/{uuid.uuid4()}.jpg"
+                uploads.append(upload_for(key, {"Bucket": BUCKET_NAME, "Key": key, "ContentType": "image/jpeg"},
+                                          headers))
+        else:
+            return response_json(400, {"success": False, "error": "Invalid purpose specified"})
+
+        log.info("Issued upload URLs", purpose=purpose, count=len(uploads))
+        return response_json(200, dict(uploads[0], success=True, exists=False, uploads=uploads,
+                                       expiresIn=UPLOAD_URL_EXPIRES))
+
+    except Exception as e:
+        log.error("Error issuing upload URL", error=str(e))
+        return response_json(500, {"success": False, "error": str(e)})
+
@@ -1,15 +1,92 @@
 import json
 import boto3
-import base64
 import os
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from gallery import is_known_shard, search_gallery
+from image_store import is_client_key, read_image
+from image_utils import (REJECTION_MESSAGES, check_image_quality, decode_image_data,
+                         quality_counters, quality_gate_active, rank_frames,
+                         record_quality_checks)
+from log_utils import get_logger, summarize_event
+from rekognition_governor import RekognitionThrottled, governed, governor_metrics
+from storage import AWS_REGION, AWSStorage
 
-rekognition = boto3.client("rekognition")
-dynamodb = boto3.resource("dynamodb")
-TABLE_NAME = "face-metadata"   # <-- your DynamoDB table
+log = get_logger("verify")
+
+# Region, bucket and table names come from AWS_REGION / BUCKET_NAME / METADATA_TABLE
+rekognition = governed(boto3.client("rekognition", region_name=AWS_REGION))  # rate limited, coalesced
+storage = AWSStorage()
+
+# Burst verification: frames accepted per request, how many of the best
+# frames may be sent to Rekognition, and the similarity that ends the search
+BURST_MAX_FRAMES = int(os.environ.get("BURST_MAX_FRAMES", "5"))
+BURST_MAX_ATTEMPTS = int(os.environ.get("BURST_MAX_ATTEMPTS", "2"))
+BURST_MIN_SIMILARITY = float(os.environ.get("BURST_MIN_SIMILARITY", "90"))
+
+_frame_pool = ThreadPoolExecutor(max_workers=BURST_MAX_FRAMES, thread_name_prefix="verify-frame")
+
+
+def read_frame(key):
+    """Bytes of an uploaded burst frame, or None if the upload never arrived"""
+    try:
+        return read_image(storage.s3, storage.bucket_name, key)
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+            raise
+        log.warning("Burst frame missing from S3", key=key)
+        return None
+
+
+def search_burst(frames, shard, rank=True):
+    """
+    Rank a burst of frames locally (when the quality gate is active;
+    otherwise they are tried in the order sent), then search Rekognition
+    with the best frame, falling back to the next-best while the match is missing or below
+    BURST_MIN_SIMILARITY. Returns (best face match or None, burst summary).
+    With rank=False frames are Rekognition S3Object images, searched in
+    the order sent without downloading them.
+    """
+    rank = rank and quality_gate_active()
+    if rank:
+        ranked, rejections = rank_frames(frames)
+    else:
+        ranked, rejections = [(None, index, {}) for index in range(len(frames))], {}
+    summary = {"framesReceived": len(frames), "framesRejected": len(rejections), "attempts": 0}
+    if not ranked:
+        record_quality_checks(len(frames), len(rejections), len(frames))
+        summary["reason"] = rejections[0]
+        return None, summary
+
+    best_match = None
+    for score, index, metrics in ranked[:BURST_MAX_ATTEMPTS]:
+        summary["attempts"] += 1
+        try:
+            response = search_gallery(rekognition, frames[index], home_shard=shard)
+        except rekognition.exceptions.InvalidParameterException:
+            # No face found in this frame; try the next-best one
+            log.info("No face in burst frame", frame=index, score=score)
+            continue
+        except rekognition.exceptions.InvalidS3ObjectException:
+            # The kiosk's upload of this frame never arrived
+            log.warning("Burst frame missing from S3", frame=index)
+            continue
+        matches = response.get("FaceMatches", [])
+        log.info("✅ Rekognition response", frame=index, score=score, matches=len(matches))
+        if matches and (best_match is None or matches[0]["Similarity"] > best_match["Similarity"]):
+            best_match = matches[0]
+            summary["frameUsed"] = index
+        if best_match and best_match["Similarity"] >= BURST_MIN_SIMILARITY:
+            break
+
+    if rank:
+        record_quality_checks(len(frames), len(rejections), len(frames) - summary["attempts"])
+    return best_match, summary
 
 def lambda_handler(event, context):
     try:
-        print("🔍 Incoming event:", json.dumps(event))
+        log.begin(context)
+        log.info("🔍 Incoming event", event=summarize_event(event))
 
         # Parse body (API Gateway proxy integration sends JSON string)
         if "body" in event:
@@ -19,8 +96,22 @@ def lambda_handler(event, context):
         else:
             body = event
 
-        # Validate input
-        if "image" not in body or not body["image"]:
+        # Validate input: a single "image" or a burst of "images", or the S3
+        # keys of frames the kiosk uploaded directly ("s3Key" / "s3Keys")
+        keys = body.get("s3Keys") or ([body["s3Key"]] if body.get("s3Key") else [])
+        if not all(is_client_key(key) for key in keys):
+            return {
+                "statusCode": 400,
+                "headers": {
+                    "Content-Type": "application/json",
+                    "Access-Control-Allow-Origin": "*"
+                },
+                "body": json.dumps({
+                    "success": False,
+                    "message": "Invalid image key"
+                })
+            }
+        if not body.get("image") and not body.get("images") and not keys:
             return {
                 "statusCode": 400,
                 "headers": {
@@ -33,23 +124,88 @@ def lambda_handler(event, context):
                 })
             }
 
-        # Extract base64 image data (strip "data:image/jpeg;base64," if present)
-        image_data = body["image"]
-        if "," in image_data:
-            image_data = image_data.split(",")[1]
-        image_bytes = base64.b64decode(image_data)
-
-        # Search for face in Rekognition
-        response = rekognition.search_faces_by_image(
-            CollectionId="face-collection",
-            Image={"Bytes": image_bytes},
-            MaxFaces=1,
-            FaceMatchThreshold=80
-        )
+        # Gallery shard of the kiosk ('' searches the base collection first)
+        shard = body.get("shard", "")
+        if not isinstance(shard, str) or not is_known_shard(shard):
+            return {
+                "statusCode": 400,
+                "headers": {
+                    "Content-Type": "application/json",
+                    "Access-Control-Allow-Origin": "*"
+                },
+                "body": json.dumps({
+                    "success": False,
+                    "message": "Unknown gallery shard"
+                })
+            }
+
+        burst = None
+        if keys and not quality_gate_active():
+            # Directly uploaded frames: without the quality gate there is
+            # nothing to rank, so Rekognition reads them from S3 and they
+            # are never downloaded here
+            frames = [{"S3Object": {"Bucket": storage.bucket_name, "Name": key}} for key in keys[:BURST_MAX_FRAMES]]
+            face_match, burst = search_burst(frames, shard, rank=False)
+        elif keys or body.get("images"):
+            # Score the burst locally and recognise only the best frame(s).
+            # Uploaded frames are fetched concurrently (in-region GETs, against
+            # the searches that ranking saves); missing uploads are skipped
+            if keys:
+                frames = [frame for frame in _frame_pool.map(read_frame, keys[:BURST_MAX_FRAMES]) if frame is not None]
+            else:
+                frames = [decode_image_data(image) for image in body["images"][:BURST_MAX_FRAMES]]
+            if frames:
+                face_match, burst = search_burst(frames, shard)
+            else:
+                face_match, burst = None, {"framesReceived": 0, "framesRejected": 0, "attempts": 0}
+            if burst.get("reason"):
+                return {
+                    "statusCode": 400,
+                    "headers": {
+                        "Content-Type": "application/json",
+                        "Access-Control-Allow-Origin": "*"
+                    },
+                    "body": json.dumps({
+                        "success": False,
+                        "match": False,
+                        "confidence": 0,
+                        "reason": burst["reason"],
+                        "message": REJECTION_MESSAGES[burst["reason"]],
+                        "burst": burst
+                    })
+                }
+        else:
+            # Extract base64 image data (strip "data:image/jpeg;base64," if present)
+            image_bytes = decode_image_data(body["image"])
 
-        print("✅ Rekognition response:", response)
+            # Reject unusable frames locally so the kiosk can recapture at once
+            rejection = check_image_quality(image_bytes, saved_calls=1)
+            if rejection:
+                log.info("Image rejected by quality gate", reason=rejection["reason"],
+                         metrics=rejection["metrics"], counters=quality_counters())
+                return {
+                    "statusCode": 400,
+                    "headers": {
+                        "Content-Type": "application/json",
+                        "Access-Control-Allow-Origin": "*"
+                    },
+                    "body": json.dumps({
+                        "success": False,
+                        "match": False,
+                        "confidence": 0,
+                        "reason": rejection["reason"],
+                        "message": rejection["message"]
+                    })
+                }
 
-        if not response.get("FaceMatches"):
+            # Search for face in Rekognition (kiosk's home shard first)
+            response = search_gallery(rekognition, image_bytes, home_shard=shard)
+
+            log.info("✅ Rekognition response", matches=len(response.get("FaceMatches", [])))
+            log.debug("Rekognition response detail", response=response)
+            face_match = response["FaceMatches"][0] if response.get("FaceMatches") else None
+
+        if not face_match:
             return {
                 "statusCode": 200,
                 "headers": {
@@ -60,23 +216,24 @@ def lambda_handler(event, context):
                     "success": True,
                     "match": False,
                     "confidence": 0,
-                    "message": "No matching face found"
+                    "message": "No matching face found",
+                    "burst": burst
                 })
             }
 
+        log.info("Rekognition governor", governor=governor_metrics())
+
         # Extract match details
-        face_match = response["FaceMatches"][0]
         rekognition_face_id = face_match["Face"]["FaceId"]
         confidence = face_match["Similarity"]
 
         # Lookup DynamoDB using rekognitionFaceId (not faceId PK directly)
-        table = dynamodb.Table(TABLE_NAME)
-        db_response = table.scan(
+        db_response = storage.metadata_table.scan(
             FilterExpression="rekognitionFaceId = :r",
             ExpressionAttributeValues={":r": rekognition_face_id}
         )
 
-        print("✅ DynamoDB response:", db_response)
+        log.info("✅ DynamoDB response", items=len(db_response.get("Items", [])))
 
         if db_response.get("Items"):
             person = db_response["Items"][0]
@@ -91,6 +248,7 @@ def lambda_handler(event, context):
                     "match": True,
                     "confidence": confidence,
                     "faceId": person.get("faceId"),
+                    "burst": burst,
                     "person": {
                         "firstName": person.get("firstName", "Unknown"),
                         "lastName": person.get("lastName", "Unknown"),
@@ -114,8 +272,24 @@ def lambda_handler(event, context):
                 })
             }
 
+    except RekognitionThrottled as e:
+        # Still throttled after backing off: ask the kiosk to retry shortly
+        log.warning("Rekognition throttled", error=str(e), governor=governor_metrics())
+        return {
+            "statusCode": 503,
+            "headers": {
+                "Content-Type": "application/json",
+                "Access-Control-Allow-Origin": "*",
+                "Retry-After": "1"
+            },
+            "body": json.dumps({
+                "success": False,
+                "retry": True,
+                "message": "Face recognition is busy, please try again in a moment"
+            })
+        }
     except Exception as e:
-        print("❌ Error:", str(e))
+        log.error("❌ Error", error=str(e))
         return {
             "statusCode": 500,
             "headers": {
@@ -0,0 +1,505 @@
+"""
+In-memory stand-ins for the S3, DynamoDB and Rekognition calls this project
+makes, for load generation and benchmarks that must run without a network.
+
+    fake = aws_fakes.install(latency_ms={"rekognition": 80, "s3": 20, "dynamodb": 8})
+    import app  # boto3.client / boto3.resource now return the fakes
+
+The optional "rekognition_per_1k_faces" latency is added to searches for
+every 1000 faces in the searched collection, to model gallery-size cost.
+
+Fake Rekognition cannot see faces, so synthetic images carry their identity
+in a marker: make_image("alice") appends b"FACE:alice;" after the JPEG data
+and any image without a marker is treated as containing no face.
+"""
+import io
+import os
+import re
+import threading
+import time
+import uuid
+
+import boto3
+from botocore.exceptions import ClientError
+
+try:
+    from PIL import Image, ImageFilter
+except ImportError:
+    Image = None
+
+FACE_MARKER = re.compile(rb"FACE:([A-Za-z0-9_\-]+);")
+JPEG_HEADER = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00"
+
+
+def make_image(person=None, kind="sharp", width=320, height=240):
+    """
+    Synthetic kiosk frame; person=None gives a faceless frame. kind is one of
+    "sharp", "blurry" or "dark" so the local quality gate sees realistic input.
+    """
+    marker = f"FACE:{person};".encode() if person else b""
+    if Image is None:
+        return JPEG_HEADER + os.urandom(width * height // 16) + marker
+    image = Image.frombytes("L", (width, height), os.urandom(width * height)).convert("RGB")
+    if kind == "blurry":
+        image = image.filter(ImageFilter.GaussianBlur(6))
+    elif kind == "dark":
+        image = image.point(lambda value: value // 8)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=80)
+    return buffer.getvalue() + marker
+
+
+def client_error(code, operation, status=400):
+    return ClientError({"Error": {"Code": code, "Message": code},
+                        "ResponseMetadata": {"HTTPStatusCode": status}}, operation)
+
+
+class FakeService:
+    def __init__(self, aws, name):
+        self.aws = aws
+        self.name = name
+        self.lock = threading.Lock()
+
+    def call(self, operation, extra_ms=0):
+        """Count the call and sleep for the configured service latency"""
+        self.aws.record(self.name, operation)
+        latency = self.aws.latency_ms.get(self.name, 0) + extra_ms
+        if latency:
+            time.sleep(latency / 1000.0)
+
+
+class FakeS3(FakeService):
+    def __init__(self, aws):
+        super().__init__(aws, "s3")
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.call("PutObject")
+        with self.lock:
+            self.objects[(Bucket, Key)] = bytes(Body)
+        return {"ETag": uuid.uuid4().hex}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self.call("GetObject")
+        body = self.objects.get((Bucket, Key))
+        if body is None:
+            raise client_error("NoSuchKey", "GetObject", 404)
+        return {"Body": _Body(body), "ContentLength": len(body)}
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self.call("HeadObject")
+        body = self.objects.get((Bucket, Key))
+        if body is None:
+            raise client_error("404", "HeadObject", 404)
+        return {"ContentLength": len(body)}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self.call("DeleteObject")
+        with self.lock:
+            self.objects.pop((Bucket, Key), None)
+        return {}
+
+
+class _Body:
+    def __init__(self, data):
+        self.data = data
+
+    def read(self):
+        return self.data
+
+
+class FakeTable(FakeService):
+    def __init__(self, aws, name, key, indexes=None):
+        super().__init__(aws, "dynamodb")
+        self.table_name = name
+        self.key = key
+        self.indexes = indexes or {}
+        self.items = {}
+        self.partition_second = None
+        self.partition_writes = {}
+
+    def _key(self, item):
+        return tuple(item[k] for k in self.key)
+
+    def _index_writes(self, item, operation):
+        """
+        Count the write against each index partition it lands on and throttle
+        once a partition takes more than aws.partition_write_limit writes in
+        one second, as a hot GSI partition throttles the base table, or an
+        index as a whole takes more than aws.index_write_limit (its
+        provisioned WCU, shared by all of its partitions)
+        """
+        limit, index_limit = self.aws.partition_write_limit, self.aws.index_write_limit
+        if not limit and not index_limit:
+            return
+        second = int(time.monotonic())
+        if second != self.partition_second:
+            self.partition_second, self.partition_writes = second, {}
+        indexes = [index for index, (hash_key, _) in self.indexes.items() if hash_key in item]
+        partitions = [(index, item[self.indexes[index][0]]) for index in indexes]
+        if limit and any(self.partition_writes.get(partition, 0) >= limit for partition in partitions):
+            raise client_error("ProvisionedThroughputExceededException", operation)
+        if index_limit and any(self.partition_writes.get(index, 0) >= index_limit for index in indexes):
+            raise client_error("ProvisionedThroughputExceededException", operation)
+        for counter in partitions + indexes:
+            self.partition_writes[counter] = self.partition_writes.get(counter, 0) + 1
+
+    def put_item(self, Item, ConditionExpression=None, **kwargs):
+        self.call("PutItem")
+        with self.lock:
+            self._index_writes(Item, "PutItem")
+            if ConditionExpression is not None and not _condition(ConditionExpression)(
+                    self.items.get(self._key(Item), {})):
+                raise client_error("ConditionalCheckFailedException", "PutItem")
+            self.items[self._key(Item)] = dict(Item)
+        return {}
+
+    def batch_writer(self, **kwargs):
+        return _BatchWriter(self)
+
+    def get_item(self, Key, **kwargs):
+        self.call("GetItem")
+        item = self.items.get(self._key(Key))
+        return {"Item": dict(item)} if item else {}
+
+    def delete_item(self, Key, **kwargs):
+        self.call("DeleteItem")
+        with self.lock:
+            self.items.pop(self._key(Key), None)
+        return {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues=None,
+                    ExpressionAttributeNames=None, **kwargs):
+        self.call("UpdateItem")
+        names = ExpressionAttributeNames or {}
+        values = ExpressionAttributeValues or {}
+        with self.lock:
+            item = self.items.setdefault(self._key(Key), dict(Key))
+            for assignment in UpdateExpression.replace("SET ", "", 1).split(","):
+                name, value = [part.strip() for part in assignment.split("=")]
+                item[names.get(name, name)] = values[value]
+        return {}
+
+    def scan(self, FilterExpression=None, ExpressionAttributeValues=None,
+             ExpressionAttributeNames=None, Limit=None, Segment=None, TotalSegments=None,
+             ExclusiveStartKey=None, ProjectionExpression=None, **kwargs):
+        self.call("Scan")
+        match = _compile_filter(FilterExpression, ExpressionAttributeValues, ExpressionAttributeNames)
+        if Segment is None and ExclusiveStartKey is None and not Limit:
+            # Unpaged scan, as the older code in this repo expects
+            items = [dict(item) for item in list(self.items.values()) if match(item)]
+            return {"Items": items, "Count": len(items), "ScannedCount": len(self.items)}
+
+        candidates = sorted((item for item in list(self.items.values())
+                             if TotalSegments is None or hash(self._key(item)) % TotalSegments == Segment),
+                            key=lambda item: tuple(str(k) for k in self._key(item)))
+        if ExclusiveStartKey:
+            start = tuple(str(k) for k in self._key(ExclusiveStartKey))
+            candidates = [item for item in candidates if tuple(str(k) for k in self._key(item)) > start]
+        page = candidates[:Limit] if Limit else candidates
+        items = [_project(item, ProjectionExpression, ExpressionAttributeNames) for item in page if match(item)]
+        response = {"Items": items, "Count": len(items), "ScannedCount": len(page),
+                    "ConsumedCapacity": {"TableName": self.table_name, "CapacityUnits": len(page) * 0.5}}
+        if Limit and len(candidates) > Limit:
+            response["LastEvaluatedKey"] = {k: page[-1][k] for k in self.key}
+        return response
+
+    def query(self, KeyConditionExpression, IndexName=None, FilterExpression=None,
+              ExpressionAttributeValues=None, ExpressionAttributeNames=None, Limit=None,
+              ExclusiveStartKey=None, ScanIndexForward=True, **kwargs):
+        self.call("Query")
+        hash_key, range_key = self.indexes[IndexName] if IndexName else (self.key + (None,))[:2]
+        in_key = _compile_filter(KeyConditionExpression, ExpressionAttributeValues, ExpressionAttributeNames)
+        match = _compile_filter(FilterExpression, ExpressionAttributeValues, ExpressionAttributeNames)
+        candidates = sorted((item for item in list(self.items.values()) if hash_key in item and in_key(item)),
+                            key=lambda item: (str(item.get(range_key, "")), self._key(item)),
+                            reverse=not ScanIndexForward)
+        if ExclusiveStartKey:
+            start = self._key(ExclusiveStartKey)
+            position = next((i for i, item in enumerate(candidates) if self._key(item) == start), -1)
+            candidates = candidates[position + 1:]
+        page = candidates[:Limit] if Limit else candidates
+        items = [dict(item) for item in page if match(item)]
+        response = {"Items": items, "Count": len(items), "ScannedCount": len(page)}
+        if Limit and len(candidates) > Limit:
+            response["LastEvaluatedKey"] = {k: page[-1][k] for k in self.key}
+        return response
+
+
+class _BatchWriter:
+    def __init__(self, table):
+        self.table = table
+        self.items = []
+
+    def __enter__(self):
+        return self
+
+    def put_item(self, Item):
+        self.items.append(Item)
+
+    def __exit__(self, *exc):
+        for start in range(0, len(self.items), 25):
+            self.table.call("BatchWriteItem")
+            with self.table.lock:
+                for item in self.items[start:start + 25]:
+                    self.table.items[self.table._key(item)] = dict(item)
+        return False
+
+
+def _project(item, projection, names):
+    if not projection:
+        return dict(item)
+    names = names or {}
+    fields = [names.get(field.strip(), field.strip()) for field in projection.split(",")]
+    return {field: item[field] for field in fields if field in item}
+
+
+# boto3.dynamodb.conditions operators understood by the fakes
+_OPERATORS = {
+    "=": lambda a, b: a == b,
+    "<>": lambda a, b: a != b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+    "begins_with": lambda a, b: isinstance(a, str) and a.startswith(b),
+    "contains": lambda a, b: a is not None and b in a,
+}
+
+
+def _condition(condition):
+    """Evaluator for a boto3 Key()/Attr() condition object"""
+    expression = condition.get_expression()
+    operator, operands = expression["operator"], expression["values"]
+    if operator in ("AND", "OR"):
+        left, right = _condition(operands[0]), _condition(operands[1])
+        if operator == "AND":
+            return lambda item: left(item) and right(item)
+        return lambda item: left(item) or right(item)
+    if operator == "NOT":
+        inner = _condition(operands[0])
+        return lambda item: not inner(item)
+    name = operands[0].name
+    if operator == "attribute_exists":
+        return lambda item: name in item
+    if operator == "attribute_not_exists":
+        return lambda item: name not in item
+    if operator == "BETWEEN":
+        low, high = operands[1], operands[2]
+        return lambda item: item.get(name) is not None and low <= item[name] <= high
+    if operator == "IN":
+        choices = operands[1]
+        return lambda item: item.get(name) in choices
+    compare, value = _OPERATORS[operator], operands[1]
+    return lambda item: compare(item.get(name), value)
+
+
+def _compile_filter(expression, values, names):
+    """
+    Support boto3 condition objects and the `a = :v AND #b = :w` string
+    filters used in this repo
+    """
+    if not expression:
+        return lambda item: True
+    if not isinstance(expression, str):
+        return _condition(expression)
+    values = values or {}
+    names = dict(names or {})
+    # app.py historically passed #type inside ExpressionAttributeValues
+    names.update({k: v for k, v in values.items() if k.startswith("#")})
+    clauses = []
+    for clause in expression.split(" AND "):
+        name, placeholder = [part.strip() for part in clause.split("=")]
+        clauses.append((names.get(name, name), values[placeholder]))
+    return lambda item: all(item.get(name) == value for name, value in clauses)
+
+
+class FakeDynamoDB:
+    KEYS = {"face-metadata": ("faceId",), "attendance-records": ("attendanceId",),
+            "idempotency-keys": ("idempotencyKey",), "attendance-state": ("faceId",)}
+    BATCH_GET_PROCESSED = 60  # keys served per BatchGetItem table request
+    # index name -> (hash key, range key)
+    INDEXES = {
+        "face-metadata": {
+            "nameKey-index": ("nameKey", None),
+            "phoneKey-index": ("phoneKey", None),
+            "s3Key-index": ("s3Key", None),
+        },
+        "attendance-records": {
+            "faceId-index": ("faceId", "timestamp"),
+            "date-index": ("date", "timestamp"),
+            "dateShard-index": ("dateShard", "timestamp"),
+        },
+    }
+
+    def __init__(self, aws):
+        self.aws = aws
+        self.tables = {}
+        self.lock = threading.Lock()
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        responses, unprocessed = {}, {}
+        for name, request in RequestItems.items():
+            table = self.Table(name)
+            if len(request["Keys"]) > 100:
+                raise client_error("ValidationException", "BatchGetItem")
+            table.call("BatchGetItem")
+            # Like DynamoDB under load, hand back part of a large batch unprocessed
+            processed, rest = request["Keys"][:self.BATCH_GET_PROCESSED], request["Keys"][self.BATCH_GET_PROCESSED:]
+            responses[name] = [dict(table.items[table._key(key)]) for key in processed
+                               if table._key(key) in table.items]
+            if rest:
+                unprocessed[name] = {"Keys": rest}
+        return {"Responses": responses, "UnprocessedKeys": unprocessed}
+
+    def Table(self, name):
+        with self.lock:
+            if name not in self.tables:
+                self.tables[name] = FakeTable(self.aws, name, self.KEYS.get(name, ("id",)),
+                                              dict(self.INDEXES.get(name, {})))
+            return self.tables[name]
+
+
+class FakeRekognition(FakeService):
+    class exceptions:
+        class ResourceNotFoundException(Exception):
+            pass
+
+        class InvalidParameterException(Exception):
+            pass
+
+        class InvalidS3ObjectException(Exception):
+            pass
+
+    def __init__(self, aws):
+        super().__init__(aws, "rekognition")
+        self.collections = {}
+
+    def _image_bytes(self, Image):
+        if "Bytes" in Image:
+            return Image["Bytes"]
+        obj = Image["S3Object"]
+        if (obj["Bucket"], obj["Name"]) not in self.aws.s3.objects:
+            raise self.exceptions.InvalidS3ObjectException("Unable to get object metadata from S3")
+        return self.aws.s3.objects[(obj["Bucket"], obj["Name"])]
+
+    def _person(self, Image):
+        found = FACE_MARKER.search(self._image_bytes(Image))
+        return found.group(1).decode() if found else None
+
+    def _collection(self, CollectionId):
+        if CollectionId not in self.collections:
+            raise self.exceptions.ResourceNotFoundException(CollectionId)
+        return self.collections[CollectionId]
+
+    def describe_collection(self, CollectionId):
+        self.call("DescribeCollection")
+        return {"FaceCount": len(self._collection(CollectionId))}
+
+    def create_collection(self, CollectionId):
+        self.call("CreateCollection")
+        with self.lock:
+            self.collections.setdefault(CollectionId, {})
+        return {"StatusCode": 200}
+
+    def delete_collection(self, CollectionId):
+        self.call("DeleteCollection")
+        with self.lock:
+            self.collections.pop(CollectionId, None)
+        return {"StatusCode": 200}
+
+    def detect_faces(self, Image, Attributes=None):
+        self.call("DetectFaces")
+        person = self._person(Image)
+        details = [{"BoundingBox": {"Width": 0.4, "Height": 0.5, "Left": 0.3, "Top": 0.2},
+                    "Confidence": 99.9}] if person else []
+        return {"FaceDetails": details}
+
+    def index_faces(self, CollectionId, Image, ExternalImageId=None, **kwargs):
+        self.call("IndexFaces")
+        person = self._person(Image)
+        if not person:
+            return {"FaceRecords": [], "UnindexedFaces": []}
+        face = {"FaceId": str(uuid.uuid4()), "ExternalImageId": ExternalImageId, "Confidence": 99.9,
+                "person": person}
+        with self.lock:
+            self._collection(CollectionId)[face["FaceId"]] = face
+        return {"FaceRecords": [{"Face": {k: v for k, v in face.items() if k != "person"}}]}
+
+    def search_faces_by_image(self, CollectionId, Image, MaxFaces=1, FaceMatchThreshold=80, **kwargs):
+        size = len(self._collection(CollectionId))
+        self.call("SearchFacesByImage", self.aws.latency_ms.get("rekognition_per_1k_faces", 0) * size / 1000.0)
+        person = self._person(Image)
+        if not person:
+            raise self.exceptions.InvalidParameterException("There are no faces in the image")
+        matches = [
+            {"Similarity": 99.5, "Face": {k: v for k, v in face.items() if k != "person"}}
+            for face in list(self._collection(CollectionId).values()) if face["person"] == person
+        ]
+        return {"FaceMatches": matches[:MaxFaces]}
+
+    def search_faces(self, CollectionId, FaceId, MaxFaces=1, FaceMatchThreshold=80, **kwargs):
+        self.call("SearchFaces")
+        faces = self._collection(CollectionId)
+        person = faces[FaceId]["person"]
+        matches = [
+            {"Similarity": 99.5, "Face": {k: v for k, v in face.items() if k != "person"}}
+            for face in list(faces.values()) if face["person"] == person and face["FaceId"] != FaceId
+        ]
+        return {"FaceMatches": matches[:MaxFaces]}
+
+    def list_faces(self, CollectionId, **kwargs):
+        self.call("ListFaces")
+        return {"Faces": [{k: v for k, v in face.items() if k != "person"}
+                          for face in self._collection(CollectionId).values()]}
+
+    def delete_faces(self, CollectionId, FaceIds):
+        self.call("DeleteFaces")
+        with self.lock:
+            for face_id in FaceIds:
+                self._collection(CollectionId).pop(face_id, None)
+        return {"DeletedFaces": FaceIds}
+
+
+class FakeAWS:
+    def __init__(self, latency_ms=None, partition_write_limit=None, index_write_limit=None):
+        self.latency_ms = dict(latency_ms or {})
+        self.partition_write_limit = partition_write_limit  # writes/s per index partition, None = unlimited
+        self.index_write_limit = index_write_limit  # writes/s per index (provisioned WCU), None = on-demand
+        self.calls = {}
+        self.lock = threading.Lock()
+        self.s3 = FakeS3(self)
+        self.dynamodb = FakeDynamoDB(self)
+        self.rekognition = FakeRekognition(self)
+
+    def record(self, service, operation):
+        with self.lock:
+            key = f"{service}:{operation}"
+            self.calls[key] = self.calls.get(key, 0) + 1
+
+    def client(self, service_name, *args, **kwargs):
+        return {"s3": self.s3, "rekognition": self.rekognition}[service_name]
+
+    def resource(self, service_name, *args, **kwargs):
+        if service_name != "dynamodb":
+            raise ValueError(f"No fake resource for {service_name}")
+        return self.dynamodb
+
+
+_originals = {}
+
+
+def install(latency_ms=None, partition_write_limit=None, index_write_limit=None):
+    """Route boto3.client / boto3.resource to a fresh FakeAWS and return it"""
+    fake = FakeAWS(latency_ms, partition_write_limit, index_write_limit)
+    if not _originals:
+        _originals.update(client=boto3.client, resource=boto3.resource)
+    boto3.client = fake.client
+    boto3.resource = fake.resource
+    return fake
+
+
+def uninstall():
+    if _originals:
+        boto3.client = _originals["client"]
+        boto3.resource = _originals["resource"]
@@ -0,0 +1,141 @@
+"""
+Load test: a shift-change burst of attendance writes for one day, unsharded
+versus a sharded date index
+
+Writers call AWSStorage.put_attendance as fast as they can against the
+in-memory fake DynamoDB, which throttles any index partition taking more
+than --partition-limit writes per second (a scaled-down stand-in for a GSI
+partition's write ceiling). With one shard every write of the day lands on
+the same date-index partition; with N shards they spread over N partitions
+of dateShard-index. Throttled writes are retried with backoff, as the SDK
+would. After each run the day is read back (all shards queried in parallel)
+and checked against the number of writes.
+
+The table is on-demand by default, as create-attendance-table.py creates
+it, so only the partition limit applies. --index-wcu models a provisioned
+table instead: each index then also throttles above that many writes per
+second in total, whatever the shard count, which is the ceiling that
+sharding cannot lift. The fake has no network latency, so the absolute
+rates are those of the fake; compare the runs with each other.
+
+Usage:
+    python benchmarks/attendance_shard_load.py --shards 0 8 --writers 32 --duration 5
+    python benchmarks/attendance_shard_load.py --shards 0 8 --index-wcu 5
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import aws_fakes
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))]
+
+
+def run(shards, args):
+    fake = aws_fakes.install(partition_write_limit=args.partition_limit, index_write_limit=args.index_wcu)
+    from storage import ATTENDANCE_DATE_INDEX, ATTENDANCE_SHARD_INDEX, AWSStorage
+    storage = AWSStorage(date_shards=shards)
+    # The table as it is before / after migrate-attendance-date-shards.py
+    # --drop-date-index: only one of the two date indexes exists
+    storage.attendance_table.indexes.pop(ATTENDANCE_SHARD_INDEX if shards == 0 else ATTENDANCE_DATE_INDEX)
+    date = datetime.utcnow().date().isoformat()
+    stop = threading.Event()
+    lock = threading.Lock()
+    latencies, throttles = [], [0]
+
+    def writer(seed):
+        rng = random.Random(seed)
+        while not stop.is_set():
+            face_id = f"face-{rng.randrange(args.people)}"
+            timestamp = datetime.utcnow().isoformat()
+            record = {
+                "attendanceId": f"att_{uuid.uuid4().hex}_{face_id}",
+                "faceId": face_id,
+                "type": rng.choice(["checkin", "checkout"]),
+                "timestamp": timestamp,
+                "date": date,
+                "time": timestamp.split("T")[1].split(".")[0]
+            }
+            started = time.perf_counter()
+            for attempt in range(args.retries + 1):
+                try:
+                    storage.put_attendance(record)
+                    break
+                except Exception as e:
+                    if "ProvisionedThroughputExceeded" not in str(e):
+                        raise
+                    with lock:
+                        throttles[0] += 1
+                    time.sleep(min(0.025 * 2 ** attempt, 1.0) * rng.random())
+            else:
+                continue  # gave up on this write
+            with lock:
+                latencies.append((time.perf_counter() - started) * 1000)
+
+    threads = [threading.Thread(target=writer, args=(seed,), daemon=True) for seed in range(args.writers)]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    time.sleep(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - started
+
+    read_started = time.perf_counter()
+    records = storage.attendance_for_date(date)
+    read_ms = (time.perf_counter() - read_started) * 1000
+    assert len(records) == len(latencies), f"read {len(records)} records, wrote {len(latencies)}"
+    assert all(a["timestamp"] <= b["timestamp"] for a, b in zip(records, records[1:])), "records out of order"
+
+    latencies.sort()
+    aws_fakes.uninstall()
+    return {
+        "shards": shards,
+        "writesPerSecond": round(len(latencies) / elapsed, 1),
+        "throttled": throttles[0],
+        "p50Ms": round(statistics.median(latencies), 2) if latencies else 0.0,
+        "p99Ms": round(percentile(latencies, 99), 2),
+        "readBackMs": round(read_ms, 1),
+        "records": len(records),
+        "queries": fake.calls.get("dynamodb:Query", 0)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--shards", type=int, nargs="+", default=[0, 8],
+                        help="date shard counts to compare (0 = unsharded date-index)")
+    parser.add_argument("--writers", type=int, default=32)
+    parser.add_argument("--people", type=int, default=2000)
+    parser.add_argument("--duration", type=float, default=5, help="seconds per run")
+    parser.add_argument("--partition-limit", type=int, default=500, help="writes/s one index partition accepts")
+    parser.add_argument("--index-wcu", type=int,
+                        help="provisioned write capacity of each index (default: on-demand, no index-wide limit)")
+    parser.add_argument("--retries", type=int, default=8)
+    args = parser.parse_args()
+
+    capacity = f"provisioned, {args.index_wcu} WCU per index" if args.index_wcu else "on-demand"
+    print(f"Table: {capacity}; {args.partition_limit} writes/s per index partition (in-memory fake)")
+    print(f"{'shards':>6} {'writes/s':>10} {'throttled':>10} {'p50 ms':>8} {'p99 ms':>8} {'read ms':>8}")
+    for shards in args.shards:
+        row = run(shards, args)
+        print(f"{row['shards']:>6} {row['writesPerSecond']:>10} {row['throttled']:>10} "
+              f"{row['p50Ms']:>8} {row['p99Ms']:>8} {row['readBackMs']:>8}")
+
+
+if __name__ == "__main__":
+    main()
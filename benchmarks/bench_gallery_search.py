@@ -0,0 +1,100 @@
+"""
+Benchmark: SearchFacesByImage calls (the billed unit) and modelled latency
+per verify, versus gallery size, with and without sharding
+
+Three cases:
+
+  unsharded     one collection holding the whole gallery
+  home hit      the person is in the kiosk's home shard (gallery / --shards)
+  fan-out miss  the home shard misses; the other shards are searched in parallel
+
+The call counts come from the code under test (gallery.search_gallery) and
+are exact: a fan-out miss costs 1 + (shards) searches, whatever the
+latency. The "blended" column applies them to --home-miss-rate, the share
+of verifies whose person is registered at another site, at --price-per-1k.
+
+The latency columns are NOT measurements of Rekognition. The in-memory fake
+sleeps --base-ms per search plus --per-1k-ms per 1000 faces in the searched
+collection, so they only show how the model composes under parallel fan-out.
+Set both from timings of your own account before drawing conclusions.
+
+Usage:
+    python benchmarks/bench_gallery_search.py --sizes 1000 10000 100000 --shards 8 --home-miss-rate 0.05
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+
+def populate(fake, collection_id, people):
+    collection = fake.rekognition.collections.setdefault(collection_id, {})
+    for person in people:
+        face_id = f"rk-{person}"
+        collection[face_id] = {"FaceId": face_id, "ExternalImageId": person, "Confidence": 99.9, "person": person}
+
+
+def timed_searches(gallery, fake, image, shard, count):
+    """(median modelled ms, SearchFacesByImage calls per verify)"""
+    samples = []
+    before = fake.calls.get("rekognition:SearchFacesByImage", 0)
+    for _ in range(count):
+        started = time.perf_counter()
+        response = gallery.search_gallery(fake.rekognition, image, home_shard=shard)
+        samples.append((time.perf_counter() - started) * 1000)
+        assert response["FaceMatches"], "expected a match"
+    calls = (fake.calls.get("rekognition:SearchFacesByImage", 0) - before) / count
+    return statistics.median(samples), calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--base-ms", type=float, default=60)
+    parser.add_argument("--per-1k-ms", type=float, default=2)
+    parser.add_argument("--searches", type=int, default=20)
+    parser.add_argument("--home-miss-rate", type=float, default=0.05,
+                        help="share of verifies whose person is not in the kiosk's home shard")
+    parser.add_argument("--price-per-1k", type=float, default=1.0, help="USD per 1000 SearchFacesByImage calls")
+    args = parser.parse_args()
+
+    shards = [f"site{i}" for i in range(args.shards)]
+    os.environ.update(GALLERY_SHARD_BY="site", GALLERY_SHARDS=",".join(shards), GALLERY_FAN_OUT="1",
+                      GALLERY_SEARCH_WORKERS=str(args.shards))
+    import aws_fakes
+    import gallery
+
+    print(f"{'gallery':>9} | {'calls/verify':^32} | {'USD per 1k verifies':^21} | "
+          f"{'modelled median ms':^32}")
+    print(f"{'':>9} | {'unsharded':>10} {'home hit':>10} {'miss':>10} | {'unsharded':>10} {'blended':>10} | "
+          f"{'unsharded':>10} {'home hit':>10} {'miss':>10}")
+    for size in args.sizes:
+        fake = aws_fakes.FakeAWS({"rekognition": args.base_ms, "rekognition_per_1k_faces": args.per_1k_ms})
+        people = [f"p{i}" for i in range(size)]
+        target = aws_fakes.make_image(people[0])
+
+        # Unsharded: everything in the base collection
+        populate(fake, gallery.collection_for(""), people)
+        unsharded_ms, unsharded_calls = timed_searches(gallery, fake, target, "", args.searches)
+
+        # Sharded: people spread round-robin over the shards, base collection empty
+        fake = aws_fakes.FakeAWS({"rekognition": args.base_ms, "rekognition_per_1k_faces": args.per_1k_ms})
+        populate(fake, gallery.collection_for(""), [])
+        for index, shard in enumerate(shards):
+            populate(fake, gallery.collection_for(shard), people[index::args.shards])
+        hit_ms, hit_calls = timed_searches(gallery, fake, target, shards[0], args.searches)
+        miss_ms, miss_calls = timed_searches(gallery, fake, target, shards[1], args.searches)
+
+        blended_calls = (1 - args.home_miss_rate) * hit_calls + args.home_miss_rate * miss_calls
+        print(f"{size:>9} | {unsharded_calls:>10.1f} {hit_calls:>10.1f} {miss_calls:>10.1f} | "
+              f"{unsharded_calls * args.price_per_1k:>10.2f} {blended_calls * args.price_per_1k:>10.2f} | "
+              f"{unsharded_ms:>10.1f} {hit_ms:>10.1f} {miss_ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
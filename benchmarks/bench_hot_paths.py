@@ -0,0 +1,191 @@
+"""
+Microbenchmarks for the code that runs on every request
+
+  decode_image       data-URL parsing + base64.b64decode (image_utils)
+  encode_records     json_response.dumps of attendance records (Decimal values),
+                     with orjson; encode_records_stdlib is the fallback encoder
+  compress_records   gzip of the encoded records (large list responses)
+  attendance_stats   summarize_attendance (GET /attendance/stats)
+  sort_records       sort_newest_first (GET /attendance/records)
+
+Both encoders keep their own baselines, so a deployment without orjson is
+compared with the stdlib path rather than flagged against orjson's numbers.
+encode_records is skipped when orjson is not installed.
+
+Datasets are synthetic and seeded, so every run measures the same input.
+Timings are normalised by a fixed pure-Python calibration loop, which keeps
+the stored baselines comparable across machines. A benchmark that is more
+than --threshold slower than its baseline is flagged and the exit status is 1.
+
+Usage:
+    python benchmarks/bench_hot_paths.py                    # compare to baselines
+    python benchmarks/bench_hot_paths.py --scales 1k 100k   # skip the 1M datasets
+    python benchmarks/bench_hot_paths.py --update-baseline  # record new baselines
+"""
+import argparse
+import base64
+import contextlib
+import json
+import os
+import random
+import sys
+import time
+import timeit
+from decimal import Decimal
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from attendance_utils import sort_newest_first, summarize_attendance
+from image_utils import decode_image_data
+import json_response
+from json_response import compress, dumps
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+SCALES = {"1k": 1_000, "100k": 100_000, "1M": 1_000_000}
+IMAGE_SIZES = {"1k": 16 * 1024, "100k": 150 * 1024, "1M": 1024 * 1024}  # bytes per image
+
+
+def make_records(count, seed=42):
+    """Attendance records shaped like those mark_attendance writes"""
+    rng = random.Random(seed)
+    people = max(1, count // 20)
+    records = []
+    for i in range(count):
+        person = rng.randrange(people)
+        second = rng.randrange(86400)
+        timestamp = f"2025-09-23T{second // 3600:02d}:{second // 60 % 60:02d}:{second % 60:02d}.{i % 1000000:06d}"
+        records.append({
+            "attendanceId": f"att_20250923_{i:08d}_{person}",
+            "faceId": f"face-{person:08d}",
+            "firstName": f"First{person}",
+            "lastName": f"Last{person}",
+            "dateOfBirth": "1990-01-01",
+            "phoneNumber": f"555{person:07d}",
+            "type": "checkin" if rng.random() < 0.55 else "checkout",
+            "confidence": Decimal(f"{rng.uniform(80, 100):.4f}"),
+            "timestamp": timestamp,
+            "date": "2025-09-23",
+            "time": timestamp[11:19],
+            "createdAt": timestamp,
+        })
+    return records
+
+
+def calibrate():
+    """Time a fixed dict/str workload used as the unit for all results"""
+    def workload():
+        d = {}
+        for i in range(20000):
+            d[str(i)] = i * 2
+        return sorted(d.values())
+    return min(timeit.repeat(workload, number=5, repeat=15)) / 5
+
+
+def measure(fn, setup=None, repeat=5, min_sample=0.05):
+    """
+    Best-of-repeat seconds for one call of fn. Fast calls are batched until a
+    sample takes at least min_sample seconds; setup runs untimed before each call.
+    """
+    number = 1
+    best = float("inf")
+    for _ in range(repeat):
+        while True:
+            elapsed = 0.0
+            for _ in range(number):
+                state = setup() if setup else None
+                started = time.perf_counter()
+                fn(state)
+                elapsed += time.perf_counter() - started
+            if elapsed >= min_sample or number >= 10000:
+                break
+            number *= 10
+        best = min(best, elapsed / number)
+    return best
+
+
+@contextlib.contextmanager
+def stdlib_json():
+    """json_response as it runs without orjson installed"""
+    saved, json_response.orjson = json_response.orjson, None
+    try:
+        yield
+    finally:
+        json_response.orjson = saved
+
+
+def run_benchmarks(scales):
+    results = {}
+    for scale in scales:
+        count = SCALES[scale]
+        repeat = 5 if count <= 100_000 else 2
+        records = make_records(count)
+        image = "data:image/jpeg;base64," + base64.b64encode(random.Random(7).randbytes(IMAGE_SIZES[scale])).decode()
+
+        results[f"decode_image[{scale}]"] = measure(lambda _: decode_image_data(image), repeat=repeat)
+        if json_response.orjson is not None:
+            results[f"encode_records[{scale}]"] = measure(
+                lambda _: dumps({"success": True, "records": records}), repeat=repeat)
+        with stdlib_json():
+            results[f"encode_records_stdlib[{scale}]"] = measure(
+                lambda _: dumps({"success": True, "records": records}), repeat=repeat)
+        body = dumps({"success": True, "records": records})
+        results[f"compress_records[{scale}]"] = measure(lambda _: compress(body, "gzip"), repeat=repeat)
+        results[f"attendance_stats[{scale}]"] = measure(
+            lambda _: summarize_attendance(records, "2025-09-23"), repeat=repeat)
+        results[f"sort_records[{scale}]"] = measure(
+            sort_newest_first, setup=lambda: list(records), repeat=repeat)
+        del records
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", nargs="+", choices=list(SCALES), default=list(SCALES))
+    parser.add_argument("--threshold", type=float, default=0.30, help="allowed slowdown (0.30 = 30%%)")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--output", help="also write this run's results as JSON")
+    args = parser.parse_args()
+
+    unit = calibrate()
+    raw = run_benchmarks(args.scales)
+    normalized = {name: seconds / unit for name, seconds in raw.items()}
+
+    baselines = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as f:
+            baselines = json.load(f)
+
+    regressions = []
+    print(f"{'benchmark':28} {'time':>12} {'units':>10} {'baseline':>10} {'change':>8}")
+    for name, value in normalized.items():
+        baseline = baselines.get(name)
+        change = (value / baseline - 1) if baseline else None
+        flag = ""
+        if change is not None and change > args.threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:28} {raw[name] * 1000:10.3f}ms {value:10.3f} "
+              f"{f'{baseline:.3f}' if baseline else '-':>10} "
+              f"{f'{change:+.1%}' if change is not None else '-':>8}{flag}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"unitSeconds": unit, "seconds": raw, "units": normalized}, f, indent=2, sort_keys=True)
+
+    if args.update_baseline:
+        baselines.update({name: float(f"{value:.4g}") for name, value in normalized.items()})
+        with open(BASELINE_FILE, "w") as f:
+            json.dump(dict(sorted(baselines.items())), f, indent=2)
+            f.write("\n")
+        print(f"Baselines written to {BASELINE_FILE}")
+        return 0
+
+    if regressions:
+        print(f"\n{len(regressions)} benchmark(s) regressed more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
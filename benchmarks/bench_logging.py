@@ -0,0 +1,68 @@
+"""
+Microbenchmark: per-invocation logging overhead before/after log_utils
+
+Before: print(json.dumps(event)) with the full base64 image in the body
+After:  log.begin() + log.info(summarize_event(event)) + a sampled debug record
+
+Usage: python benchmarks/bench_logging.py [image_kb] [iterations]
+"""
+import base64
+import io
+import json
+import os
+import sys
+import timeit
+from contextlib import redirect_stdout
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from log_utils import get_logger, summarize_event
+
+
+def make_event(image_kb):
+    image = "data:image/jpeg;base64," + base64.b64encode(os.urandom(image_kb * 1024)).decode()
+    return {
+        "httpMethod": "POST",
+        "path": "/verify",
+        "isBase64Encoded": False,
+        "headers": {"Content-Type": "application/json"},
+        "body": json.dumps({"image": image}),
+    }
+
+
+def main():
+    image_kb = int(sys.argv[1]) if len(sys.argv) > 1 else 150
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    event = make_event(image_kb)
+    log = get_logger("bench")
+    sink = io.StringIO()
+
+    def before():
+        sink.seek(0)
+        sink.truncate()
+        with redirect_stdout(sink):
+            print("🔍 Incoming event:", json.dumps(event))
+
+    def after():
+        sink.seek(0)
+        sink.truncate()
+        with redirect_stdout(sink):
+            log.begin()
+            log.info("🔍 Incoming event", event=summarize_event(event))
+            log.debug("Incoming event detail", event=event)
+
+    before()
+    before_bytes = len(sink.getvalue())
+    after()
+    after_bytes = len(sink.getvalue())
+    before_s = min(timeit.repeat(before, number=iterations, repeat=5)) / iterations
+    after_s = min(timeit.repeat(after, number=iterations, repeat=5)) / iterations
+
+    print(f"Event size: {len(event['body'])} chars ({image_kb} KB image)")
+    print(f"before: {before_s * 1e6:10.1f} us/invocation  {before_bytes:>9} bytes logged")
+    print(f"after:  {after_s * 1e6:10.1f} us/invocation  {after_bytes:>9} bytes logged")
+    print(f"speedup: {before_s / after_s:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,316 @@
+"""
+Offline load generator that simulates a fleet of kiosks
+
+Replays kiosk traffic against app.py (through the Flask test client) and the
+Lambda handlers (invoked in-process) with S3, DynamoDB and Rekognition
+replaced by the in-memory fakes in aws_fakes.py, so it needs no network:
+
+  * register burst - kiosks enrol their people at the start of the run
+  * verify frames  - every kiosk sends a frame each --verify-interval seconds
+                     (a --faceless-rate share of frames are blurry or dark
+                     captures with no recognisable face); with --burst N each
+                     request carries N frames, the first of them blurry
+  * check-in wave in the first half of the run, check-out wave in the second
+  * dashboards     - poll /attendance/records and /attendance/stats, resolving
+                     the people in the records through /get_faces
+  * --retry-rate   - resend that share of register/attendance requests with
+                     the same idempotency key, as after a lost response
+  * --stream       - kiosks stream frames to app.py session endpoints instead
+                     of verifying each frame; each person stays in front of
+                     the camera for --dwell-frames frames (compare the
+                     SearchFacesByImage counts with and without it)
+
+Writes throughput, p50/p99 latency and error rates per endpoint as JSON.
+
+Usage:
+    python benchmarks/kiosk_fleet.py --kiosks 200 --duration 60 --output fleet.json
+"""
+import argparse
+import base64
+import gzip
+import importlib.util
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import aws_fakes
+
+LATENCY_PROFILES = {
+    "none": {},
+    "typical": {"s3": 25, "dynamodb": 8, "rekognition": 120},
+}
+
+
+def load_module(filename, name):
+    """Import one of the hyphenated Lambda handler files"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def data_url(image_bytes):
+    return "data:image/jpeg;base64," + base64.b64encode(image_bytes).decode()
+
+
+def api_event(path, payload):
+    return {"httpMethod": "POST", "path": path, "isBase64Encoded": False, "body": json.dumps(payload),
+            "headers": {"Accept-Encoding": "gzip"}}
+
+
+def response_body(body, encoding):
+    return json.loads(gzip.decompress(body) if encoding == "gzip" else body)
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = {}
+
+    def timed(self, endpoint, fn):
+        started = time.perf_counter()
+        try:
+            status, result = fn()
+        except Exception as e:
+            status, result = 599, {"error": str(e)}
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self.lock:
+            self.samples.setdefault(endpoint, []).append((elapsed_ms, status))
+        return status, result
+
+    def report(self, elapsed_s):
+        endpoints = {}
+        for endpoint, samples in sorted(self.samples.items()):
+            latencies = sorted(ms for ms, _ in samples)
+            count = len(samples)
+            server_errors = sum(1 for _, status in samples if status >= 500)
+            client_errors = sum(1 for _, status in samples if 400 <= status < 500)
+            endpoints[endpoint] = {
+                "count": count,
+                "throughputRps": round(count / elapsed_s, 2),
+                "p50Ms": round(percentile(latencies, 50), 2),
+                "p99Ms": round(percentile(latencies, 99), 2),
+                "maxMs": round(latencies[-1], 2),
+                "serverErrorRate": round(server_errors / count, 4),
+                "clientErrorRate": round(client_errors / count, 4),
+            }
+        return endpoints
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Fleet:
+    def __init__(self, args):
+        self.args = args
+        self.fake = aws_fakes.install(LATENCY_PROFILES[args.latency_profile])
+        # The whole fleet shares one process here, so give the Rekognition
+        # governor the account-wide rate rather than a per-container share
+        os.environ["REKOGNITION_TPS"] = os.environ["REKOGNITION_BURST"] = str(args.rekognition_tps)
+        # Model an API Gateway set up for binary responses
+        os.environ.setdefault("JSON_LAMBDA_COMPRESS", "1")
+        if args.stream:
+            os.environ["STREAMING_ENABLED"] = "1"  # opt-in on the app server
+        if args.storage == "edge":
+            # Set before the first import of storage; app.py then keeps its
+            # data on local disk (nothing is synced back in this harness)
+            os.environ["STORAGE_BACKEND"] = "edge"
+            os.environ["EDGE_DATA_DIR"] = tempfile.mkdtemp(prefix="kiosk-fleet-edge-")
+        self.register_lambda = load_module("aws-lambda-register.py", "lambda_register")
+        self.verify_lambda = load_module("aws-lambda-verify.py", "lambda_verify")
+        self.attendance_lambda = load_module("aws-lambda-attendance.py", "lambda_attendance")
+        import app as flask_app
+        self.client = flask_app.app.test_client()
+        self.recorder = Recorder()
+        self.stop = threading.Event()
+
+    # -- Lambda endpoints ---------------------------------------------------
+    def call_lambda(self, endpoint, module, path, payload):
+        def invoke():
+            response = module.lambda_handler(api_event(path, payload), None)
+            body = response["body"]
+            if response.get("isBase64Encoded"):
+                body = base64.b64decode(body)
+            return response["statusCode"], response_body(body, response["headers"].get("Content-Encoding"))
+        return self.recorder.timed(endpoint, invoke)
+
+    # -- Flask endpoints ----------------------------------------------------
+    def call_app(self, endpoint, method, path, payload=None):
+        def invoke():
+            response = self.client.open(path, method=method, json=payload, headers={"Accept-Encoding": "gzip"})
+            try:
+                return response.status_code, response_body(response.get_data(), response.headers.get("Content-Encoding"))
+            except ValueError:
+                return response.status_code, {}
+        return self.recorder.timed(endpoint, invoke)
+
+    def person(self, kiosk, index):
+        return f"k{kiosk}p{index}"
+
+    def sends(self):
+        """1, or 2 for a request whose response is "lost" and retried (--retry-rate)"""
+        return 2 if random.random() < self.args.retry_rate else 1
+
+    def register_people(self, kiosk):
+        for index in range(self.args.people_per_kiosk):
+            name = self.person(kiosk, index)
+            payload = {"firstName": name, "lastName": "Kiosk", "dateOfBirth": "1990-01-01",
+                       "phoneNumber": f"555{kiosk:04d}{index:03d}",
+                       "image": data_url(aws_fakes.make_image(name)),
+                       "idempotencyKey": uuid.uuid4().hex}
+            for _ in range(self.sends()):
+                if index % 4 == 3:
+                    self.call_app("app:POST /register", "POST", "/register", payload)
+                else:
+                    self.call_lambda("lambda:register", self.register_lambda, "/register", payload)
+
+    def kiosk(self, kiosk, started):
+        rng = random.Random(kiosk)
+        self.register_people(kiosk)
+        time.sleep(rng.random() * self.args.verify_interval)
+        while not self.stop.is_set():
+            if rng.random() < self.args.faceless_rate:
+                name, kind = None, rng.choice(["blurry", "dark"])
+            else:
+                name, kind = self.person(kiosk, rng.randrange(self.args.people_per_kiosk)), "sharp"
+            if self.args.burst > 1:
+                frames = [data_url(aws_fakes.make_image(name, "blurry"))]
+                frames += [data_url(aws_fakes.make_image(name, kind)) for _ in range(self.args.burst - 1)]
+                payload = {"images": frames}
+            else:
+                payload = {"image": data_url(aws_fakes.make_image(name, kind))}
+            status, result = self.call_lambda("lambda:verify", self.verify_lambda, "/verify", payload)
+            if status == 200 and result.get("match"):
+                second_half = time.time() - started > self.args.duration / 2
+                mark = {
+                    "action": "mark_attendance",
+                    "faceId": result["faceId"],
+                    "person": result["person"],
+                    "type": "checkout" if second_half else "checkin",
+                    "confidence": result["confidence"],
+                    "idempotencyKey": uuid.uuid4().hex,
+                }
+                for _ in range(self.sends()):
+                    self.call_lambda("lambda:attendance mark", self.attendance_lambda, "/attendance", mark)
+            self.stop.wait(self.args.verify_interval)
+
+    def resolve_people(self, face_ids, etags):
+        """Dashboard name lookup, revalidating the previous answer with If-None-Match"""
+        path = "/get_faces?faceIds=" + ",".join(sorted(face_ids))
+        def invoke():
+            headers = {"Accept-Encoding": "gzip"}
+            if path in etags:
+                headers["If-None-Match"] = etags[path]
+            response = self.client.get(path, headers=headers)
+            if response.headers.get("ETag"):
+                etags[path] = response.headers["ETag"]
+            return response.status_code, {}
+        return self.recorder.timed("app:GET /get_faces", invoke)
+
+    def dashboard(self):
+        etags = {}
+        while not self.stop.is_set():
+            status, result = self.call_app("app:GET /attendance/records", "GET", "/attendance/records?limit=100")
+            face_ids = {record["faceId"] for record in result.get("records", [])} if status == 200 else set()
+            if face_ids:
+                self.resolve_people(face_ids, etags)
+            self.call_app("app:GET /attendance/stats", "GET", "/attendance/stats")
+            self.call_lambda("lambda:attendance get_records", self.attendance_lambda, "/attendance",
+                             {"action": "get_records"})
+            self.stop.wait(self.args.dashboard_interval)
+
+    def kiosk_stream(self, kiosk, started):
+        rng = random.Random(kiosk)
+        self.register_people(kiosk)
+        time.sleep(rng.random() * self.args.verify_interval)
+        status, session = self.call_app("app:POST /stream/sessions", "POST", "/stream/sessions", {})
+        if status != 201:
+            return
+        frames_path = f"/stream/sessions/{session['sessionId']}/frames"
+        frame = 0
+        while not self.stop.is_set():
+            # A person dwells at the kiosk, drifting slightly, then the next
+            # one steps in somewhere else in the frame
+            visit, step = divmod(frame, self.args.dwell_frames)
+            name = self.person(kiosk, visit % self.args.people_per_kiosk)
+            box = {"Left": 0.1 + 0.4 * (visit % 2) + 0.005 * step, "Top": 0.2, "Width": 0.35, "Height": 0.5}
+            status, result = self.call_app("app:POST /stream frames", "POST", frames_path,
+                                           {"image": data_url(aws_fakes.make_image(name)), "boxes": [box]})
+            for event in result.get("events", []) if status == 200 else []:
+                if event["type"] == "match":
+                    second_half = time.time() - started > self.args.duration / 2
+                    self.call_lambda("lambda:attendance mark", self.attendance_lambda, "/attendance", {
+                        "action": "mark_attendance",
+                        "faceId": event["faceId"],
+                        "person": event["person"],
+                        "type": "checkout" if second_half else "checkin",
+                        "confidence": event["confidence"],
+                    })
+            frame += 1
+            self.stop.wait(self.args.verify_interval)
+
+    def run(self):
+        started = time.time()
+        kiosk = self.kiosk_stream if self.args.stream else self.kiosk
+        threads = [threading.Thread(target=kiosk, args=(k, started), daemon=True)
+                   for k in range(self.args.kiosks)]
+        threads += [threading.Thread(target=self.dashboard, daemon=True) for _ in range(self.args.dashboards)]
+        for t in threads:
+            t.start()
+        time.sleep(self.args.duration)
+        self.stop.set()
+        for t in threads:
+            t.join(timeout=30)
+        elapsed = time.time() - started
+        return {
+            "config": {k: v for k, v in sorted(vars(self.args).items()) if k != "output"},
+            "elapsedS": round(elapsed, 2),
+            "endpoints": self.recorder.report(elapsed),
+            "awsCalls": dict(sorted(self.fake.calls.items())),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kiosks", type=int, default=200)
+    parser.add_argument("--people-per-kiosk", type=int, default=5)
+    parser.add_argument("--duration", type=float, default=60, help="seconds")
+    parser.add_argument("--verify-interval", type=float, default=2.0, help="seconds between frames per kiosk")
+    parser.add_argument("--faceless-rate", type=float, default=0.2)
+    parser.add_argument("--burst", type=int, default=1, help="frames per verify request")
+    parser.add_argument("--stream", action="store_true", help="use streaming sessions instead of verify")
+    parser.add_argument("--dwell-frames", type=int, default=10, help="frames each person stays (--stream)")
+    parser.add_argument("--retry-rate", type=float, default=0.0,
+                        help="share of register/attendance requests sent twice with the same idempotency key")
+    parser.add_argument("--dashboards", type=int, default=2)
+    parser.add_argument("--dashboard-interval", type=float, default=5.0)
+    parser.add_argument("--rekognition-tps", type=float, default=50, help="account TPS for the governor")
+    parser.add_argument("--storage", choices=["aws", "edge"], default="aws", help="app.py storage backend")
+    parser.add_argument("--latency-profile", choices=sorted(LATENCY_PROFILES), default="typical")
+    parser.add_argument("--output", default="kiosk-fleet-results.json")
+    args = parser.parse_args()
+
+    results = Fleet(args).run()
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+    for endpoint, row in results["endpoints"].items():
+        print(f"{endpoint:34} n={row['count']:>6} rps={row['throughputRps']:>8} "
+              f"p50={row['p50Ms']:>8}ms p99={row['p99Ms']:>8}ms 5xx={row['serverErrorRate']:.2%}")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
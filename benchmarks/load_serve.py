@@ -0,0 +1,136 @@
+"""
+Load test: requests/sec of serve.py as the worker count grows
+
+Starts serve.py once per worker count, drives it from several client
+processes with keep-alive connections, then stops it with SIGTERM (graceful
+shutdown). The default path is /healthz so no AWS credentials are needed.
+
+Usage:
+    python benchmarks/load_serve.py --workers 1 2 4 --threads 8 --duration 10
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def client_process(port, path, connections, duration, results):
+    """Run `connections` keep-alive client threads for `duration` seconds"""
+    counts = {"ok": 0, "errors": 0}
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    def worker():
+        ok = errors = 0
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        while time.time() < deadline:
+            try:
+                conn.request("GET", path)
+                response = conn.getresponse()
+                response.read()
+                if response.status == 200:
+                    ok += 1
+                else:
+                    errors += 1
+            except (OSError, http.client.HTTPException):
+                errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+        conn.close()
+        with lock:
+            counts["ok"] += ok
+            counts["errors"] += errors
+
+    threads = [threading.Thread(target=worker) for _ in range(connections)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    results.put(counts)
+
+
+def wait_until_healthy(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/healthz")
+            if conn.getresponse().status == 200:
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def run_once(args, workers):
+    server = subprocess.Popen(
+        [sys.executable, "serve.py", "--workers", str(workers), "--threads", str(args.threads),
+         "--bind", f"127.0.0.1:{args.port}"],
+        cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        if not wait_until_healthy(args.port):
+            raise RuntimeError("server did not become healthy")
+        results = multiprocessing.Queue()
+        clients = [
+            multiprocessing.Process(target=client_process,
+                                    args=(args.port, args.path, args.connections, args.duration, results))
+            for _ in range(args.clients)
+        ]
+        started = time.time()
+        for c in clients:
+            c.start()
+        totals = {"ok": 0, "errors": 0}
+        for _ in clients:
+            counts = results.get()
+            totals["ok"] += counts["ok"]
+            totals["errors"] += counts["errors"]
+        for c in clients:
+            c.join()
+        elapsed = time.time() - started
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+    return {
+        "workers": workers,
+        "threads": args.threads,
+        "requests": totals["ok"],
+        "errors": totals["errors"],
+        "rps": round(totals["ok"] / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--clients", type=int, default=4, help="client processes")
+    parser.add_argument("--connections", type=int, default=16, help="connections per client process")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--path", default="/healthz")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    args = parser.parse_args()
+
+    rows = []
+    for workers in args.workers:
+        row = run_once(args, workers)
+        rows.append(row)
+        print(f"workers={row['workers']:>3} threads={row['threads']:>3} "
+              f"rps={row['rps']:>9} errors={row['errors']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
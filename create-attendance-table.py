@@ -1,5 +1,7 @@
 import boto3
 import json
+from storage import (ATTENDANCE_DATE_INDEX, ATTENDANCE_DATE_SHARDS, ATTENDANCE_SHARD_INDEX, ATTENDANCE_STATE_TABLE,
+                     ATTENDANCE_TABLE)
 
 def create_attendance_table():
     """
@@ -7,7 +9,13 @@ def create_attendance_table():
     """
     dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
     
-    table_name = 'attendance-records'
+    table_name = ATTENDANCE_TABLE
+    # The date index the deployment reads: dateShard-index ("<date>#<n>",
+    # see storage.py) when ATTENDANCE_DATE_SHARDS is set, date-index otherwise
+    if ATTENDANCE_DATE_SHARDS:
+        date_index, date_key = ATTENDANCE_SHARD_INDEX, 'dateShard'
+    else:
+        date_index, date_key = ATTENDANCE_DATE_INDEX, 'date'
     
     try:
         # Check if table already exists
@@ -35,7 +43,7 @@ def create_attendance_table():
                     'AttributeType': 'S'
                 },
                 {
-                    'AttributeName': 'date',
+                    'AttributeName': date_key,
                     'AttributeType': 'S'
                 },
                 {
@@ -58,17 +66,13 @@ def create_attendance_table():
                     ],
                     'Projection': {
                         'ProjectionType': 'ALL'
-                    },
-                    'ProvisionedThroughput': {
-                        'ReadCapacityUnits': 5,
-                        'WriteCapacityUnits': 5
                     }
                 },
                 {
-                    'IndexName': 'date-index',
+                    'IndexName': date_index,
                     'KeySchema': [
                         {
-                            'AttributeName': 'date',
+                            'AttributeName': date_key,
                             'KeyType': 'HASH'
                         },
                         {
@@ -78,18 +82,13 @@ def create_attendance_table():
                     ],
                     'Projection': {
                         'ProjectionType': 'ALL'
-                    },
-                    'ProvisionedThroughput': {
-                        'ReadCapacityUnits': 5,
-                        'WriteCapacityUnits': 5
                     }
                 }
             ],
-            BillingMode='PROVISIONED',
-            ProvisionedThroughput={
-                'ReadCapacityUnits': 5,
-                'WriteCapacityUnits': 5
-            }
+            # On-demand: a provisioned GSI's write capacity is shared by all
+            # of its partitions, so 5 WCU would cap a check-in burst at 5
+            # writes/s however the date index is sharded
+            BillingMode='PAY_PER_REQUEST'
         )
         
         print(f"Creating table {table_name}...")
@@ -105,5 +104,46 @@ def create_attendance_table():
     except Exception as e:
         print(f"Error creating table: {str(e)}")
 
+def create_attendance_state_table():
+    """
+    Create the DynamoDB table holding each person's current attendance state
+    (last type and timestamp), used to toggle check-in/check-out and to
+    collapse repeated marks
+    """
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    
+    table_name = ATTENDANCE_STATE_TABLE
+    
+    try:
+        existing_tables = dynamodb.meta.client.list_tables()['TableNames']
+        if table_name in existing_tables:
+            print(f"Table {table_name} already exists.")
+            return
+        
+        table = dynamodb.create_table(
+            TableName=table_name,
+            KeySchema=[
+                {
+                    'AttributeName': 'faceId',
+                    'KeyType': 'HASH'  # Partition key
+                }
+            ],
+            AttributeDefinitions=[
+                {
+                    'AttributeName': 'faceId',
+                    'AttributeType': 'S'
+                }
+            ],
+            BillingMode='PAY_PER_REQUEST'  # one write per attendance mark, like attendance-records
+        )
+        
+        print(f"Creating table {table_name}...")
+        table.wait_until_exists()
+        print(f"Table {table_name} created successfully!")
+        
+    except Exception as e:
+        print(f"Error creating table: {str(e)}")
+
 if __name__ == "__main__":
     create_attendance_table()
+    create_attendance_state_table()
@@ -0,0 +1,58 @@
+import boto3
+from idempotency import IDEMPOTENCY_TABLE
+
+def create_idempotency_table():
+    """
+    Create the DynamoDB table that remembers idempotency keys for register
+    and attendance requests. Items expire through DynamoDB TTL on expiresAt.
+    """
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    client = dynamodb.meta.client
+
+    table_name = IDEMPOTENCY_TABLE
+
+    try:
+        # Check if table already exists
+        existing_tables = client.list_tables()['TableNames']
+        if table_name in existing_tables:
+            print(f"Table {table_name} already exists.")
+            return
+
+        # On-demand: the load on this table follows retry storms
+        table = dynamodb.create_table(
+            TableName=table_name,
+            KeySchema=[
+                {
+                    'AttributeName': 'idempotencyKey',
+                    'KeyType': 'HASH'  # Partition key
+                }
+            ],
+            AttributeDefinitions=[
+                {
+                    'AttributeName': 'idempotencyKey',
+                    'AttributeType': 'S'
+                }
+            ],
+            BillingMode='PAY_PER_REQUEST'
+        )
+
+        print(f"Creating table {table_name}...")
+
+        # Wait for table to be created
+        table.wait_until_exists()
+        print(f"Table {table_name} created successfully!")
+
+        client.update_time_to_live(
+            TableName=table_name,
+            TimeToLiveSpecification={
+                'Enabled': True,
+                'AttributeName': 'expiresAt'
+            }
+        )
+        print("TTL enabled on expiresAt")
+
+    except Exception as e:
+        print(f"Error creating table: {str(e)}")
+
+if __name__ == "__main__":
+    create_idempotency_table()
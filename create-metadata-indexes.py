@@ -0,0 +1,108 @@
+import boto3
+import time
+from person_index import IMAGE_INDEX, NAME_INDEX, PHONE_INDEX, new_version, search_keys
+
+# index name -> (hash key attribute, projection)
+INDEXES = {
+    NAME_INDEX: ('nameKey', {'ProjectionType': 'ALL'}),
+    PHONE_INDEX: ('phoneKey', {'ProjectionType': 'ALL'}),
+    IMAGE_INDEX: ('s3Key', {'ProjectionType': 'KEYS_ONLY'})
+}
+
+def wait_for_indexes(client, table_name):
+    """DynamoDB creates one GSI at a time; wait until none is still building"""
+    while True:
+        table = client.describe_table(TableName=table_name)['Table']
+        statuses = [index['IndexStatus'] for index in table.get('GlobalSecondaryIndexes', [])]
+        if table['TableStatus'] == 'ACTIVE' and all(status == 'ACTIVE' for status in statuses):
+            return
+        time.sleep(10)
+
+def create_metadata_indexes():
+    """
+    Add the admin lookup indexes (normalized name, phone number and image key)
+    to the face-metadata table and backfill the index attributes on rows
+    written before they existed
+    """
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    client = dynamodb.meta.client
+    table_name = 'face-metadata'
+
+    try:
+        description = client.describe_table(TableName=table_name)['Table']
+        existing = {index['IndexName'] for index in description.get('GlobalSecondaryIndexes', [])}
+        provisioned = description.get('BillingModeSummary', {}).get('BillingMode', 'PROVISIONED') == 'PROVISIONED'
+
+        for index_name, (attribute, projection) in INDEXES.items():
+            if index_name in existing:
+                print(f"Index {index_name} already exists.")
+                continue
+
+            index = {
+                'IndexName': index_name,
+                'KeySchema': [
+                    {
+                        'AttributeName': attribute,
+                        'KeyType': 'HASH'
+                    }
+                ],
+                'Projection': projection
+            }
+            if provisioned:
+                index['ProvisionedThroughput'] = {
+                    'ReadCapacityUnits': 5,
+                    'WriteCapacityUnits': 5
+                }
+
+            print(f"Creating index {index_name}...")
+            client.update_table(
+                TableName=table_name,
+                AttributeDefinitions=[
+                    {
+                        'AttributeName': attribute,
+                        'AttributeType': 'S'
+                    }
+                ],
+                GlobalSecondaryIndexUpdates=[{'Create': index}]
+            )
+            wait_for_indexes(client, table_name)
+            print(f"Index {index_name} created successfully!")
+
+        # Backfill index attributes on older rows
+        print("Backfilling index attributes...")
+        table = dynamodb.Table(table_name)
+        updated = 0
+        params = {}
+        while True:
+            response = table.scan(**params)
+            for item in response.get('Items', []):
+                missing = {
+                    name: value
+                    for name, value in search_keys(item.get('firstName', ''), item.get('lastName', ''),
+                                                   item.get('phoneNumber', '')).items()
+                    if item.get(name) != value
+                }
+                # Rows registered through app.py stored their image as imageKey
+                if not item.get('s3Key') and item.get('imageKey'):
+                    missing['s3Key'] = item['imageKey']
+                if not missing:
+                    continue
+                missing['version'] = new_version()
+                table.update_item(
+                    Key={'faceId': item['faceId']},
+                    UpdateExpression='SET ' + ', '.join(f'#{name} = :{name}' for name in missing),
+                    ExpressionAttributeNames={f'#{name}': name for name in missing},
+                    ExpressionAttributeValues={f':{name}': value for name, value in missing.items()}
+                )
+                updated += 1
+            if 'LastEvaluatedKey' not in response:
+                break
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        print(f"Backfilled {updated} records.")
+
+    except Exception as e:
+        print(f"Error creating indexes: {str(e)}")
+
+if __name__ == "__main__":
+    create_metadata_indexes()
@@ -0,0 +1,173 @@
+import argparse
+import boto3
+from concurrent.futures import ThreadPoolExecutor
+from boto3.dynamodb.conditions import Key
+from gallery import all_collections
+from person_index import new_version
+from storage import ATTENDANCE_TABLE, METADATA_TABLE
+
+def list_all_faces(rekognition, collection_id):
+    """List every face in the collection, following NextToken"""
+    faces = []
+    params = {'CollectionId': collection_id, 'MaxResults': 1000}
+    while True:
+        response = rekognition.list_faces(**params)
+        faces.extend(response.get('Faces', []))
+        if not response.get('NextToken'):
+            return faces
+        params['NextToken'] = response['NextToken']
+
+def find_clusters(rekognition, collection_id, faces, threshold, workers):
+    """
+    Group faces that match each other above threshold (union-find over the
+    search_faces results, searched concurrently)
+    """
+    parent = {face['FaceId']: face['FaceId'] for face in faces}
+
+    def root(face_id):
+        while parent[face_id] != face_id:
+            parent[face_id] = parent[parent[face_id]]
+            face_id = parent[face_id]
+        return face_id
+
+    def search(face_id):
+        response = rekognition.search_faces(
+            CollectionId=collection_id,
+            FaceId=face_id,
+            MaxFaces=10,
+            FaceMatchThreshold=threshold
+        )
+        return face_id, [m['Face']['FaceId'] for m in response.get('FaceMatches', [])]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for face_id, matches in pool.map(search, parent.keys()):
+            for match_id in matches:
+                if match_id in parent:
+                    parent[root(match_id)] = root(face_id)
+
+    clusters = {}
+    for face in faces:
+        clusters.setdefault(root(face['FaceId']), []).append(face)
+    return [members for members in clusters.values() if len(members) > 1]
+
+def merge_cluster(rekognition, metadata_table, attendance_table, collection_id, members, apply):
+    """
+    Keep the oldest registration as the canonical person: move the other
+    registrations' images and attendance records onto it, then delete their
+    metadata rows and Rekognition faces
+    """
+    records = []
+    for face in members:
+        face_id = face.get('ExternalImageId')
+        item = metadata_table.get_item(Key={'faceId': face_id}).get('Item') if face_id else None
+        records.append((face, item))
+
+    known = [(face, item) for face, item in records if item]
+    if not known:
+        print("   ⚠️  No metadata for any face in this cluster - skipping")
+        return
+    known.sort(key=lambda pair: pair[1].get('createdAt', ''))
+    canonical = known[0][1]
+    # Faces re-indexed under the canonical faceId (fix-unindexed-records.py
+    # after a crash) belong to the person being kept, not to a duplicate
+    duplicates = [(face, item) for face, item in records if item is None or item['faceId'] != canonical['faceId']]
+    if not duplicates:
+        print("   ⚠️  Every face in this cluster belongs to the same person - skipping")
+        return
+    # A duplicate person indexed more than once is merged once
+    people = list({item['faceId']: item for _, item in duplicates if item}.values())
+
+    print(f"   Keep: {canonical.get('firstName', 'N/A')} {canonical.get('lastName', 'N/A')} ({canonical['faceId']})")
+    for item in people:
+        print(f"   Merge: {item.get('firstName', 'N/A')} {item.get('lastName', 'N/A')} ({item['faceId']})")
+    for face, item in duplicates:
+        if not item:
+            print(f"   Merge: unlinked face {face['FaceId']}")
+
+    if not apply:
+        return
+
+    known_images = {canonical.get('s3Key')} | set(canonical.get('additionalImages', []))
+    extra_images = []
+    for item in people:
+        for image in [item.get('s3Key')] + list(item.get('additionalImages', [])):
+            if image and image not in known_images:
+                known_images.add(image)
+                extra_images.append(image)
+    if extra_images:
+        metadata_table.update_item(
+            Key={'faceId': canonical['faceId']},
+            UpdateExpression='SET additionalImages = list_append(if_not_exists(additionalImages, :empty), :images), '
+                             'version = :version',
+            ExpressionAttributeValues={':empty': [], ':images': extra_images, ':version': new_version()}
+        )
+
+    for item in people:
+        # Re-point attendance history at the canonical person
+        params = {
+            'IndexName': 'faceId-index',
+            'KeyConditionExpression': Key('faceId').eq(item['faceId'])
+        }
+        while True:
+            response = attendance_table.query(**params)
+            for record in response.get('Items', []):
+                attendance_table.update_item(
+                    Key={'attendanceId': record['attendanceId']},
+                    UpdateExpression='SET faceId = :f',
+                    ExpressionAttributeValues={':f': canonical['faceId']}
+                )
+            if 'LastEvaluatedKey' not in response:
+                break
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        metadata_table.delete_item(Key={'faceId': item['faceId']})
+
+    rekognition.delete_faces(CollectionId=collection_id, FaceIds=[face['FaceId'] for face, _ in duplicates])
+    print(f"   ✅ Merged {len(duplicates)} duplicate face(s) of {len(people)} person(s)")
+
+def dedup_faces():
+    """
+    Find clusters of near-duplicate faces in the collection and merge them
+    """
+    parser = argparse.ArgumentParser(description="Find and merge duplicate people in the face collection")
+    parser.add_argument('--threshold', type=float, default=95, help="similarity that counts as the same person")
+    parser.add_argument('--workers', type=int, default=8, help="concurrent search_faces calls")
+    parser.add_argument('--apply', action='store_true', help="merge the clusters (default is a dry run)")
+    args = parser.parse_args()
+
+    try:
+        rekognition = boto3.client('rekognition', region_name='us-east-1')
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        metadata_table = dynamodb.Table(METADATA_TABLE)
+        attendance_table = dynamodb.Table(ATTENDANCE_TABLE)
+
+        print("🔍 Duplicate Face Finder")
+        print("=" * 50)
+
+        # Each gallery shard is deduplicated on its own
+        found = 0
+        for collection_id in all_collections():
+            try:
+                faces = list_all_faces(rekognition, collection_id)
+            except rekognition.exceptions.ResourceNotFoundException:
+                continue
+            print(f"\n📂 {collection_id}: {len(faces)} faces")
+
+            clusters = find_clusters(rekognition, collection_id, faces, args.threshold, args.workers)
+            print(f"Found {len(clusters)} clusters of duplicates (threshold {args.threshold}%)")
+            found += len(clusters)
+
+            for i, members in enumerate(clusters, 1):
+                print(f"\n{i}. Cluster of {len(members)} faces")
+                merge_cluster(rekognition, metadata_table, attendance_table, collection_id, members, args.apply)
+
+        print("\n" + "=" * 50)
+        if not args.apply and found:
+            print("💡 Dry run only. Re-run with --apply to merge these clusters")
+        else:
+            print("✅ Done!")
+
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+
+if __name__ == "__main__":
+    dedup_faces()
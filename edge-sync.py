@@ -0,0 +1,70 @@
+import argparse
+import time
+from storage import EDGE_DATA_DIR, AWSStorage, EdgeStorage
+
+# DynamoDB BatchWriteItem takes at most 25 items per request
+BATCH_SIZE = 25
+
+def sync_batch(edge, aws, table, batch_size):
+    """Replicate one batch of unsynced rows; returns how many were sent"""
+    rows = edge.pending(table, batch_size)
+    if not rows:
+        return 0
+    if table == 'images':
+        for key, _, _ in rows:
+            aws.put_image(edge.read_image(key))
+    else:
+        target = aws.metadata_table if table == 'people' else aws.attendance_table
+        # batch_writer groups the puts and resends unprocessed items
+        with target.batch_writer() as batch:
+            for _, _, item in rows:
+                batch.put_item(Item=aws.attendance_item(item) if table == 'attendance' else item)
+    edge.mark_synced(table, rows)
+    return len(rows)
+
+def edge_sync():
+    """
+    Replicate an edge node's images, registrations and attendance to AWS.
+    Runs next to app.py (STORAGE_BACKEND=edge) and keeps retrying while the
+    uplink is down; rows are only marked synced once AWS has accepted them.
+    """
+    parser = argparse.ArgumentParser(description="Replicate edge storage to S3 and DynamoDB")
+    parser.add_argument('--data-dir', default=EDGE_DATA_DIR, help="edge data directory (EDGE_DATA_DIR)")
+    parser.add_argument('--interval', type=float, default=5.0, help="seconds between passes when idle")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--once', action='store_true', help="sync the current backlog and exit")
+    args = parser.parse_args()
+
+    edge = EdgeStorage(args.data_dir)
+    aws = AWSStorage()
+    print(f"🔄 Syncing {args.data_dir} to AWS (backlog: {edge.backlog()})")
+
+    while True:
+        try:
+            sent = 0
+            # Images first so synced metadata rarely points at an object not uploaded yet
+            for table in ('images', 'people', 'attendance'):
+                while True:
+                    count = sync_batch(edge, aws, table, args.batch_size)
+                    sent += count
+                    if count < args.batch_size:
+                        break
+            if sent:
+                print(f"✅ Synced {sent} rows (backlog: {edge.backlog()})")
+            if args.once:
+                return
+        except KeyboardInterrupt:
+            print("⏹️  Stopped")
+            return
+        except Exception as e:
+            print(f"❌ Sync failed, retrying in {args.interval}s: {str(e)}")
+            if args.once:
+                return
+        try:
+            time.sleep(args.interval)
+        except KeyboardInterrupt:
+            print("⏹️  Stopped")
+            return
+
+if __name__ == "__main__":
+    edge_sync()
@@ -0,0 +1,190 @@
+import io
+import itertools
+import os
+import time
+
+# NumPy/Pillow (frame differencing, cropping) and OpenCV (local face
+# detection) are optional. Without a detector the kiosk can send face boxes
+# itself; without any boxes the whole frame is tracked as one face and a
+# large frame-to-frame change starts a new track.
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    np = None
+    Image = None
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+# Tracking configuration
+TRACK_IOU_THRESHOLD = float(os.environ.get("TRACK_IOU_THRESHOLD", "0.3"))
+TRACK_MAX_MISSES = int(os.environ.get("TRACK_MAX_MISSES", "5"))  # frames without the face
+TRACK_CONFIDENCE_HALF_LIFE = float(os.environ.get("TRACK_CONFIDENCE_HALF_LIFE", "30"))  # seconds
+TRACK_MIN_CONFIDENCE = float(os.environ.get("TRACK_MIN_CONFIDENCE", "80"))
+TRACK_RETRY_INTERVAL = float(os.environ.get("TRACK_RETRY_INTERVAL", "1.0"))  # seconds between attempts per track
+TRACK_MOTION_THRESHOLD = float(os.environ.get("TRACK_MOTION_THRESHOLD", "40"))  # mean abs diff, 0-255
+TRACK_CROP_MARGIN = float(os.environ.get("TRACK_CROP_MARGIN", "0.25"))
+
+FULL_FRAME = {"Left": 0.0, "Top": 0.0, "Width": 1.0, "Height": 1.0}
+
+_track_ids = itertools.count(1)
+_cascade = None
+
+
+def iou(a, b):
+    """Intersection over union of two Rekognition-style ratio boxes"""
+    left = max(a["Left"], b["Left"])
+    top = max(a["Top"], b["Top"])
+    right = min(a["Left"] + a["Width"], b["Left"] + b["Width"])
+    bottom = min(a["Top"] + a["Height"], b["Top"] + b["Height"])
+    if right <= left or bottom <= top:
+        return 0.0
+    intersection = (right - left) * (bottom - top)
+    union = a["Width"] * a["Height"] + b["Width"] * b["Height"] - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def detect_boxes(image_bytes):
+    """Face boxes from OpenCV's Haar cascade, or None when OpenCV is unavailable"""
+    global _cascade
+    if cv2 is None or np is None:
+        return None
+    if _cascade is None:
+        _cascade = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+    frame = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if frame is None:
+        return []
+    height, width = frame.shape
+    faces = _cascade.detectMultiScale(frame, scaleFactor=1.2, minNeighbors=5, minSize=(48, 48))
+    return [{"Left": x / width, "Top": y / height, "Width": w / width, "Height": h / height}
+            for x, y, w, h in faces]
+
+
+def thumbnail(image_bytes, size=32):
+    """Tiny grayscale copy of a frame for motion checks, or None"""
+    if np is None:
+        return None
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.draft("L", (size * 4, size * 4))
+        return np.asarray(image.convert("L").resize((size, size)), dtype=np.float32)
+    except Exception:
+        return None
+
+
+def crop(image_bytes, box, margin=TRACK_CROP_MARGIN):
+    """JPEG of the box (plus margin) for recognising one of several faces"""
+    if Image is None:
+        return image_bytes
+    image = Image.open(io.BytesIO(image_bytes))
+    width, height = image.size
+    pad_x, pad_y = box["Width"] * margin, box["Height"] * margin
+    region = (
+        int(max(0.0, box["Left"] - pad_x) * width),
+        int(max(0.0, box["Top"] - pad_y) * height),
+        int(min(1.0, box["Left"] + box["Width"] + pad_x) * width),
+        int(min(1.0, box["Top"] + box["Height"] + pad_y) * height),
+    )
+    buffer = io.BytesIO()
+    image.convert("RGB").crop(region).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+class Track:
+    def __init__(self, box, now):
+        self.id = next(_track_ids)
+        self.box = box
+        self.started = now
+        self.misses = 0
+        self.frames = 1
+        self.identity = None  # {"faceId", "person", "confidence"} once recognised
+        self.recognized_at = None
+        self.attempted_at = None
+        self.attempts = 0
+
+    def confidence(self, now):
+        """Recognition confidence, halved every TRACK_CONFIDENCE_HALF_LIFE seconds"""
+        if not self.identity:
+            return 0.0
+        age = now - self.recognized_at
+        return self.identity["confidence"] * 0.5 ** (age / TRACK_CONFIDENCE_HALF_LIFE)
+
+    def needs_recognition(self, now):
+        """A new track, or a known one whose confidence has decayed"""
+        if self.attempted_at is not None and now - self.attempted_at < TRACK_RETRY_INTERVAL:
+            return False
+        return self.confidence(now) < TRACK_MIN_CONFIDENCE
+
+    def to_dict(self, now):
+        return {
+            "trackId": self.id,
+            "box": self.box,
+            "frames": self.frames,
+            "faceId": self.identity["faceId"] if self.identity else None,
+            "confidence": round(self.confidence(now), 1)
+        }
+
+
+class FaceTracker:
+    """
+    Greedy IoU tracker. Each frame's boxes are matched to the live tracks
+    with the highest overlap above TRACK_IOU_THRESHOLD; unmatched boxes start
+    new tracks and tracks unmatched for TRACK_MAX_MISSES frames end.
+    """
+
+    def __init__(self):
+        self.tracks = []
+        self.previous_thumbnail = None
+
+    def update(self, image_bytes, boxes=None, now=None):
+        """
+        Advance the tracker by one frame. Returns (tracks, ended): the live
+        tracks seen in this frame and the tracks that ended.
+        """
+        now = time.monotonic() if now is None else now
+        ended = []
+        if boxes is None:
+            boxes = detect_boxes(image_bytes)
+        if boxes is None:
+            # No detector: follow the whole frame and treat a large change
+            # between frames as a different person stepping in
+            boxes = [FULL_FRAME]
+            current = thumbnail(image_bytes)
+            previous, self.previous_thumbnail = self.previous_thumbnail, current
+            if previous is not None and current is not None \
+                    and float(np.abs(current - previous).mean()) > TRACK_MOTION_THRESHOLD:
+                ended, self.tracks = self.tracks, []
+
+        pairs = sorted(((iou(track.box, box), t, b)
+                        for t, track in enumerate(self.tracks) for b, box in enumerate(boxes)),
+                       key=lambda pair: pair[0], reverse=True)
+        matched_tracks, matched_boxes = set(), set()
+        for overlap, t, b in pairs:
+            if overlap < TRACK_IOU_THRESHOLD:
+                break
+            if t in matched_tracks or b in matched_boxes:
+                continue
+            track = self.tracks[t]
+            track.box = boxes[b]
+            track.misses = 0
+            track.frames += 1
+            matched_tracks.add(t)
+            matched_boxes.add(b)
+
+        live, seen = [], []
+        for t, track in enumerate(self.tracks):
+            if t in matched_tracks:
+                seen.append(track)
+                live.append(track)
+            else:
+                track.misses += 1
+                (ended if track.misses > TRACK_MAX_MISSES else live).append(track)
+        for b, box in enumerate(boxes):
+            if b not in matched_boxes:
+                track = Track(box, now)
+                seen.append(track)
+                live.append(track)
+        self.tracks = live
+        return seen, ended
@@ -1,34 +1,50 @@
+import argparse
 import boto3
 import json
+from boto3.dynamodb.conditions import Attr
+from gallery import collection_for
+from person_index import new_version
+from image_store import image_key_for
+from table_scan import SCAN_SEGMENTS, CapacityBudgetExhausted, parallel_scan
 
 def fix_unindexed_records():
     """
     Fix existing unindexed records by re-indexing them
     """
+    parser = argparse.ArgumentParser(description="Re-index metadata records that are missing from Rekognition")
+    parser.add_argument('--segments', type=int, default=SCAN_SEGMENTS, help="parallel scan segments")
+    parser.add_argument('--capacity-per-second', type=float, help="read capacity units per second the scan may use")
+    parser.add_argument('--capacity-limit', type=float, help="stop after this many read capacity units (rerun to resume)")
+    parser.add_argument('--checkpoint', default='fix-unindexed-records.checkpoint.json',
+                        help="scan progress file; an interrupted run resumes from it")
+    args = parser.parse_args()
+
     try:
         rekognition = boto3.client('rekognition', region_name='us-east-1')
         dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
         s3_client = boto3.client('s3', region_name='us-east-1')
         
-        collection_id = 'face-collection'
         bucket_name = 'facial-recognition-data-bucket'
         
         print("🔧 Fixing Unindexed Records...")
         print("=" * 50)
         
-        # Get all unindexed records
+        # Stream unindexed records from a parallel scan (resumable)
         table = dynamodb.Table('face-metadata')
-        response = table.scan()
-        items = response.get('Items', [])
-        
-        unindexed_items = [item for item in items if item.get('rekognitionFaceId') == 'N/A' or item.get('status') != 'indexed']
-        
-        print(f"Found {len(unindexed_items)} unindexed records")
+        unindexed_items = parallel_scan(
+            table,
+            segments=args.segments,
+            filter_expression=Attr('rekognitionFaceId').eq('N/A') | Attr('status').ne('indexed'),
+            capacity_per_second=args.capacity_per_second,
+            capacity_limit=args.capacity_limit,
+            checkpoint_file=args.checkpoint
+        )
         
+        i = 0
         for i, item in enumerate(unindexed_items, 1):
             face_id = item['faceId']
             name = f"{item.get('firstName', 'N/A')} {item.get('lastName', 'N/A')}"
-            s3_key = f"faces/{face_id}.jpg"
+            s3_key = image_key_for(item)
             
             print(f"\n{i}. Fixing: {name}")
             print(f"   Face ID: {face_id}")
@@ -46,7 +62,7 @@ def fix_unindexed_records():
                 # Try to index the face
                 try:
                     index_response = rekognition.index_faces(
-                        CollectionId=collection_id,
+                        CollectionId=collection_for(item.get('galleryShard', '')),
                         Image={'S3Object': {'Bucket': bucket_name, 'Name': s3_key}},
                         ExternalImageId=face_id,
                         MaxFaces=1,
@@ -61,12 +77,14 @@ def fix_unindexed_records():
                         # Update DynamoDB record
                         table.update_item(
                             Key={'faceId': face_id},
-                            UpdateExpression='SET rekognitionFaceId = :rek_id, #status = :status, s3Key = :s3_key',
+                            UpdateExpression='SET rekognitionFaceId = :rek_id, #status = :status, s3Key = :s3_key, '
+                                             'version = :version',
                             ExpressionAttributeNames={'#status': 'status'},
                             ExpressionAttributeValues={
                                 ':rek_id': rekognition_face_id,
                                 ':status': 'indexed',
-                                ':s3_key': s3_key
+                                ':s3_key': s3_key,
+                                ':version': new_version()
                             }
                         )
                         print(f"   ✅ DynamoDB record updated")
@@ -79,10 +97,13 @@ def fix_unindexed_records():
             except Exception as e:
                 print(f"   ❌ Error processing record: {str(e)}")
         
+        print(f"\nProcessed {i} unindexed records")
         print("\n" + "=" * 50)
         print("✅ Fix complete!")
         print("💡 Run the test again to verify all records are indexed")
         
+    except CapacityBudgetExhausted as e:
+        print(f"⏸️  {str(e)} (progress saved to {args.checkpoint})")
     except Exception as e:
         print(f"❌ Error: {str(e)}")
 
@@ -0,0 +1,97 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Gallery sharding configuration
+#   GALLERY_COLLECTION  base collection; also the shard for unsharded people
+#   GALLERY_SHARD_BY    'none', 'site', 'department' or 'hash'
+#   GALLERY_SHARDS      comma-separated shard names known to admin tools and
+#                       fan-out (for 'hash' the count is GALLERY_HASH_SHARDS)
+#   GALLERY_FAN_OUT     '1' to search the other shards when the home shard misses
+GALLERY_COLLECTION = os.environ.get("GALLERY_COLLECTION", "face-collection")
+GALLERY_SHARD_BY = os.environ.get("GALLERY_SHARD_BY", "none")
+GALLERY_HASH_SHARDS = int(os.environ.get("GALLERY_HASH_SHARDS", "8"))
+GALLERY_SHARDS = [s.strip() for s in os.environ.get("GALLERY_SHARDS", "").split(",") if s.strip()]
+GALLERY_FAN_OUT = os.environ.get("GALLERY_FAN_OUT", "1") == "1"
+GALLERY_SEARCH_WORKERS = int(os.environ.get("GALLERY_SEARCH_WORKERS", "8"))
+
+_search_pool = ThreadPoolExecutor(max_workers=GALLERY_SEARCH_WORKERS, thread_name_prefix="gallery")
+
+
+class UnknownShard(ValueError):
+    """A client named a site/department shard that is not in GALLERY_SHARDS"""
+
+
+def is_known_shard(shard):
+    """'' (the base collection) or one of the configured shards"""
+    return shard == "" or shard in all_shards()
+
+
+def shard_for_registration(data):
+    """
+    Pick the shard a new registration belongs to ('' is the base collection).
+    Client-supplied site/department names become collection IDs, so only
+    configured shards are accepted; others raise UnknownShard.
+    """
+    if GALLERY_SHARD_BY in ("site", "department"):
+        shard = data.get(GALLERY_SHARD_BY, "") or ""
+        if not is_known_shard(shard):
+            raise UnknownShard(f"Unknown {GALLERY_SHARD_BY}: {shard}")
+        return shard
+    if GALLERY_SHARD_BY == "hash":
+        user_id = f"{data.get('firstName', '')}_{data.get('lastName', '')}_{data.get('phoneNumber', '')}"
+        return f"h{int(hashlib.md5(user_id.encode()).hexdigest(), 16) % GALLERY_HASH_SHARDS}"
+    return ""
+
+
+def collection_for(shard):
+    return f"{GALLERY_COLLECTION}-{shard}" if shard else GALLERY_COLLECTION
+
+
+def all_shards():
+    """Every shard that may hold faces, the base collection ('') first"""
+    if GALLERY_SHARD_BY == "hash":
+        shards = [f"h{i}" for i in range(GALLERY_HASH_SHARDS)]
+    else:
+        shards = list(GALLERY_SHARDS)
+    return [""] + [s for s in shards if s]
+
+
+def all_collections():
+    return [collection_for(shard) for shard in all_shards()]
+
+
+def _search(rekognition, collection_id, image, max_faces, threshold):
+    try:
+        response = rekognition.search_faces_by_image(
+            CollectionId=collection_id,
+            Image=image,
+            MaxFaces=max_faces,
+            FaceMatchThreshold=threshold
+        )
+    except rekognition.exceptions.ResourceNotFoundException:
+        return []
+    return [dict(match, CollectionId=collection_id) for match in response.get("FaceMatches", [])]
+
+
+def search_gallery(rekognition, image, home_shard="", max_faces=1, threshold=80, fan_out=None):
+    """
+    Search the kiosk's home shard first; if it has no match and fan-out is
+    enabled, search every other shard concurrently and merge the matches by
+    similarity. Each match carries the CollectionId it came from. image is
+    raw bytes or a Rekognition Image dict (e.g. an S3Object source).
+    InvalidParameterException (no face in the image) propagates.
+    """
+    fan_out = GALLERY_FAN_OUT if fan_out is None else fan_out
+    image = image if isinstance(image, dict) else {"Bytes": image}
+    home = collection_for(home_shard)
+    matches = _search(rekognition, home, image, max_faces, threshold)
+    if matches or not fan_out:
+        return {"FaceMatches": matches, "SearchedCollections": 1}
+
+    others = [c for c in all_collections() if c != home]
+    futures = [_search_pool.submit(_search, rekognition, c, image, max_faces, threshold) for c in others]
+    for future in futures:
+        matches.extend(future.result())
+    matches.sort(key=lambda match: match["Similarity"], reverse=True)
+    return {"FaceMatches": matches[:max_faces], "SearchedCollections": 1 + len(others)}
@@ -0,0 +1,197 @@
+import hashlib
+import json
+import os
+import re
+import time
+
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+from json_response import dumps, lambda_response, request_header
+
+# Clients send an Idempotency-Key header (or "idempotencyKey" in the body)
+# and reuse it when retrying the same request. The first request with a key
+# claims it; replays get the stored response without repeating the work.
+IDEMPOTENCY_TABLE = os.environ.get("IDEMPOTENCY_TABLE", "idempotency-keys")
+IDEMPOTENCY_TTL = int(os.environ.get("IDEMPOTENCY_TTL", "86400"))  # seconds a response is replayed
+# A claim whose request never finished (crashed worker, timed-out Lambda) can
+# be taken over after this long
+IDEMPOTENCY_LOCK_TIMEOUT = int(os.environ.get("IDEMPOTENCY_LOCK_TIMEOUT", "60"))
+
+_KEY_PATTERN = re.compile(r"^[A-Za-z0-9_.:-]{8,128}$")
+
+
+class IdempotencyConflict(Exception):
+    """The key is in use by another in-flight request, or by a different request"""
+
+    def __init__(self, status_code, message, retry=False):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry = retry
+
+
+def fingerprint(request):
+    """Hash of the request payload, to catch a key reused for a different request"""
+    return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def idempotency_key(header_value, data):
+    key = header_value or (data or {}).get("idempotencyKey") or None
+    if key is not None and (not isinstance(key, str) or not _KEY_PATTERN.match(key)):
+        raise IdempotencyConflict(400, "Idempotency key must be 8-128 letters, digits or _.:-")
+    return key
+
+
+class DynamoIdempotencyStore:
+    """
+    Claims in a DynamoDB table keyed on idempotencyKey, with TTL enabled on
+    expiresAt (see create-idempotency-table.py)
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def claim(self, key, request_hash):
+        """
+        Claim key for this request. Returns None when claimed, otherwise the
+        record of the request that holds it
+        """
+        now = int(time.time())
+        for _ in range(2):
+            try:
+                self.table.put_item(
+                    Item={
+                        "idempotencyKey": key,
+                        "state": "in_progress",
+                        "fingerprint": request_hash,
+                        "lockedUntil": now + IDEMPOTENCY_LOCK_TIMEOUT,
+                        "expiresAt": now + IDEMPOTENCY_TTL
+                    },
+                    # TTL deletion lags, so expired and abandoned claims are taken over here
+                    ConditionExpression=(Attr("idempotencyKey").not_exists()
+                                         | Attr("expiresAt").lt(now)
+                                         | (Attr("state").eq("in_progress") & Attr("lockedUntil").lt(now)))
+                )
+                return None
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                    raise
+            item = self.table.get_item(Key={"idempotencyKey": key}, ConsistentRead=True).get("Item")
+            if item:
+                return {
+                    "state": item["state"],
+                    "fingerprint": item["fingerprint"],
+                    "statusCode": int(item.get("statusCode", 0)),
+                    "response": json.loads(item["response"]) if "response" in item else None
+                }
+            # Released between the put and the read: try again
+        raise IdempotencyConflict(409, "Idempotency key is busy, retry shortly", retry=True)
+
+    def complete(self, key, status_code, response):
+        self.table.update_item(
+            Key={"idempotencyKey": key},
+            UpdateExpression="SET #state = :complete, statusCode = :status, #response = :response",
+            ExpressionAttributeNames={"#state": "state", "#response": "response"},
+            ExpressionAttributeValues={
+                ":complete": "complete",
+                ":status": status_code,
+                ":response": dumps(response).decode("utf-8")
+            }
+        )
+
+    def release(self, key):
+        self.table.delete_item(Key={"idempotencyKey": key})
+
+
+class SQLiteIdempotencyStore:
+    """Claims in the edge database (the idempotency table of storage.EDGE_SCHEMA)"""
+
+    def __init__(self, connection):
+        self.connection = connection  # callable returning this thread's connection
+
+    def claim(self, key, request_hash):
+        now = int(time.time())
+        with self.connection() as db:
+            claimed = db.execute(
+                "INSERT INTO idempotency (key, state, fingerprint, locked_until, expires_at) "
+                "VALUES (?, 'in_progress', ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET state = excluded.state, fingerprint = excluded.fingerprint, "
+                "status_code = NULL, response = NULL, locked_until = excluded.locked_until, "
+                "expires_at = excluded.expires_at "
+                "WHERE idempotency.expires_at < ? OR (idempotency.state = 'in_progress' AND idempotency.locked_until < ?)",
+                (key, request_hash, now + IDEMPOTENCY_LOCK_TIMEOUT, now + IDEMPOTENCY_TTL, now, now)
+            ).rowcount
+            if claimed:
+                return None
+            state, stored_hash, status_code, response = db.execute(
+                "SELECT state, fingerprint, status_code, response FROM idempotency WHERE key = ?", (key,)
+            ).fetchone()
+        return {
+            "state": state,
+            "fingerprint": stored_hash,
+            "statusCode": status_code or 0,
+            "response": json.loads(response) if response else None
+        }
+
+    def complete(self, key, status_code, response):
+        with self.connection() as db:
+            db.execute("UPDATE idempotency SET state = 'complete', status_code = ?, response = ? WHERE key = ?",
+                       (status_code, dumps(response).decode("utf-8"), key))
+            # Keep the table small; expired keys are never replayed
+            db.execute("DELETE FROM idempotency WHERE expires_at < ?", (int(time.time()),))
+
+    def release(self, key):
+        with self.connection() as db:
+            db.execute("DELETE FROM idempotency WHERE key = ?", (key,))
+
+
+def run_idempotent(store, scope, key, request, handler):
+    """
+    Run handler() -> (status_code, response) at most once per key. Returns
+    (status_code, response, replayed). 5xx responses and exceptions release
+    the key so the client's retry does the work again; anything else is
+    stored and replayed. Raises IdempotencyConflict while another request
+    holds the key or when the key was used for a different request.
+    """
+    if not key:
+        status_code, response = handler()
+        return status_code, response, False
+    key = f"{scope}#{key}"
+    request_hash = fingerprint(request)
+    existing = store.claim(key, request_hash)
+    if existing is not None:
+        if existing["fingerprint"] != request_hash:
+            raise IdempotencyConflict(422, "Idempotency key was already used for a different request")
+        if existing["state"] != "complete":
+            raise IdempotencyConflict(409, "A request with this idempotency key is in progress", retry=True)
+        return existing["statusCode"], existing["response"], True
+
+    try:
+        status_code, response = handler()
+    except Exception:
+        store.release(key)
+        raise
+    if status_code >= 500:
+        store.release(key)
+    else:
+        store.complete(key, status_code, response)
+    return status_code, response, False
+
+
+def lambda_idempotent(store, scope, event, data, handler):
+    """run_idempotent for a Lambda handler() returning an API Gateway response"""
+    try:
+        key = idempotency_key(request_header(event, "Idempotency-Key"), data)
+        status_code, response, replayed = run_idempotent(
+            store, scope, key, data, lambda: _with_status(handler()))
+    except IdempotencyConflict as e:
+        headers = {"Retry-After": "1"} if e.retry else None
+        return lambda_response(e.status_code, {"success": False, "retry": e.retry, "error": str(e)},
+                               headers=headers)
+    if replayed:
+        response = dict(response, headers=dict(response.get("headers", {}), **{"Idempotent-Replayed": "true"}))
+    return response
+
+
+def _with_status(response):
+    return response["statusCode"], response
@@ -0,0 +1,112 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from botocore.exceptions import ClientError
+
+# Content-addressed layout: the S3 key is derived from the image bytes, so
+# resubmitting the same photo maps to the same object
+CONTENT_PREFIX = "faces/sha256/"
+# Browser uploads of transient verify frames (expire them with a lifecycle rule)
+UPLOAD_PREFIX = "uploads/"
+KNOWN_KEYS_CACHE_SIZE = int(os.environ.get("IMAGE_CACHE_SIZE", "10000"))
+
+_known_keys = OrderedDict()
+_known_keys_lock = threading.Lock()
+
+
+def content_key(image_bytes):
+    """
+    S3 key for an image. The bytes are hashed after base64/data-URL decoding,
+    so the transport encoding of a resubmitted photo does not matter.
+    """
+    return content_key_for_digest(hashlib.sha256(image_bytes).hexdigest())
+
+
+def content_key_for_digest(digest):
+    return f"{CONTENT_PREFIX}{digest[:2]}/{digest}.jpg"
+
+
+def is_content_key(key):
+    return bool(key) and key.startswith(CONTENT_PREFIX)
+
+
+def is_client_key(key):
+    """Keys a client may hand back after a direct upload"""
+    return isinstance(key, str) and ".." not in key and (is_content_key(key) or key.startswith(UPLOAD_PREFIX))
+
+
+def read_image(s3_client, bucket_name, key):
+    return s3_client.get_object(Bucket=bucket_name, Key=key)["Body"].read()
+
+
+def _remember(key):
+    with _known_keys_lock:
+        _known_keys[key] = True
+        _known_keys.move_to_end(key)
+        while len(_known_keys) > KNOWN_KEYS_CACHE_SIZE:
+            _known_keys.popitem(last=False)
+
+
+def _is_known(key):
+    with _known_keys_lock:
+        if key in _known_keys:
+            _known_keys.move_to_end(key)
+            return True
+    return False
+
+
+def object_exists(s3_client, bucket_name, key):
+    try:
+        s3_client.head_object(Bucket=bucket_name, Key=key)
+        return True
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+
+
+def put_image(s3_client, bucket_name, image_bytes, verify=False):
+    """
+    Store image_bytes under its content key unless it is already there.
+    Checks the in-process cache first, then a HEAD request. Returns
+    (key, uploaded).
+
+    The cache goes stale when another process deletes the object
+    (remove-faces.py, dedup-faces.py). verify=True always confirms with a
+    HEAD request; callers that trust the cache must call restore_image()
+    when S3 later reports the object missing.
+    """
+    key = content_key(image_bytes)
+    if (not verify and _is_known(key)) or object_exists(s3_client, bucket_name, key):
+        _remember(key)
+        return key, False
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=key,
+        Body=image_bytes,
+        ContentType="image/jpeg"
+    )
+    _remember(key)
+    return key, True
+
+
+def image_key_for(record):
+    """
+    S3 key of a metadata row's image. Rows written before content addressing
+    have no stored key and use the legacy faces/{faceId}.jpg layout.
+    """
+    return record.get("s3Key") or record.get("imageKey") or f"faces/{record['faceId']}.jpg"
+
+
+def forget(key):
+    """Drop a key from the cache after its object has been deleted"""
+    with _known_keys_lock:
+        _known_keys.pop(key, None)
+
+
+def restore_image(s3_client, bucket_name, image_bytes):
+    """Upload an image again after the cache claimed an object that is gone"""
+    forget(content_key(image_bytes))
+    return put_image(s3_client, bucket_name, image_bytes, verify=True)
@@ -0,0 +1,156 @@
+import base64
+import io
+import math
+import os
+import threading
+
+# NumPy and Pillow are optional (a Lambda layer may not ship them); without
+# them the quality gate lets every image through.
+try:
+    import numpy as np
+    from PIL import Image
+except ImportError:
+    np = None
+    Image = None
+
+# Quality gate configuration
+QUALITY_GATE_ENABLED = os.environ.get("QUALITY_GATE_ENABLED", "1") == "1"
+QUALITY_MIN_SHARPNESS = float(os.environ.get("QUALITY_MIN_SHARPNESS", "30"))
+QUALITY_MIN_BRIGHTNESS = float(os.environ.get("QUALITY_MIN_BRIGHTNESS", "40"))
+QUALITY_MAX_BRIGHTNESS = float(os.environ.get("QUALITY_MAX_BRIGHTNESS", "215"))
+QUALITY_MAX_CLIPPED = float(os.environ.get("QUALITY_MAX_CLIPPED", "0.35"))
+QUALITY_MIN_WIDTH = int(os.environ.get("QUALITY_MIN_WIDTH", "160"))
+QUALITY_MIN_HEIGHT = int(os.environ.get("QUALITY_MIN_HEIGHT", "160"))
+QUALITY_ANALYSIS_SIZE = int(os.environ.get("QUALITY_ANALYSIS_SIZE", "160"))
+
+REJECTION_MESSAGES = {
+    "unreadable_image": "The image could not be read. Please capture it again.",
+    "too_small": "The image is too small. Please move closer to the camera.",
+    "too_dark": "The image is too dark. Please improve the lighting and try again.",
+    "too_bright": "The image is overexposed. Please avoid direct light and try again.",
+    "too_blurry": "The image is blurry. Please hold still and try again.",
+}
+
+_counters = {"checked": 0, "rejected": 0, "savedCalls": 0}
+_counters_lock = threading.Lock()
+
+
+def decode_image_data(image_data):
+    """
+    Decode a base64 image, with or without a "data:image/jpeg;base64," prefix
+    """
+    # Slicing after the first comma avoids building the list split() returns
+    return base64.b64decode(image_data[image_data.find(",") + 1:])
+
+
+def load_grayscale(image_bytes, size=QUALITY_ANALYSIS_SIZE):
+    """
+    Decode image_bytes to a small grayscale float32 array. For JPEGs draft()
+    makes the decoder scale down by 1/2-1/8 in the DCT, so a full-size frame
+    is never materialised. Returns ((width, height), array).
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    original_size = image.size
+    image.draft("L", (size, size))
+    image = image.convert("L")
+    image.thumbnail((size, size))
+    return original_size, np.asarray(image, dtype=np.float32)
+
+
+def laplacian_variance(gray):
+    """Variance of the 4-neighbour Laplacian, a standard focus measure"""
+    laplacian = (gray[1:-1, :-2] + gray[1:-1, 2:] + gray[:-2, 1:-1] + gray[2:, 1:-1]
+                 - 4.0 * gray[1:-1, 1:-1])
+    return float(laplacian.var())
+
+
+def assess_image(image_bytes):
+    """Return (reason, metrics); reason is None when the image is usable"""
+    try:
+        (width, height), gray = load_grayscale(image_bytes)
+    except Exception:
+        return "unreadable_image", {}
+
+    metrics = {"width": width, "height": height}
+    if width < QUALITY_MIN_WIDTH or height < QUALITY_MIN_HEIGHT:
+        return "too_small", metrics
+
+    brightness = float(gray.mean())
+    clipped = float(np.count_nonzero((gray < 8) | (gray > 247))) / gray.size
+    metrics.update(brightness=round(brightness, 1), clipped=round(clipped, 3))
+    if brightness < QUALITY_MIN_BRIGHTNESS:
+        return "too_dark", metrics
+    if brightness > QUALITY_MAX_BRIGHTNESS or clipped > QUALITY_MAX_CLIPPED:
+        return "too_bright", metrics
+
+    sharpness = laplacian_variance(gray)
+    metrics["sharpness"] = round(sharpness, 1)
+    if sharpness < QUALITY_MIN_SHARPNESS:
+        return "too_blurry", metrics
+
+    # Kiosk framing puts the face in the middle of the frame, so focus there
+    # matters more than focus on the background
+    h, w = gray.shape
+    metrics["centerSharpness"] = round(laplacian_variance(gray[h // 4:h - h // 4, w // 4:w - w // 4]), 1)
+    return None, metrics
+
+
+def frame_score(metrics):
+    """Higher is better: centre focus first, overall focus, then exposure"""
+    exposure_penalty = abs(metrics["brightness"] - 128.0) / 128.0
+    return (0.6 * math.log1p(metrics["centerSharpness"]) + 0.4 * math.log1p(metrics["sharpness"])
+            - 2.0 * exposure_penalty - 2.0 * metrics["clipped"])
+
+
+def quality_gate_active():
+    """False when the gate is disabled or NumPy/Pillow are not installed"""
+    return QUALITY_GATE_ENABLED and np is not None
+
+
+def rank_frames(frames):
+    """
+    Score a burst of decoded frames locally. Returns (ranked, rejections):
+    ranked is a list of (score, index, metrics) best first, rejections maps
+    the index of each unusable frame to its reason. Without an active gate
+    the frames are returned unscored, in the order they were sent.
+    """
+    if not quality_gate_active():
+        return [(None, index, {}) for index in range(len(frames))], {}
+    ranked, rejections = [], {}
+    for index, image_bytes in enumerate(frames):
+        reason, metrics = assess_image(image_bytes)
+        if reason:
+            rejections[index] = reason
+        else:
+            ranked.append((round(frame_score(metrics), 3), index, metrics))
+    ranked.sort(key=lambda entry: entry[0], reverse=True)
+    return ranked, rejections
+
+
+def check_image_quality(image_bytes, saved_calls=1):
+    """
+    Run the local quality gate before any paid AWS call. Returns None when the
+    image may proceed, otherwise a dict with the rejection reason, a message
+    for the user and the measured metrics. saved_calls is the number of AWS
+    calls the caller skips when it rejects the image.
+    """
+    if not quality_gate_active():
+        return None
+
+    reason, metrics = assess_image(image_bytes)
+    record_quality_checks(1, 1 if reason else 0, saved_calls if reason else 0)
+    if not reason:
+        return None
+    return {"reason": reason, "message": REJECTION_MESSAGES[reason], "metrics": metrics}
+
+
+def record_quality_checks(checked, rejected, saved_calls):
+    with _counters_lock:
+        _counters["checked"] += checked
+        _counters["rejected"] += rejected
+        _counters["savedCalls"] += saved_calls
+
+
+def quality_counters():
+    with _counters_lock:
+        return dict(_counters)
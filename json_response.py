@@ -0,0 +1,217 @@
+import base64
+import gzip
+import hashlib
+import json
+import os
+from decimal import Decimal
+
+# orjson and brotli are optional; without them responses fall back to the
+# stdlib encoder and gzip
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies smaller than this are sent as-is (compression would not pay off)
+JSON_COMPRESS_MIN_BYTES = int(os.environ.get("JSON_COMPRESS_MIN_BYTES", "1024"))
+# Level 1 gets most of the size reduction on JSON at a fraction of the CPU
+# of the higher levels
+JSON_GZIP_LEVEL = int(os.environ.get("JSON_GZIP_LEVEL", "1"))
+JSON_BROTLI_QUALITY = int(os.environ.get("JSON_BROTLI_QUALITY", "4"))
+# Compressed Lambda responses are base64 bodies with isBase64Encoded. An HTTP
+# API decodes them as is; a REST API only does when the API's
+# binaryMediaTypes include "*/*" (see aws-deployment-guide.md), otherwise
+# clients receive the base64 text. Off until the API is set up for it.
+JSON_LAMBDA_COMPRESS = os.environ.get("JSON_LAMBDA_COMPRESS", "0") == "1"
+
+# CORS headers of every Lambda response. Kiosks send Idempotency-Key, so
+# preflights and every response (including 4xx/5xx, which the retry logic
+# reads) must allow it or the browser blocks them.
+CORS_HEADERS = {
+    "Access-Control-Allow-Origin": "*",
+    "Access-Control-Allow-Headers": "Content-Type, Idempotency-Key",
+    "Access-Control-Allow-Methods": "POST, OPTIONS"
+}
+
+# Fields callers can leave out of list responses with exclude=personal
+PERSONAL_FIELDS = ("dateOfBirth", "phoneNumber")
+
+
+def _default(obj):
+    # DynamoDB returns every number as Decimal and sets as Python sets
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+_encoder = json.JSONEncoder(default=_default, ensure_ascii=False, separators=(",", ":"))
+_sorted_encoder = json.JSONEncoder(default=_default, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+
+
+def dumps(obj):
+    """
+    Serialize obj to UTF-8 JSON bytes. The encoder runs in C and calls back
+    into Python only for values JSON has no type for (Decimal, set). That
+    hook is per value, as DecimalEncoder's was: converting the records in a
+    Python pass first measured slower on the stdlib encoder, so the gain
+    over it comes from orjson (see encode_records vs encode_records_stdlib
+    in benchmarks/bench_hot_paths.py).
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return _encoder.encode(obj).encode("utf-8")
+
+
+def etag(payload):
+    """
+    Validator for a response payload: a hash of it with keys sorted, so it
+    changes whenever any field of the records does. Also used on the version
+    attributes of person rows, which are much smaller than the rows
+    """
+    if orjson is not None:
+        body = orjson.dumps(payload, default=_default, option=orjson.OPT_SORT_KEYS)
+    else:
+        body = _sorted_encoder.encode(payload).encode("utf-8")
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def parse_fields(value):
+    """'a,b,c' (query string) or a list (JSON body) -> list of field names, or None"""
+    if not value:
+        return None
+    if isinstance(value, str):
+        value = value.split(",")
+    return [field.strip() for field in value if field.strip()] or None
+
+
+def parse_exclude(value):
+    """Like parse_fields; 'personal' stands for PERSONAL_FIELDS"""
+    fields = parse_fields(value) or []
+    expanded = []
+    for field in fields:
+        expanded.extend(PERSONAL_FIELDS if field == "personal" else (field,))
+    return expanded or None
+
+
+def project(records, fields=None, exclude=None):
+    """
+    Trim list records to fields if given, otherwise drop the excluded fields.
+    Without either, records are returned whole.
+    """
+    if fields:
+        return [{k: record[k] for k in fields if k in record} for record in records]
+    if exclude:
+        excluded = set(exclude)
+        return [{k: v for k, v in record.items() if k not in excluded} for record in records]
+    return records
+
+
+def negotiate_encoding(accept_encoding):
+    """Pick 'br' or 'gzip' from an Accept-Encoding header, or None"""
+    offered = {}
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            offered[name] = quality
+    if brotli is not None and offered.get("br", 0) > 0:
+        return "br"
+    if offered.get("gzip", offered.get("*", 0)) > 0:
+        return "gzip"
+    return None
+
+
+def compress(body, accept_encoding):
+    """Returns (body, encoding); encoding is None if body was left as-is"""
+    if len(body) < JSON_COMPRESS_MIN_BYTES:
+        return body, None
+    encoding = negotiate_encoding(accept_encoding)
+    if encoding == "br":
+        return brotli.compress(body, quality=JSON_BROTLI_QUALITY), "br"
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=JSON_GZIP_LEVEL), "gzip"
+    return body, None
+
+
+def request_header(event, name):
+    """Case-insensitive header lookup on an API Gateway proxy event"""
+    name = name.lower()
+    for key, value in ((event or {}).get("headers") or {}).items():
+        if key.lower() == name:
+            return value
+    return ""
+
+
+def is_preflight(event):
+    """True for a CORS preflight (OPTIONS) on a REST or HTTP API proxy event"""
+    event = event or {}
+    method = event.get("httpMethod") or ((event.get("requestContext") or {}).get("http") or {}).get("method")
+    return method == "OPTIONS"
+
+
+def preflight_response():
+    return {"statusCode": 204, "headers": dict(CORS_HEADERS), "body": ""}
+
+
+def lambda_response(status_code, payload, event=None, headers=None):
+    """
+    API Gateway proxy response. With JSON_LAMBDA_COMPRESS=1, large bodies
+    are compressed when the request accepts it and returned base64-encoded.
+    """
+    body, encoding = dumps(payload), None
+    if JSON_LAMBDA_COMPRESS:
+        body, encoding = compress(body, request_header(event, "Accept-Encoding"))
+    response_headers = {"Content-Type": "application/json", **CORS_HEADERS}
+    response_headers.update(headers or {})
+    if encoding:
+        response_headers["Content-Encoding"] = encoding
+        response_headers["Vary"] = "Accept-Encoding"
+        return {
+            "statusCode": status_code,
+            "headers": response_headers,
+            "isBase64Encoded": True,
+            "body": base64.b64encode(body).decode("ascii")
+        }
+    return {
+        "statusCode": status_code,
+        "headers": response_headers,
+        "body": body.decode("utf-8")
+    }
+
+
+def init_app(app):
+    """
+    Serve a Flask app's jsonify through dumps and compress its large JSON
+    responses the same way lambda_response does
+    """
+    from flask import request
+    from flask.json.provider import DefaultJSONProvider
+
+    class FastJSONProvider(DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            return dumps(obj).decode("utf-8")
+
+    app.json = FastJSONProvider(app)
+
+    @app.after_request
+    def compress_response(response):
+        if response.mimetype != "application/json" or response.direct_passthrough \
+                or "Content-Encoding" in response.headers:
+            return response
+        body, encoding = compress(response.get_data(), request.headers.get("Accept-Encoding", ""))
+        if encoding:
+            response.set_data(body)
+            response.headers["Content-Encoding"] = encoding
+            response.vary.add("Accept-Encoding")
+        return response
@@ -0,0 +1,110 @@
+import json
+import os
+import random
+import sys
+import time
+
+# Logging configuration (override per function via environment variables)
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+LOG_LEVEL = LEVELS.get(os.environ.get("LOG_LEVEL", "INFO").upper(), 20)
+DEBUG_SAMPLE_RATE = float(os.environ.get("LOG_DEBUG_SAMPLE_RATE", "0.01"))
+MAX_FIELD_LENGTH = int(os.environ.get("LOG_MAX_FIELD_LENGTH", "256"))
+MAX_DEPTH = 6
+
+# Keys whose values are always image payloads, never worth logging verbatim
+BINARY_KEYS = {"image", "images", "frames", "Bytes", "body"}
+
+
+def truncate(value, depth=0):
+    """
+    Return a log-safe copy of value: bytes, data URLs and long strings are
+    replaced with a short description so image payloads never reach the logs
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, str):
+        if value.startswith("data:") and "," in value:
+            return f"<data-url {value.split(',', 1)[0]} {len(value)} chars>"
+        if len(value) > MAX_FIELD_LENGTH:
+            return f"{value[:64]}...<{len(value)} chars>"
+        return value
+    if depth >= MAX_DEPTH:
+        return "<nested>"
+    if isinstance(value, dict):
+        return {
+            k: (f"<{len(v)} chars>" if k in BINARY_KEYS and isinstance(v, str) and len(v) > MAX_FIELD_LENGTH
+                else truncate(v, depth + 1))
+            for k, v in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        if len(value) > 20:
+            return [truncate(v, depth + 1) for v in value[:20]] + [f"<{len(value) - 20} more>"]
+        return [truncate(v, depth + 1) for v in value]
+    return value
+
+
+def summarize_event(event):
+    """Describe an API Gateway / direct invocation event without its payload"""
+    if not isinstance(event, dict):
+        return {"eventType": type(event).__name__}
+    body = event.get("body")
+    summary = {
+        "httpMethod": event.get("httpMethod"),
+        "path": event.get("path") or event.get("rawPath"),
+        "isBase64Encoded": event.get("isBase64Encoded", False),
+        "bodyLength": len(body) if isinstance(body, (str, bytes)) else None,
+        "keys": sorted(event.keys())[:20],
+    }
+    return {k: v for k, v in summary.items() if v is not None}
+
+
+class StructuredLogger:
+    """
+    Emits one JSON object per line on stdout (CloudWatch picks these up as-is).
+    Debug records are only written for the sampled fraction of invocations,
+    unless LOG_LEVEL=DEBUG.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.context = {}
+        self.sampled = False
+
+    def begin(self, context=None, **fields):
+        """Start a new invocation: reset context and roll the debug sample"""
+        self.context = dict(fields)
+        request_id = getattr(context, "aws_request_id", None)
+        if request_id:
+            self.context["requestId"] = request_id
+        self.sampled = DEBUG_SAMPLE_RATE > 0 and random.random() < DEBUG_SAMPLE_RATE
+        return self
+
+    def is_enabled(self, level):
+        if level == "DEBUG" and self.sampled:
+            return True
+        return LEVELS[level] >= LOG_LEVEL
+
+    def log(self, level, message, **fields):
+        if not self.is_enabled(level):
+            return
+        record = {"ts": round(time.time(), 3), "level": level, "logger": self.name, "msg": message}
+        record.update(self.context)
+        if fields:
+            record.update(truncate(fields))
+        sys.stdout.write(json.dumps(record, default=str, ensure_ascii=False) + "\n")
+
+    def debug(self, message, **fields):
+        self.log("DEBUG", message, **fields)
+
+    def info(self, message, **fields):
+        self.log("INFO", message, **fields)
+
+    def warning(self, message, **fields):
+        self.log("WARNING", message, **fields)
+
+    def error(self, message, **fields):
+        self.log("ERROR", message, **fields)
+
+
+def get_logger(name):
+    return StructuredLogger(name)
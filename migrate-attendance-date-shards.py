@@ -0,0 +1,161 @@
+import argparse
+import boto3
+import time
+from boto3.dynamodb.conditions import Attr
+from storage import (ATTENDANCE_DATE_INDEX, ATTENDANCE_DATE_SHARDS, ATTENDANCE_SHARD_INDEX, ATTENDANCE_TABLE,
+                     date_shard)
+from table_scan import SCAN_SEGMENTS, CapacityBudgetExhausted, parallel_scan
+
+def wait_for_indexes(client, table_name):
+    """DynamoDB builds or deletes one GSI at a time; wait until the table is settled"""
+    while True:
+        table = client.describe_table(TableName=table_name)['Table']
+        statuses = [index['IndexStatus'] for index in table.get('GlobalSecondaryIndexes', [])]
+        if table['TableStatus'] == 'ACTIVE' and all(status == 'ACTIVE' for status in statuses):
+            return
+        time.sleep(10)
+
+def migrate_attendance_date_shards():
+    """
+    Move attendance-records from the single-partition date-index to the
+    sharded dateShard-index:
+
+      1. run this script: it creates dateShard-index (dateShard + timestamp)
+         and backfills dateShard on every existing row
+      2. rerun it until the backfill reports no more rows: rows written by
+         the still-unsharded deployment in the meantime are picked up too
+      3. deploy with ATTENDANCE_DATE_SHARDS set to the same --shards count
+      4. rerun once more to cover rows written during the deployment, then
+         with --drop-date-index
+
+    ATTENDANCE_DATE_SHARDS switches readers and writers together, so set it
+    only after the backfill is complete: dated reads then query
+    dateShard-index only, and miss any row that has no dateShard yet.
+    Until then the deployment keeps using date-index and works throughout.
+    The backfill only touches rows without dateShard, so the script can be
+    rerun at any step.
+    """
+    parser = argparse.ArgumentParser(description="Shard the attendance date index")
+    parser.add_argument('--shards', type=int, default=ATTENDANCE_DATE_SHARDS or 8,
+                        help="shard count; must match ATTENDANCE_DATE_SHARDS of the deployment (default 8)")
+    parser.add_argument('--segments', type=int, default=SCAN_SEGMENTS, help="parallel scan segments")
+    parser.add_argument('--capacity-per-second', type=float, help="read capacity units per second the scan may use")
+    parser.add_argument('--capacity-limit', type=float, help="stop after this many read capacity units (rerun to resume)")
+    parser.add_argument('--checkpoint', default='migrate-attendance-date-shards.checkpoint.json',
+                        help="scan progress file; an interrupted run resumes from it")
+    parser.add_argument('--drop-date-index', action='store_true',
+                        help="delete the old date-index once the backfill is complete")
+    args = parser.parse_args()
+
+    if args.shards < 1:
+        parser.error("--shards must be at least 1")
+
+    dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+    client = dynamodb.meta.client
+    table_name = ATTENDANCE_TABLE
+
+    try:
+        description = client.describe_table(TableName=table_name)['Table']
+        existing = {index['IndexName'] for index in description.get('GlobalSecondaryIndexes', [])}
+        provisioned = description.get('BillingModeSummary', {}).get('BillingMode', 'PROVISIONED') == 'PROVISIONED'
+
+        if ATTENDANCE_SHARD_INDEX in existing:
+            print(f"Index {ATTENDANCE_SHARD_INDEX} already exists.")
+        else:
+            index = {
+                'IndexName': ATTENDANCE_SHARD_INDEX,
+                'KeySchema': [
+                    {
+                        'AttributeName': 'dateShard',
+                        'KeyType': 'HASH'
+                    },
+                    {
+                        'AttributeName': 'timestamp',
+                        'KeyType': 'RANGE'
+                    }
+                ],
+                'Projection': {
+                    'ProjectionType': 'ALL'
+                }
+            }
+            if provisioned:
+                # Every table write is also an index write, and an index with
+                # less write capacity than its table throttles the table
+                throughput = description['ProvisionedThroughput']
+                index['ProvisionedThroughput'] = {
+                    'ReadCapacityUnits': throughput['ReadCapacityUnits'],
+                    'WriteCapacityUnits': throughput['WriteCapacityUnits']
+                }
+                print(f"💡 {table_name} is provisioned: the index gets the table's "
+                      f"{throughput['WriteCapacityUnits']} WCU, shared by all {args.shards} shards. "
+                      f"Sharding only helps once that covers the burst (or the table is on-demand).")
+
+            print(f"Creating index {ATTENDANCE_SHARD_INDEX}...")
+            client.update_table(
+                TableName=table_name,
+                AttributeDefinitions=[
+                    {
+                        'AttributeName': 'dateShard',
+                        'AttributeType': 'S'
+                    },
+                    {
+                        'AttributeName': 'timestamp',
+                        'AttributeType': 'S'
+                    }
+                ],
+                GlobalSecondaryIndexUpdates=[{'Create': index}]
+            )
+            wait_for_indexes(client, table_name)
+            print(f"Index {ATTENDANCE_SHARD_INDEX} created successfully!")
+
+        # Backfill dateShard on rows written before the deployment set it
+        print(f"🔧 Backfilling dateShard ({args.shards} shards)...")
+        table = dynamodb.Table(table_name)
+        rows = parallel_scan(
+            table,
+            segments=args.segments,
+            projection='attendanceId, #date',
+            expression_names={'#date': 'date'},
+            filter_expression=Attr('dateShard').not_exists() & Attr('date').exists(),
+            capacity_per_second=args.capacity_per_second,
+            capacity_limit=args.capacity_limit,
+            checkpoint_file=args.checkpoint
+        )
+        updated = 0
+        for item in rows:
+            table.update_item(
+                Key={'attendanceId': item['attendanceId']},
+                UpdateExpression='SET dateShard = if_not_exists(dateShard, :shard)',
+                ExpressionAttributeValues={':shard': date_shard(item, args.shards)}
+            )
+            updated += 1
+            if updated % 1000 == 0:
+                print(f"   {updated} rows...")
+        print(f"✅ Backfilled {updated} records.")
+        if updated == 0:
+            print(f"💡 Backfill complete: deploy with ATTENDANCE_DATE_SHARDS={args.shards}")
+        else:
+            print("💡 Rerun until no rows are left before setting ATTENDANCE_DATE_SHARDS")
+
+        if args.drop_date_index:
+            if ATTENDANCE_DATE_INDEX not in existing:
+                print(f"Index {ATTENDANCE_DATE_INDEX} already removed.")
+            else:
+                print(f"Deleting index {ATTENDANCE_DATE_INDEX}...")
+                client.update_table(
+                    TableName=table_name,
+                    GlobalSecondaryIndexUpdates=[{'Delete': {'IndexName': ATTENDANCE_DATE_INDEX}}]
+                )
+                wait_for_indexes(client, table_name)
+                print(f"Index {ATTENDANCE_DATE_INDEX} deleted.")
+        elif ATTENDANCE_DATE_INDEX in existing:
+            print(f"💡 {ATTENDANCE_DATE_INDEX} still takes every write of the day; "
+                  f"rerun with --drop-date-index once all readers use {ATTENDANCE_SHARD_INDEX}")
+
+    except CapacityBudgetExhausted as e:
+        print(f"⏸️  {str(e)} (progress saved to {args.checkpoint})")
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+
+if __name__ == "__main__":
+    migrate_attendance_date_shards()
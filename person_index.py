@@ -0,0 +1,131 @@
+import re
+import unicodedata
+import uuid
+
+from boto3.dynamodb.conditions import Attr, Key
+
+from image_store import forget, is_content_key
+from table_scan import parallel_scan
+
+# face-metadata secondary indexes (created by create-metadata-indexes.py).
+# Index key attributes are only written when non-empty, so rows without a
+# phone number simply do not appear in phoneKey-index.
+NAME_INDEX = "nameKey-index"
+PHONE_INDEX = "phoneKey-index"
+IMAGE_INDEX = "s3Key-index"
+
+
+def normalize_name(first_name, last_name=""):
+    """'  José  DE la Cruz' -> 'jose de la cruz' (case, accents and spacing folded)"""
+    text = unicodedata.normalize("NFKD", f"{first_name} {last_name}")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(text.lower().split())
+
+
+def normalize_phone(phone_number):
+    """Digits only, so '+1 (555) 010-2000' and '15550102000' match"""
+    return re.sub(r"\D", "", phone_number or "")
+
+
+def new_version():
+    """
+    Value for a metadata row's version attribute, replaced on every write so
+    the HTTP validators of person lookups can be taken from it
+    """
+    return uuid.uuid4().hex
+
+
+def search_keys(first_name, last_name, phone_number):
+    """Index attributes to store on a metadata row"""
+    keys = {}
+    name_key = normalize_name(first_name, last_name)
+    if name_key:
+        keys["nameKey"] = name_key
+    phone_key = normalize_phone(phone_number)
+    if phone_key:
+        keys["phoneKey"] = phone_key
+    return keys
+
+
+def get_person(table, face_id):
+    """Metadata row by faceId (primary key), or None"""
+    if not face_id:
+        return None
+    return table.get_item(Key={"faceId": face_id}).get("Item")
+
+
+def query_index(table, index_name, attribute, value, page_size=25):
+    """
+    Yield pages (lists of rows) whose index attribute equals value. Pages are
+    fetched only as the caller consumes them.
+    """
+    params = {
+        "IndexName": index_name,
+        "KeyConditionExpression": Key(attribute).eq(value),
+        "Limit": page_size
+    }
+    while True:
+        response = table.query(**params)
+        if response.get("Items"):
+            yield response["Items"]
+        if "LastEvaluatedKey" not in response:
+            return
+        params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def find_by_name(table, name, page_size=25):
+    return query_index(table, NAME_INDEX, "nameKey", normalize_name(name), page_size)
+
+
+def find_by_phone(table, phone_number, page_size=25):
+    return query_index(table, PHONE_INDEX, "phoneKey", normalize_phone(phone_number), page_size)
+
+
+def image_is_referenced(table, s3_key, attached_keys=None):
+    """
+    True if any metadata row still stores s3_key, as its own image or in
+    additionalImages (images attached by DUPLICATE_POLICY=attach or merged
+    by dedup-faces.py). additionalImages is a list, which no index can key
+    on, so it is checked with a scan; callers deleting many images pass
+    attached_keys (from attached_image_keys) to scan once instead.
+    """
+    response = table.query(
+        IndexName=IMAGE_INDEX,
+        KeyConditionExpression=Key("s3Key").eq(s3_key),
+        Limit=1
+    )
+    if response.get("Items"):
+        return True
+    if attached_keys is not None:
+        return s3_key in attached_keys
+    params = {"FilterExpression": Attr("additionalImages").contains(s3_key), "ProjectionExpression": "faceId"}
+    while True:
+        response = table.scan(**params)
+        if response.get("Items"):
+            return True
+        if "LastEvaluatedKey" not in response:
+            return False
+        params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def attached_image_keys(table, exclude=()):
+    """Every key listed in some row's additionalImages, leaving out the rows whose faceId is in exclude"""
+    keys = set()
+    for item in parallel_scan(table, projection="faceId, additionalImages",
+                              filter_expression=Attr("additionalImages").exists()):
+        if item["faceId"] not in exclude:
+            keys.update(item.get("additionalImages", []))
+    return keys
+
+
+def delete_image_if_unreferenced(table, s3_client, bucket_name, s3_key, attached_keys=None):
+    """
+    Content-addressed images can be shared by several records, so only
+    delete the object once no remaining record points at it (as its image
+    or one of its additionalImages)
+    """
+    if is_content_key(s3_key) and image_is_referenced(table, s3_key, attached_keys):
+        return False
+    s3_client.delete_object(Bucket=bucket_name, Key=s3_key)
+    forget(s3_key)
+    return True
@@ -17,7 +17,9 @@ class FaceRegister {
         // AWS Configuration
         this.awsConfig = {
             region: 'us-east-1',
-            apiGatewayUrl: 'https://58z5i6ahil.execute-api.us-east-1.amazonaws.com/prod' // Replace with your actual API Gateway URL
+            apiGatewayUrl: 'https://58z5i6ahil.execute-api.us-east-1.amazonaws.com/prod', // Replace with your actual API Gateway URL
+            galleryShard: '', // This kiosk's site/department gallery shard ('' = default collection)
+            directUpload: true // Upload images to S3 with a presigned URL instead of inline base64
         };
 
         this.initializeEventListeners();
@@ -147,6 +149,7 @@ class FaceRegister {
             lastName: formData.get('lastName'),
             dateOfBirth: formData.get('dateOfBirth'),
             phoneNumber: formData.get('phoneNumber'),
+            site: this.awsConfig.galleryShard,
             image: this.capturedImage
         };
         
@@ -184,15 +187,95 @@ class FaceRegister {
         }
     }
     
+    // Upload the captured JPEG straight to S3 with a presigned URL so the
+    // API request carries only the object key
+    async uploadImage(dataUrl) {
+        const blob = await (await fetch(dataUrl)).blob();
+        const digest = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+        const sha256 = Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+        
+        const response = await fetch(`${this.awsConfig.apiGatewayUrl}/upload-url`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ purpose: 'register', sha256 })
+        });
+        if (!response.ok) {
+            throw new Error(`Upload URL error! status: ${response.status}`);
+        }
+        const upload = await response.json();
+        
+        // Same photo already stored: nothing to upload
+        if (!upload.exists) {
+            const put = await fetch(upload.uploadUrl, { method: 'PUT', headers: upload.headers, body: blob });
+            if (!put.ok) {
+                throw new Error(`S3 upload failed! status: ${put.status}`);
+            }
+        }
+        return upload.s3Key;
+    }
+    
+    newIdempotencyKey() {
+        if (crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 12)}`;
+    }
+    
+    // POST JSON, retrying network errors, 5xx and "in progress" answers
+    // with the same Idempotency-Key
+    async postWithRetry(url, payload, idempotencyKey, attempts = 3) {
+        for (let attempt = 1; ; attempt++) {
+            try {
+                const response = await fetch(url, {
+                    method: 'POST',
+                    headers: {
+                        'Content-Type': 'application/json',
+                        'Idempotency-Key': idempotencyKey,
+                    },
+                    body: JSON.stringify(payload)
+                });
+                const retryable = response.status >= 500 ||
+                    (response.status === 409 && (await response.clone().json().catch(() => ({}))).retry);
+                if (!retryable || attempt >= attempts) {
+                    return response;
+                }
+            } catch (error) {
+                if (attempt >= attempts) {
+                    throw error;
+                }
+            }
+            await new Promise(resolve => setTimeout(resolve, 500 * 2 ** (attempt - 1)));
+        }
+    }
+    
     async registerFaceAPI(userData) {
+        let payload = userData;
+        if (this.awsConfig.directUpload) {
+            try {
+                const { image, ...fields } = userData;
+                payload = { ...fields, s3Key: await this.uploadImage(image) };
+            } catch (error) {
+                // Fall back to sending the image in the request body
+                console.warn('Direct upload failed, sending image inline:', error);
+            }
+        }
+        
         try {
-            const response = await fetch(`${this.awsConfig.apiGatewayUrl}/register`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                },
-                body: JSON.stringify(userData)
-            });
+            // One key per registration: retries reuse it, so the server
+            // replays its first answer instead of indexing the face again
+            const response = await this.postWithRetry(
+                `${this.awsConfig.apiGatewayUrl}/register`, payload, this.newIdempotencyKey());
+            
+            // Image rejected by the server-side quality check (recapture),
+            // or the person is already registered
+            if (response.status === 400 || response.status === 409) {
+                const rejected = await response.json();
+                if (rejected.reason || rejected.existingFaceId) {
+                    return rejected;
+                }
+            }
             
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
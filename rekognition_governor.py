@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+
+# Governor configuration. REKOGNITION_TPS is this process's share of the
+# account's transactions-per-second limit (account TPS / concurrent processes).
+REKOGNITION_TPS = float(os.environ.get("REKOGNITION_TPS", "5"))
+REKOGNITION_BURST = float(os.environ.get("REKOGNITION_BURST", "5"))
+REKOGNITION_MIN_TPS = float(os.environ.get("REKOGNITION_MIN_TPS", "0.5"))
+REKOGNITION_MAX_RETRIES = int(os.environ.get("REKOGNITION_MAX_RETRIES", "4"))
+REKOGNITION_MAX_WAIT = float(os.environ.get("REKOGNITION_MAX_WAIT", "5"))  # seconds in the queue
+REKOGNITION_BACKOFF_BASE = float(os.environ.get("REKOGNITION_BACKOFF_BASE", "0.1"))
+
+THROTTLE_CODES = {"ThrottlingException", "ProvisionedThroughputExceededException", "LimitExceededException"}
+
+# Read-only calls whose concurrent identical requests share one in-flight call
+COALESCED_OPERATIONS = {"search_faces_by_image", "search_faces", "detect_faces"}
+GOVERNED_OPERATIONS = COALESCED_OPERATIONS | {"index_faces", "list_faces", "delete_faces"}
+
+
+class RekognitionThrottled(Exception):
+    """Raised when Rekognition is still throttling after all retries"""
+
+
+def is_throttle(error):
+    code = getattr(error, "response", {}).get("Error", {}).get("Code")
+    return code in THROTTLE_CODES
+
+
+class TokenBucket:
+    """
+    Token bucket whose refill rate backs off multiplicatively on throttles
+    and recovers additively on success (AIMD)
+    """
+
+    def __init__(self, rate, burst):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, max_wait):
+        """Take a token, sleeping as needed. Returns seconds waited."""
+        started = time.monotonic()
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return now - started
+                delay = (1 - self.tokens) / self.rate
+            if now - started + delay > max_wait:
+                raise RekognitionThrottled(f"Rekognition queue wait exceeded {max_wait}s")
+            time.sleep(delay)
+
+    def on_throttle(self):
+        with self.lock:
+            self.rate = max(REKOGNITION_MIN_TPS, self.rate / 2)
+
+    def on_success(self):
+        with self.lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + 0.1 * self.max_rate)
+
+
+def request_key(operation, kwargs):
+    """Identity of a request: image bytes are replaced by their hash"""
+    normalized = dict(kwargs)
+    image = normalized.get("Image")
+    if image and "Bytes" in image:
+        normalized["Image"] = {"sha256": hashlib.sha256(image["Bytes"]).hexdigest()}
+    return operation + ":" + json.dumps(normalized, sort_keys=True, default=str)
+
+
+class RekognitionGovernor:
+    def __init__(self, rate=REKOGNITION_TPS, burst=REKOGNITION_BURST):
+        self.bucket = TokenBucket(rate, burst)
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.metrics = {"calls": 0, "coalesced": 0, "throttles": 0, "throttledOut": 0,
+                        "queueWaitMsTotal": 0.0, "queueWaitMsMax": 0.0}
+
+    def _count(self, name, amount=1):
+        with self.lock:
+            self.metrics[name] += amount
+
+    def _execute(self, fn, kwargs):
+        for attempt in range(REKOGNITION_MAX_RETRIES + 1):
+            try:
+                waited_ms = self.bucket.acquire(REKOGNITION_MAX_WAIT) * 1000
+            except RekognitionThrottled:
+                self._count("throttledOut")
+                raise
+            with self.lock:
+                self.metrics["calls"] += 1
+                self.metrics["queueWaitMsTotal"] += waited_ms
+                self.metrics["queueWaitMsMax"] = max(self.metrics["queueWaitMsMax"], waited_ms)
+            try:
+                result = fn(**kwargs)
+            except Exception as e:
+                if not is_throttle(e):
+                    raise
+                self._count("throttles")
+                self.bucket.on_throttle()
+                if attempt == REKOGNITION_MAX_RETRIES:
+                    self._count("throttledOut")
+                    raise RekognitionThrottled(str(e)) from e
+                # Full-jitter exponential backoff
+                time.sleep(random.uniform(0, REKOGNITION_BACKOFF_BASE * (2 ** attempt)))
+                continue
+            self.bucket.on_success()
+            return result
+
+    def call(self, operation, fn, kwargs):
+        if operation not in COALESCED_OPERATIONS:
+            return self._execute(fn, kwargs)
+
+        key = request_key(operation, kwargs)
+        with self.lock:
+            flight = self.in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.in_flight[key] = Future()
+            else:
+                self.metrics["coalesced"] += 1
+        if not leader:
+            return flight.result()
+
+        try:
+            result = self._execute(fn, kwargs)
+            flight.set_result(result)
+            return result
+        except BaseException as e:
+            flight.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.in_flight.pop(key, None)
+
+    def snapshot(self):
+        with self.lock:
+            metrics = dict(self.metrics)
+        metrics["queueWaitMsTotal"] = round(metrics["queueWaitMsTotal"], 1)
+        metrics["queueWaitMsMax"] = round(metrics["queueWaitMsMax"], 1)
+        metrics["currentTps"] = round(self.bucket.rate, 2)
+        return metrics
+
+
+class GovernedRekognition:
+    """Rekognition client wrapper that routes recognizer calls through a governor"""
+
+    def __init__(self, client, governor):
+        self._client = client
+        self._governor = governor
+        self.exceptions = client.exceptions
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name not in GOVERNED_OPERATIONS:
+            return attr
+        return lambda **kwargs: self._governor.call(name, attr, kwargs)
+
+
+# One governor per process, shared by every client it wraps
+GOVERNOR = RekognitionGovernor()
+
+
+def governed(client):
+    return GovernedRekognition(client, GOVERNOR)
+
+
+def governor_metrics():
+    return GOVERNOR.snapshot()
@@ -1,73 +1,51 @@
 import boto3
-import json
+from boto3.dynamodb.conditions import Attr
+from gallery import GALLERY_COLLECTION, all_collections, collection_for
+from image_store import image_key_for
+from person_index import attached_image_keys, delete_image_if_unreferenced, find_by_name, find_by_phone, get_person
+from storage import AWS_REGION, BUCKET_NAME, METADATA_TABLE
+from table_scan import parallel_scan
+
+PAGE_SIZE = 10
 
 def remove_faces():
     """
     Remove faces from both Rekognition collection and DynamoDB
     """
     try:
-        rekognition = boto3.client('rekognition', region_name='us-east-1')
-        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
-        s3_client = boto3.client('s3', region_name='us-east-1')
+        rekognition = boto3.client('rekognition', region_name=AWS_REGION)
+        dynamodb = boto3.resource('dynamodb', region_name=AWS_REGION)
+        s3_client = boto3.client('s3', region_name=AWS_REGION)
         
-        collection_id = 'face-collection'
-        bucket_name = 'facial-recognition-data-bucket'
+        collection_id = GALLERY_COLLECTION
+        bucket_name = BUCKET_NAME
         
         print("🗑️ Face Removal Tool")
         print("=" * 50)
         
-        # Get all faces from Rekognition
-        print("1. Getting faces from Rekognition collection...")
-        try:
-            list_response = rekognition.list_faces(CollectionId=collection_id)
-            rekognition_faces = list_response.get('Faces', [])
-            print(f"   Found {len(rekognition_faces)} faces in Rekognition")
-            
-            for i, face in enumerate(rekognition_faces, 1):
-                print(f"   {i}. Face ID: {face['FaceId']}")
-                print(f"      External ID: {face.get('ExternalImageId', 'N/A')}")
-        except Exception as e:
-            print(f"   ❌ Error: {str(e)}")
-            return
-        
-        # Get all records from DynamoDB
-        print("\n2. Getting records from DynamoDB...")
-        try:
-            table = dynamodb.Table('face-metadata')
-            response = table.scan()
-            db_records = response.get('Items', [])
-            print(f"   Found {len(db_records)} records in DynamoDB")
-            
-            for i, record in enumerate(db_records, 1):
-                name = f"{record.get('firstName', 'N/A')} {record.get('lastName', 'N/A')}"
-                face_id = record.get('faceId', 'N/A')
-                rekognition_id = record.get('rekognitionFaceId', 'N/A')
-                print(f"   {i}. {name}")
-                print(f"      Face ID: {face_id}")
-                print(f"      Rekognition ID: {rekognition_id}")
-        except Exception as e:
-            print(f"   ❌ Error: {str(e)}")
-            return
-        
-        # Show removal options
-        print("\n3. Removal Options:")
+        # Targeted removals look people up through the metadata indexes
+        # (create-metadata-indexes.py) instead of listing everyone
+        print("Removal Options:")
         print("   a) Remove ALL faces (nuclear option)")
         print("   b) Remove specific face by name")
         print("   c) Remove specific face by Face ID")
         print("   d) Remove unindexed faces only")
-        print("   e) Exit")
+        print("   e) Remove specific face by phone number")
+        print("   f) Exit")
         
-        choice = input("\nEnter your choice (a/b/c/d/e): ").lower().strip()
+        choice = input("\nEnter your choice (a/b/c/d/e/f): ").lower().strip()
         
         if choice == 'a':
             remove_all_faces(rekognition, dynamodb, s3_client, collection_id, bucket_name)
         elif choice == 'b':
-            remove_by_name(dynamodb, rekognition, s3_client, collection_id, bucket_name, db_records)
+            remove_by_name(dynamodb, rekognition, s3_client, collection_id, bucket_name)
         elif choice == 'c':
-            remove_by_face_id(dynamodb, rekognition, s3_client, collection_id, bucket_name, db_records)
+            remove_by_face_id(dynamodb, rekognition, s3_client, collection_id, bucket_name)
         elif choice == 'd':
-            remove_unindexed_faces(dynamodb, s3_client, bucket_name, db_records)
+            remove_unindexed_faces(dynamodb, s3_client, bucket_name)
         elif choice == 'e':
+            remove_by_phone(dynamodb, rekognition, s3_client, collection_id, bucket_name)
+        elif choice == 'f':
             print("Exiting...")
             return
         else:
@@ -87,77 +65,122 @@ def remove_all_faces(rekognition, dynamodb, s3_client, collection_id, bucket_nam
         return
     
     try:
-        # Delete collection (removes all faces)
-        rekognition.delete_collection(CollectionId=collection_id)
-        print("✅ Rekognition collection deleted")
+        # Delete every gallery shard (removes all faces)
+        for shard_collection in all_collections():
+            try:
+                rekognition.delete_collection(CollectionId=shard_collection)
+                print(f"✅ Rekognition collection deleted: {shard_collection}")
+            except rekognition.exceptions.ResourceNotFoundException:
+                pass
         
-        # Recreate empty collection
+        # Recreate empty base collection (shards are recreated on registration)
         rekognition.create_collection(CollectionId=collection_id)
         print("✅ New empty collection created")
         
         # Delete all DynamoDB records
-        table = dynamodb.Table('face-metadata')
-        response = table.scan()
-        items = response.get('Items', [])
-        
-        for item in items:
+        table = dynamodb.Table(METADATA_TABLE)
+        for item in parallel_scan(table, projection='faceId, s3Key, imageKey, additionalImages'):
             face_id = item['faceId']
-            s3_key = item.get('s3Key', f'faces/{face_id}.jpg')
+            s3_key = image_key_for(item)
             
             # Delete from DynamoDB
             table.delete_item(Key={'faceId': face_id})
             print(f"✅ Deleted DynamoDB record: {face_id}")
             
-            # Delete from S3
-            try:
-                s3_client.delete_object(Bucket=bucket_name, Key=s3_key)
-                print(f"✅ Deleted S3 object: {s3_key}")
-            except:
-                print(f"⚠️  S3 object not found: {s3_key}")
+            # Delete from S3 (the record's image and any attached to it)
+            for image_key in dict.fromkeys([s3_key] + list(item.get('additionalImages', []))):
+                try:
+                    s3_client.delete_object(Bucket=bucket_name, Key=image_key)
+                    print(f"✅ Deleted S3 object: {image_key}")
+                except:
+                    print(f"⚠️  S3 object not found: {image_key}")
         
         print("\n🎉 ALL faces removed successfully!")
         
     except Exception as e:
         print(f"❌ Error removing all faces: {str(e)}")
 
-def remove_by_name(dynamodb, rekognition, s3_client, collection_id, bucket_name, db_records):
-    """Remove face by name"""
-    print("\n🔍 Available faces:")
-    for i, record in enumerate(db_records, 1):
-        name = f"{record.get('firstName', 'N/A')} {record.get('lastName', 'N/A')}"
-        print(f"   {i}. {name}")
+def choose_record(pages):
+    """
+    Show matches one page at a time (the next page is only fetched when
+    asked for) and return the record picked, or None
+    """
+    shown = []
+    for page in pages:
+        for record in page:
+            shown.append(record)
+            name = f"{record.get('firstName', 'N/A')} {record.get('lastName', 'N/A')}"
+            print(f"   {len(shown)}. {name}")
+            print(f"      Face ID: {record.get('faceId', 'N/A')}")
+            print(f"      Registered: {record.get('createdAt', 'N/A')}")
+        answer = input("\nEnter the number of the face to remove, 'n' for more matches, or Enter to cancel: ").strip().lower()
+        if answer != 'n':
+            break
+    else:
+        if not shown:
+            print("❌ No matching faces found")
+            return None
+        answer = input("\nNo more matches. Enter the number of the face to remove, or Enter to cancel: ").strip()
     
+    if not answer or answer == 'n':
+        print("❌ Operation cancelled")
+        return None
     try:
-        choice = int(input("\nEnter the number of the face to remove: ")) - 1
-        if 0 <= choice < len(db_records):
-            record = db_records[choice]
-            remove_single_face(dynamodb, rekognition, s3_client, collection_id, bucket_name, record)
-        else:
-            print("❌ Invalid choice")
+        choice = int(answer) - 1
     except ValueError:
         print("❌ Invalid input")
+        return None
+    if 0 <= choice < len(shown):
+        return shown[choice]
+    print("❌ Invalid choice")
+    return None
 
-def remove_by_face_id(dynamodb, rekognition, s3_client, collection_id, bucket_name, db_records):
+def remove_by_name(dynamodb, rekognition, s3_client, collection_id, bucket_name):
+    """Remove face by name"""
+    name = input("\nEnter the full name (first and last) of the face to remove: ").strip()
+    if not name:
+        print("❌ Invalid input")
+        return
+    
+    print("\n🔍 Matching faces:")
+    table = dynamodb.Table(METADATA_TABLE)
+    record = choose_record(find_by_name(table, name, PAGE_SIZE))
+    if record:
+        remove_single_face(dynamodb, rekognition, s3_client, collection_id, bucket_name, record)
+
+def remove_by_phone(dynamodb, rekognition, s3_client, collection_id, bucket_name):
+    """Remove face by phone number"""
+    phone_number = input("\nEnter the phone number of the face to remove: ").strip()
+    if not phone_number:
+        print("❌ Invalid input")
+        return
+    
+    print("\n🔍 Matching faces:")
+    table = dynamodb.Table(METADATA_TABLE)
+    record = choose_record(find_by_phone(table, phone_number, PAGE_SIZE))
+    if record:
+        remove_single_face(dynamodb, rekognition, s3_client, collection_id, bucket_name, record)
+
+def remove_by_face_id(dynamodb, rekognition, s3_client, collection_id, bucket_name):
     """Remove face by Face ID"""
     face_id = input("\nEnter the Face ID to remove: ").strip()
     
-    # Find the record
-    record = None
-    for r in db_records:
-        if r.get('faceId') == face_id:
-            record = r
-            break
-    
+    record = get_person(dynamodb.Table(METADATA_TABLE), face_id)
     if record:
         remove_single_face(dynamodb, rekognition, s3_client, collection_id, bucket_name, record)
     else:
         print(f"❌ Face ID {face_id} not found")
 
-def remove_unindexed_faces(dynamodb, s3_client, bucket_name, db_records):
+def remove_unindexed_faces(dynamodb, s3_client, bucket_name):
     """Remove unindexed faces only"""
     print("\n🗑️ Removing unindexed faces...")
     
-    unindexed = [r for r in db_records if r.get('rekognitionFaceId') == 'N/A' or r.get('status') != 'indexed']
+    table = dynamodb.Table(METADATA_TABLE)
+    unindexed = list(parallel_scan(
+        table,
+        projection='faceId, firstName, lastName, s3Key, imageKey, additionalImages',
+        filter_expression=Attr('rekognitionFaceId').eq('N/A') | Attr('status').ne('indexed')
+    ))
     
     if not unindexed:
         print("✅ No unindexed faces found")
@@ -170,20 +193,22 @@ def remove_unindexed_faces(dynamodb, s3_client, bucket_name, db_records):
     
     confirm = input(f"\nRemove {len(unindexed)} unindexed faces? (y/n): ").lower()
     if confirm == 'y':
-        table = dynamodb.Table('face-metadata')
+        # Images attached to the rows being removed do not keep themselves
+        attached_keys = attached_image_keys(table, exclude={record['faceId'] for record in unindexed})
         for record in unindexed:
             face_id = record['faceId']
-            s3_key = record.get('s3Key', f'faces/{face_id}.jpg')
+            s3_key = image_key_for(record)
             
             # Delete from DynamoDB
             table.delete_item(Key={'faceId': face_id})
             print(f"✅ Deleted: {face_id}")
             
-            # Delete from S3
-            try:
-                s3_client.delete_object(Bucket=bucket_name, Key=s3_key)
-            except:
-                pass
+            # Delete from S3 (unless another person still references the image)
+            for image_key in dict.fromkeys([s3_key] + list(record.get('additionalImages', []))):
+                try:
+                    delete_image_if_unreferenced(table, s3_client, bucket_name, image_key, attached_keys)
+                except:
+                    pass
         
         print("✅ Unindexed faces removed!")
 
@@ -192,32 +217,36 @@ def remove_single_face(dynamodb, rekognition, s3_client, collection_id, bucket_n
     face_id = record['faceId']
     name = f"{record.get('firstName', 'N/A')} {record.get('lastName', 'N/A')}"
     rekognition_id = record.get('rekognitionFaceId')
-    s3_key = record.get('s3Key', f'faces/{face_id}.jpg')
+    s3_key = image_key_for(record)
     
     print(f"\n🗑️ Removing: {name}")
     print(f"   Face ID: {face_id}")
     print(f"   Rekognition ID: {rekognition_id}")
     
     try:
-        # Delete from Rekognition
+        # Delete from Rekognition (in the record's gallery shard)
         if rekognition_id and rekognition_id != 'N/A':
             rekognition.delete_faces(
-                CollectionId=collection_id,
+                CollectionId=collection_for(record.get('galleryShard', '')),
                 FaceIds=[rekognition_id]
             )
             print(f"✅ Deleted from Rekognition: {rekognition_id}")
         
         # Delete from DynamoDB
-        table = dynamodb.Table('face-metadata')
+        table = dynamodb.Table(METADATA_TABLE)
         table.delete_item(Key={'faceId': face_id})
         print(f"✅ Deleted from DynamoDB: {face_id}")
         
-        # Delete from S3
-        try:
-            s3_client.delete_object(Bucket=bucket_name, Key=s3_key)
-            print(f"✅ Deleted from S3: {s3_key}")
-        except:
-            print(f"⚠️  S3 object not found: {s3_key}")
+        # Delete the person's images from S3 (unless another person still
+        # references them): their own and any attached to the record
+        for image_key in dict.fromkeys([s3_key] + list(record.get('additionalImages', []))):
+            try:
+                if delete_image_if_unreferenced(table, s3_client, bucket_name, image_key):
+                    print(f"✅ Deleted from S3: {image_key}")
+                else:
+                    print(f"ℹ️  S3 object kept, still referenced by another record: {image_key}")
+            except:
+                print(f"⚠️  S3 object not found: {image_key}")
         
         print(f"🎉 Successfully removed: {name}")
         
@@ -0,0 +1,124 @@
+import cProfile
+import glob
+import hmac
+import json
+import os
+import random
+import re
+import time
+from functools import wraps
+
+from flask import g, jsonify, request, send_from_directory
+
+# Profiling configuration. Nothing is hooked into the app unless
+# PROFILING_ENABLED=1, so a disabled profiler costs nothing per request.
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "0") == "1"
+PROFILE_DIR = os.path.abspath(os.environ.get("PROFILE_DIR", "profiles"))
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_HEADER = "X-Profile"
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")  # if set, the header must carry this value
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "50"))
+# The /admin/profiles routes need "Authorization: Bearer <PROFILE_ADMIN_TOKEN>";
+# without a token configured they only answer requests from localhost (set a
+# token when a reverse proxy on the same host forwards outside traffic)
+PROFILE_ADMIN_TOKEN = os.environ.get("PROFILE_ADMIN_TOKEN", "")
+LOCAL_ADDRESSES = ("127.0.0.1", "::1")
+
+
+def should_profile():
+    """Profile when the trigger header is present or the request is sampled"""
+    header = request.headers.get(PROFILE_HEADER)
+    if header is not None and (not PROFILE_TOKEN or header == PROFILE_TOKEN):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def start_profile():
+    if request.path.startswith("/admin/profiles") or not should_profile():
+        return
+    g.profiler = cProfile.Profile()
+    g.profile_started = time.perf_counter()
+    g.profiler.enable()
+
+
+def stop_profile(exc=None):
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return
+    profiler.disable()
+    duration_ms = (time.perf_counter() - g.pop("profile_started")) * 1000
+    route = request.url_rule.rule if request.url_rule else request.path
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+    name = f"{int(time.time() * 1000)}_{request.method}_{slug}_{int(duration_ms)}ms"
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}.pstats"))
+    with open(os.path.join(PROFILE_DIR, f"{name}.json"), "w") as f:
+        json.dump({
+            "name": name,
+            "route": route,
+            "path": request.path,
+            "method": request.method,
+            "durationMs": round(duration_ms, 2),
+            "error": str(exc) if exc else None,
+            "createdAt": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }, f)
+    prune_profiles()
+
+
+def prune_profiles():
+    """Keep only the PROFILE_KEEP most recent profiles on disk"""
+    metadata = sorted(glob.glob(os.path.join(PROFILE_DIR, "*.json")), reverse=True)
+    for path in metadata[PROFILE_KEEP:]:
+        for stale in (path, path[:-len(".json")] + ".pstats"):
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+
+
+def admin_allowed():
+    if PROFILE_ADMIN_TOKEN:
+        header = request.headers.get("Authorization", "")
+        return hmac.compare_digest(header.encode("utf-8"), f"Bearer {PROFILE_ADMIN_TOKEN}".encode("utf-8"))
+    return request.remote_addr in LOCAL_ADDRESSES
+
+
+def admin_only(view):
+    @wraps(view)
+    def guarded(*args, **kwargs):
+        if not admin_allowed():
+            return jsonify({"success": False, "error": "Forbidden"}), 403
+        return view(*args, **kwargs)
+    return guarded
+
+
+def list_profiles():
+    limit = int(request.args.get("limit", 20))
+    profiles = []
+    for path in sorted(glob.glob(os.path.join(PROFILE_DIR, "*.json")), reverse=True)[:limit]:
+        try:
+            with open(path) as f:
+                profiles.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return jsonify({"success": True, "profiles": profiles, "count": len(profiles)})
+
+
+def download_profile(name):
+    return send_from_directory(PROFILE_DIR, f"{name}.pstats", as_attachment=True)
+
+
+def init_app(app):
+    """
+    Register the profiling hooks and admin routes. Profiles are cProfile
+    pstats files (open with `python -m pstats` or snakeviz) plus a JSON
+    sidecar holding the route and duration. The admin routes require
+    PROFILE_ADMIN_TOKEN, or a local client when no token is set.
+    """
+    if not PROFILING_ENABLED:
+        return
+    app.before_request(start_profile)
+    app.teardown_request(stop_profile)
+    app.add_url_rule("/admin/profiles", "list_profiles", admin_only(list_profiles), methods=["GET"])
+    app.add_url_rule("/admin/profiles/<name>", "download_profile", admin_only(download_profile), methods=["GET"])
@@ -0,0 +1,113 @@
+"""
+Production entry point for app.py
+
+Runs the Flask app under gunicorn with multiple worker processes, each with a
+thread pool (gthread workers). The app module is preloaded in the master so
+the boto3 clients are built once and inherited by every worker. On platforms
+without gunicorn (Windows) it falls back to waitress, which is threads only
+(--workers is ignored there).
+
+Usage:
+    pip install -r requirements.txt
+    python serve.py --workers 4 --threads 8 --bind 0.0.0.0:8000
+
+Attendance streaming is opt-in (STREAMING_ENABLED=1). It keeps each kiosk's
+session in the serving process, so with it on the server runs a single
+worker whatever --workers says, with --stream-kiosks threads for the
+long-lived event streams on top of --threads. Run streaming kiosks against
+their own serve.py instance to keep the main API on several workers.
+
+Every option can also be set through the environment:
+SERVE_BIND, SERVE_WORKERS, SERVE_THREADS, SERVE_STREAM_KIOSKS, SERVE_TIMEOUT,
+SERVE_GRACEFUL_TIMEOUT
+"""
+import argparse
+import multiprocessing
+import os
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the face recognition API")
+    parser.add_argument("--bind", default=os.environ.get("SERVE_BIND", "0.0.0.0:8000"))
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get("SERVE_WORKERS", multiprocessing.cpu_count() * 2 + 1)))
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("SERVE_THREADS", "8")))
+    parser.add_argument("--stream-kiosks", type=int, default=int(os.environ.get("SERVE_STREAM_KIOSKS", "32")),
+                        help="kiosks that may stream at once (one thread each) when streaming is enabled")
+    parser.add_argument("--timeout", type=int, default=int(os.environ.get("SERVE_TIMEOUT", "60")))
+    parser.add_argument("--graceful-timeout", type=int,
+                        default=int(os.environ.get("SERVE_GRACEFUL_TIMEOUT", "30")))
+    return parser.parse_args()
+
+
+def serve_gunicorn(args):
+    from gunicorn.app.base import BaseApplication
+
+    class FaceApiApplication(BaseApplication):
+        def __init__(self, options):
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from app import app
+            return app
+
+    # SIGTERM makes gunicorn stop accepting connections and lets in-flight
+    # requests finish for up to graceful_timeout seconds before exiting.
+    FaceApiApplication({
+        "bind": args.bind,
+        "workers": args.workers,
+        "threads": args.threads,
+        "worker_class": "gthread",
+        "timeout": args.timeout,
+        "graceful_timeout": args.graceful_timeout,
+        "keepalive": 5,
+        "preload_app": True,
+        "accesslog": "-",
+    }).run()
+
+
+def serve_waitress(args):
+    from waitress import serve
+    from app import app
+
+    host, port = args.bind.rsplit(":", 1)
+    if args.workers != 1:
+        print(f"Warning: waitress runs a single process: --workers {args.workers} is ignored, "
+              f"scale with --threads instead")
+    print(f"gunicorn not available, serving with waitress ({args.threads} threads) on {args.bind}")
+    serve(app, host=host, port=int(port), threads=args.threads, channel_timeout=args.timeout)
+
+
+def configure_streaming(args):
+    """Single worker, and a thread per event stream, while streaming is on"""
+    if os.environ.get("STREAMING_ENABLED", "0") != "1":
+        return
+    if args.workers != 1:
+        print(f"Streaming sessions are per process: running 1 worker instead of {args.workers} "
+              f"(unset STREAMING_ENABLED to use several)")
+        args.workers = 1
+    # Sessions beyond the thread budget are refused (503) instead of
+    # starving the request threads
+    os.environ.setdefault("STREAM_MAX_SESSIONS", str(args.stream_kiosks))
+    args.threads += int(os.environ["STREAM_MAX_SESSIONS"])
+
+
+def main():
+    args = parse_args()
+    os.environ.setdefault("AWS_MAX_POOL_CONNECTIONS", str(max(args.threads, 10)))
+    configure_streaming(args)
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        serve_waitress(args)
+    else:
+        serve_gunicorn(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,472 @@
+import heapq
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+import boto3
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+
+import image_store
+from person_index import new_version
+from idempotency import IDEMPOTENCY_TABLE, DynamoIdempotencyStore, SQLiteIdempotencyStore
+from attendance_utils import by_timestamp, sort_newest_first
+from json_response import dumps
+
+# Storage configuration
+#   STORAGE_BACKEND     'aws' (S3 + DynamoDB) or 'edge' (local files + SQLite,
+#                       replicated to AWS by edge-sync.py)
+#   EDGE_DATA_DIR       where the edge backend keeps edge.db and images/
+#   EDGE_READ_THROUGH   '1' to fetch people and images registered elsewhere
+#                       from AWS when they are not on the edge node yet. The
+#                       upstream client fails fast (short timeouts, no
+#                       retries) and is skipped for EDGE_UPSTREAM_BACKOFF
+#                       seconds after a failure, so a bad uplink costs one
+#                       slow lookup rather than every lookup of an unknown face
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "aws")
+AWS_REGION = os.environ.get("AWS_REGION", "us-east-1")
+BUCKET_NAME = os.environ.get("BUCKET_NAME", "facial-recognition-data-bucket")
+METADATA_TABLE = os.environ.get("METADATA_TABLE", "face-metadata")
+ATTENDANCE_TABLE = os.environ.get("ATTENDANCE_TABLE", "attendance-records")
+ATTENDANCE_DATE_INDEX = "date-index"
+# With ATTENDANCE_DATE_SHARDS set, attendance rows carry dateShard =
+# "<date>#<n>" so a day's writes spread over that many partitions of
+# dateShard-index instead of landing on one. The default 0 reads and writes
+# the unsharded date-index; set it only once the table has dateShard-index
+# (see migrate-attendance-date-shards.py). The count may be raised later but
+# not lowered: rows in shards above the new count would no longer be read.
+ATTENDANCE_SHARD_INDEX = "dateShard-index"
+ATTENDANCE_DATE_SHARDS = int(os.environ.get("ATTENDANCE_DATE_SHARDS", "0"))
+ATTENDANCE_QUERY_WORKERS = int(os.environ.get("ATTENDANCE_QUERY_WORKERS", "8"))
+ATTENDANCE_STATE_TABLE = os.environ.get("ATTENDANCE_STATE_TABLE", "attendance-state")
+EDGE_DATA_DIR = os.environ.get("EDGE_DATA_DIR", "edge-data")
+EDGE_READ_THROUGH = os.environ.get("EDGE_READ_THROUGH", "1") == "1"
+EDGE_UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get("EDGE_UPSTREAM_CONNECT_TIMEOUT", "2"))
+EDGE_UPSTREAM_READ_TIMEOUT = float(os.environ.get("EDGE_UPSTREAM_READ_TIMEOUT", "3"))
+EDGE_UPSTREAM_BACKOFF = float(os.environ.get("EDGE_UPSTREAM_BACKOFF", "30"))
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "10"))
+# BatchGetItem takes at most 100 keys; unprocessed keys are retried with backoff
+BATCH_GET_SIZE = 100
+BATCH_GET_RETRIES = int(os.environ.get("BATCH_GET_RETRIES", "5"))
+
+_shard_pool = ThreadPoolExecutor(max_workers=ATTENDANCE_QUERY_WORKERS, thread_name_prefix="attendance-shard")
+
+
+def date_shard(record, shards=ATTENDANCE_DATE_SHARDS):
+    """dateShard value for an attendance record, spread by attendanceId"""
+    if shards <= 0:
+        raise ValueError(f"date_shard needs a shard count of at least 1, got {shards}")
+    return f"{record['date']}#{zlib.crc32(record['attendanceId'].encode('utf-8')) % shards}"
+
+
+class AWSStorage:
+    """Images in S3, people and attendance in DynamoDB"""
+
+    def __init__(self, region=AWS_REGION, bucket_name=BUCKET_NAME,
+                 max_pool_connections=AWS_MAX_POOL_CONNECTIONS, date_shards=ATTENDANCE_DATE_SHARDS,
+                 config=None):
+        base = Config(max_pool_connections=max_pool_connections)
+        config = base.merge(config) if config else base
+        self.s3 = boto3.client("s3", region_name=region, config=config)
+        self.dynamodb = boto3.resource("dynamodb", region_name=region, config=config)
+        self.metadata_table = self.dynamodb.Table(METADATA_TABLE)
+        self.attendance_table = self.dynamodb.Table(ATTENDANCE_TABLE)
+        self.attendance_state_table = self.dynamodb.Table(ATTENDANCE_STATE_TABLE)
+        self.idempotency = DynamoIdempotencyStore(self.dynamodb.Table(IDEMPOTENCY_TABLE))
+        self.bucket_name = bucket_name
+        self.date_shards = date_shards
+
+    def put_image(self, image_bytes):
+        """Store an image under its content key (skipped if already stored); returns the key"""
+        # Nothing later fails on a missing object here, so never trust the cache alone
+        return image_store.put_image(self.s3, self.bucket_name, image_bytes, verify=True)[0]
+
+    def read_image(self, key):
+        return image_store.read_image(self.s3, self.bucket_name, key)
+
+    def put_person(self, item):
+        self.metadata_table.put_item(Item=dict(item, version=new_version()))
+
+    def get_person(self, face_id):
+        if not face_id:
+            return None
+        return self.metadata_table.get_item(Key={"faceId": face_id}).get("Item")
+
+    def get_people(self, face_ids):
+        """
+        {faceId: row} for the face_ids that exist, fetched with BatchGetItem
+        in requests of 100 keys. Keys DynamoDB leaves unprocessed (throttling,
+        16MB response limit) are retried with exponential backoff.
+        """
+        unique = list(dict.fromkeys(face_id for face_id in face_ids if face_id))
+        people = {}
+        for start in range(0, len(unique), BATCH_GET_SIZE):
+            keys = [{"faceId": face_id} for face_id in unique[start:start + BATCH_GET_SIZE]]
+            request = {METADATA_TABLE: {"Keys": keys}}
+            for attempt in range(BATCH_GET_RETRIES + 1):
+                response = self.dynamodb.batch_get_item(RequestItems=request)
+                for item in response.get("Responses", {}).get(METADATA_TABLE, []):
+                    people[item["faceId"]] = item
+                request = response.get("UnprocessedKeys")
+                if not request:
+                    break
+                if attempt == BATCH_GET_RETRIES:
+                    raise RuntimeError(f"BatchGetItem left {len(request[METADATA_TABLE]['Keys'])} keys "
+                                       f"unprocessed after {BATCH_GET_RETRIES} retries")
+                time.sleep(min(0.05 * 2 ** attempt, 1.0))
+        return people
+
+    def attendance_item(self, record):
+        """The record as stored, with its dateShard"""
+        if not self.date_shards or "dateShard" in record:
+            return record
+        return dict(record, dateShard=date_shard(record, self.date_shards))
+
+    def put_attendance(self, record):
+        self.attendance_table.put_item(Item=self.attendance_item(record))
+
+    def get_attendance_state(self, face_id):
+        return self.attendance_state_table.get_item(Key={"faceId": face_id}, ConsistentRead=True).get("Item")
+
+    def put_attendance_state(self, state, expected_timestamp):
+        """Write state if the stored one still has expected_timestamp (None: no state yet)"""
+        if expected_timestamp is None:
+            condition = Attr("faceId").not_exists()
+        else:
+            condition = Attr("timestamp").eq(expected_timestamp)
+        try:
+            self.attendance_state_table.put_item(Item=state, ConditionExpression=condition)
+            return True
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") == "ConditionalCheckFailedException":
+                return False
+            raise
+
+    def _query_partition(self, index_name, attribute, value, params, all_pages):
+        params = dict(params, IndexName=index_name, KeyConditionExpression=Key(attribute).eq(value))
+        records = []
+        while True:
+            response = self.attendance_table.query(**params)
+            records.extend(response.get("Items", []))
+            if not all_pages or "LastEvaluatedKey" not in response:
+                return records
+            params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def _query_date(self, date, params, all_pages, newest_first):
+        """
+        One day's records from the date index, in timestamp order. With
+        sharding every shard is queried concurrently and the (already
+        sorted) results are merged.
+        """
+        params = dict(params, ScanIndexForward=not newest_first)
+        if not self.date_shards:
+            return self._query_partition(ATTENDANCE_DATE_INDEX, "date", date, params, all_pages)
+        futures = [_shard_pool.submit(self._query_partition, ATTENDANCE_SHARD_INDEX, "dateShard",
+                                      f"{date}#{shard}", params, all_pages)
+                   for shard in range(self.date_shards)]
+        return list(heapq.merge(*(future.result() for future in futures), key=by_timestamp, reverse=newest_first))
+
+    def attendance_records(self, date=None, record_type=None, limit=100):
+        """Up to limit records, newest first when filtered by date"""
+        params = {"Limit": limit}
+        if record_type and record_type != "all":
+            params["FilterExpression"] = Attr("type").eq(record_type)
+        if date:
+            return self._query_date(date, params, all_pages=False, newest_first=True)[:limit]
+        return self.attendance_table.scan(**params).get("Items", [])
+
+    def attendance_page(self, record_type=None, limit=100, cursor=None):
+        """
+        One page of an undated scan, newest first, and the attendanceId to
+        pass as cursor for the next page (None after the last). Limit counts
+        the rows read, so a type filter can return fewer; scan order is by
+        partition, so the order only holds within the page.
+        """
+        params = {"Limit": limit}
+        if record_type and record_type != "all":
+            params["FilterExpression"] = Attr("type").eq(record_type)
+        if cursor:
+            params["ExclusiveStartKey"] = {"attendanceId": cursor}
+        response = self.attendance_table.scan(**params)
+        last_key = response.get("LastEvaluatedKey")
+        return sort_newest_first(response.get("Items", [])), last_key["attendanceId"] if last_key else None
+
+    def attendance_for_date(self, date):
+        """Every record of one day, oldest first"""
+        return self._query_date(date, {}, all_pages=True, newest_first=False)
+
+
+# Rows keep the full item as JSON next to the indexed columns. `revision`
+# changes on every write so the sync process only marks a row synced if it
+# has not been rewritten since it was read.
+EDGE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    key TEXT PRIMARY KEY,
+    revision INTEGER NOT NULL DEFAULT 1,
+    synced INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS people (
+    faceId TEXT PRIMARY KEY,
+    item TEXT NOT NULL,
+    revision INTEGER NOT NULL DEFAULT 1,
+    synced INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS attendance (
+    attendanceId TEXT PRIMARY KEY,
+    faceId TEXT NOT NULL,
+    date TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    type TEXT,
+    item TEXT NOT NULL,
+    revision INTEGER NOT NULL DEFAULT 1,
+    synced INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS attendance_state (
+    faceId TEXT PRIMARY KEY,
+    type TEXT,
+    timestamp TEXT NOT NULL,
+    date TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS idempotency (
+    key TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    status_code INTEGER,
+    response TEXT,
+    locked_until INTEGER NOT NULL,
+    expires_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attendance_face ON attendance (faceId, timestamp);
+CREATE INDEX IF NOT EXISTS attendance_date ON attendance (date, timestamp);
+CREATE INDEX IF NOT EXISTS attendance_timestamp ON attendance (timestamp);
+CREATE INDEX IF NOT EXISTS images_unsynced ON images (key) WHERE synced = 0;
+CREATE INDEX IF NOT EXISTS people_unsynced ON people (faceId) WHERE synced = 0;
+CREATE INDEX IF NOT EXISTS attendance_unsynced ON attendance (attendanceId) WHERE synced = 0;
+"""
+
+# table -> primary key column
+EDGE_KEYS = {"images": "key", "people": "faceId", "attendance": "attendanceId"}
+
+
+def _encode(item):
+    return dumps(item).decode("utf-8")
+
+
+def _decode(text):
+    # Decimals come back as Decimal so synced items are valid DynamoDB items
+    return json.loads(text, parse_float=Decimal)
+
+
+class EdgeStorage:
+    """
+    Images on the local filesystem, people and attendance in SQLite (WAL
+    mode, so readers never wait for the writer). Every write is marked
+    unsynced and replicated to AWS by edge-sync.py.
+    """
+
+    def __init__(self, data_dir=EDGE_DATA_DIR, upstream=None):
+        self.data_dir = data_dir
+        self.image_dir = os.path.join(data_dir, "images")
+        self.db_path = os.path.join(data_dir, "edge.db")
+        self.upstream = upstream  # AWSStorage for read-through, or None
+        self.upstream_down_until = 0.0
+        self.local = threading.local()
+        os.makedirs(self.image_dir, exist_ok=True)
+        with self.connection() as db:
+            db.executescript(EDGE_SCHEMA)
+        # Local to this node and never synced: retries come back to the same kiosk server
+        self.idempotency = SQLiteIdempotencyStore(self.connection)
+
+    def _from_upstream(self, read):
+        """
+        read() against AWS, or None when there is no upstream, it failed, or
+        it failed less than EDGE_UPSTREAM_BACKOFF seconds ago
+        """
+        if self.upstream is None or time.monotonic() < self.upstream_down_until:
+            return None
+        try:
+            return read()
+        except (BotoCoreError, ClientError) as e:
+            if isinstance(e, ClientError) and e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            self.upstream_down_until = time.monotonic() + EDGE_UPSTREAM_BACKOFF
+            return None
+
+    def connection(self):
+        """One connection per thread; sqlite3 connections are not shareable"""
+        db = getattr(self.local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=10)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; fine with sync to AWS
+            self.local.db = db
+        return db
+
+    # -- images -------------------------------------------------------------
+    def _image_path(self, key):
+        return os.path.join(self.image_dir, *key.split("/"))
+
+    def put_image(self, image_bytes):
+        key = image_store.content_key(image_bytes)
+        path = self._image_path(key)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary = f"{path}.{threading.get_ident()}.tmp"
+            with open(temporary, "wb") as f:
+                f.write(image_bytes)
+            os.replace(temporary, path)
+        # Queued after the file is in place, so the sync never finds it missing
+        with self.connection() as db:
+            db.execute("INSERT OR IGNORE INTO images (key) VALUES (?)", (key,))
+        return key
+
+    def read_image(self, key):
+        path = self._image_path(key)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                return f.read()
+        image = self._from_upstream(lambda: self.upstream.read_image(key))
+        if image is None:
+            raise FileNotFoundError(key)
+        return image
+
+    # -- people -------------------------------------------------------------
+    def put_person(self, item):
+        item = dict(item, version=new_version())
+        with self.connection() as db:
+            db.execute(
+                "INSERT INTO people (faceId, item) VALUES (?, ?) "
+                "ON CONFLICT (faceId) DO UPDATE SET item = excluded.item, "
+                "revision = revision + 1, synced = 0",
+                (item["faceId"], _encode(item))
+            )
+
+    def get_person(self, face_id):
+        if not face_id:
+            return None
+        row = self.connection().execute("SELECT item FROM people WHERE faceId = ?", (face_id,)).fetchone()
+        if row:
+            return _decode(row[0])
+        # Registered at another site: cache it here, already in sync
+        item = self._from_upstream(lambda: self.upstream.get_person(face_id))
+        if item:
+            with self.connection() as db:
+                db.execute("INSERT OR IGNORE INTO people (faceId, item, synced) VALUES (?, ?, 1)",
+                           (face_id, _encode(item)))
+        return item
+
+    def get_people(self, face_ids):
+        unique = list(dict.fromkeys(face_id for face_id in face_ids if face_id))
+        people = {}
+        db = self.connection()
+        # Stay well under SQLite's limit on bound parameters
+        for start in range(0, len(unique), 500):
+            chunk = unique[start:start + 500]
+            rows = db.execute(f"SELECT faceId, item FROM people WHERE faceId IN ({','.join('?' * len(chunk))})",
+                              chunk)
+            people.update((face_id, _decode(item)) for face_id, item in rows)
+        missing = [face_id for face_id in unique if face_id not in people]
+        fetched = self._from_upstream(lambda: self.upstream.get_people(missing)) if missing else None
+        if fetched:
+            with self.connection() as db:
+                db.executemany("INSERT OR IGNORE INTO people (faceId, item, synced) VALUES (?, ?, 1)",
+                               [(face_id, _encode(item)) for face_id, item in fetched.items()])
+            people.update(fetched)
+        return people
+
+    # -- attendance ---------------------------------------------------------
+    def put_attendance(self, record):
+        with self.connection() as db:
+            db.execute(
+                "INSERT INTO attendance (attendanceId, faceId, date, timestamp, type, item) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (attendanceId) DO UPDATE SET faceId = excluded.faceId, date = excluded.date, "
+                "timestamp = excluded.timestamp, type = excluded.type, item = excluded.item, "
+                "revision = revision + 1, synced = 0",
+                (record["attendanceId"], record["faceId"], record["date"], record["timestamp"],
+                 record.get("type"), _encode(record))
+            )
+
+    def get_attendance_state(self, face_id):
+        row = self.connection().execute(
+            "SELECT type, timestamp, date FROM attendance_state WHERE faceId = ?", (face_id,)).fetchone()
+        if not row:
+            return None
+        return {"faceId": face_id, "type": row[0], "timestamp": row[1], "date": row[2]}
+
+    def put_attendance_state(self, state, expected_timestamp):
+        # Site-local like the idempotency claims; the records themselves are synced
+        with self.connection() as db:
+            if expected_timestamp is None:
+                cursor = db.execute(
+                    "INSERT OR IGNORE INTO attendance_state (faceId, type, timestamp, date) VALUES (?, ?, ?, ?)",
+                    (state["faceId"], state["type"], state["timestamp"], state["date"]))
+            else:
+                cursor = db.execute(
+                    "UPDATE attendance_state SET type = ?, timestamp = ?, date = ? WHERE faceId = ? AND timestamp = ?",
+                    (state["type"], state["timestamp"], state["date"], state["faceId"], expected_timestamp))
+            return cursor.rowcount == 1
+
+    def attendance_records(self, date=None, record_type=None, limit=100):
+        """Up to limit records, newest first"""
+        clauses, params = [], []
+        if date:
+            clauses.append("date = ?")
+            params.append(date)
+        if record_type and record_type != "all":
+            clauses.append("type = ?")
+            params.append(record_type)
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        rows = self.connection().execute(
+            f"SELECT item FROM attendance {where}ORDER BY timestamp DESC LIMIT ?", params + [limit])
+        return [_decode(item) for item, in rows]
+
+    def attendance_for_date(self, date):
+        rows = self.connection().execute(
+            "SELECT item FROM attendance WHERE date = ? ORDER BY timestamp", (date,))
+        return [_decode(item) for item, in rows]
+
+    # -- replication (edge-sync.py) ----------------------------------------
+    def pending(self, table, limit):
+        """Up to limit unsynced rows of table as (key, revision, item)"""
+        key = EDGE_KEYS[table]
+        if table == "images":
+            rows = self.connection().execute(
+                "SELECT key, revision FROM images WHERE synced = 0 LIMIT ?", (limit,))
+            return [(k, revision, None) for k, revision in rows]
+        rows = self.connection().execute(
+            f"SELECT {key}, revision, item FROM {table} WHERE synced = 0 LIMIT ?", (limit,))
+        return [(k, revision, _decode(item)) for k, revision, item in rows]
+
+    def mark_synced(self, table, rows):
+        """Mark rows returned by pending() synced unless rewritten since"""
+        key = EDGE_KEYS[table]
+        with self.connection() as db:
+            db.executemany(f"UPDATE {table} SET synced = 1 WHERE {key} = ? AND revision = ?",
+                           [(k, revision) for k, revision, _ in rows])
+
+    def backlog(self):
+        """Unsynced row counts per table"""
+        db = self.connection()
+        return {table: db.execute(f"SELECT COUNT(*) FROM {table} WHERE synced = 0").fetchone()[0]
+                for table in EDGE_KEYS}
+
+
+def get_storage(backend=STORAGE_BACKEND):
+    """The configured storage backend"""
+    if backend == "aws":
+        return AWSStorage()
+    if backend == "edge":
+        upstream = None
+        if EDGE_READ_THROUGH:
+            upstream = AWSStorage(config=Config(connect_timeout=EDGE_UPSTREAM_CONNECT_TIMEOUT,
+                                                read_timeout=EDGE_UPSTREAM_READ_TIMEOUT,
+                                                retries={"total_max_attempts": 1}))
+        return EdgeStorage(upstream=upstream)
+    raise ValueError(f"Unknown STORAGE_BACKEND {backend!r} (expected 'aws' or 'edge')")
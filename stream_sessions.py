@@ -0,0 +1,166 @@
+import collections
+import os
+import threading
+import time
+import uuid
+
+from face_tracker import FaceTracker, crop
+from gallery import search_gallery
+from image_utils import check_image_quality
+
+# Streaming sessions live in the serving process, so they are opt-in:
+# with STREAMING_ENABLED=1 serve.py runs a single worker, with a thread per
+# kiosk stream on top of its request threads (STREAM_MAX_SESSIONS caps the
+# kiosks). Off (the default), the /stream routes answer 404 and serve.py
+# runs as many workers as asked. A kiosk whose session is gone (server
+# restart, idle timeout) gets a 404 and opens a new one.
+STREAMING_ENABLED = os.environ.get("STREAMING_ENABLED", "0") == "1"
+STREAM_SESSION_TTL = float(os.environ.get("STREAM_SESSION_TTL", "60"))  # idle seconds
+STREAM_MAX_SESSIONS = int(os.environ.get("STREAM_MAX_SESSIONS", "500"))
+STREAM_EVENT_BACKLOG = int(os.environ.get("STREAM_EVENT_BACKLOG", "100"))
+
+
+def make_recognizer(rekognition, storage):
+    """
+    Recognizer for StreamSession: searches the gallery with one face image
+    and returns {"faceId", "confidence", "person"} or None
+    """
+    def recognize(image_bytes, shard):
+        try:
+            response = search_gallery(rekognition, image_bytes, home_shard=shard)
+        except rekognition.exceptions.InvalidParameterException:
+            return None  # no face in the image
+        if not response.get("FaceMatches"):
+            return None
+        match = response["FaceMatches"][0]
+        # Registration indexes each face with ExternalImageId = faceId
+        person = storage.get_person(match["Face"].get("ExternalImageId"))
+        if not person:
+            return None
+        return {
+            "faceId": person["faceId"],
+            "confidence": match["Similarity"],
+            "person": {
+                "firstName": person.get("firstName", "Unknown"),
+                "lastName": person.get("lastName", "Unknown"),
+                "dateOfBirth": person.get("dateOfBirth", "Unknown"),
+                "phoneNumber": person.get("phoneNumber", "Unknown")
+            }
+        }
+    return recognize
+
+
+class StreamSession:
+    """
+    One kiosk's frame stream. Faces are tracked across frames locally and the
+    recognizer is only called for new tracks and tracks whose confidence has
+    decayed, so a person standing at the kiosk is recognised once.
+    """
+
+    def __init__(self, shard, recognizer):
+        self.id = uuid.uuid4().hex
+        self.shard = shard
+        self.recognizer = recognizer
+        self.tracker = FaceTracker()
+        self.frame_lock = threading.Lock()
+        self.events = collections.deque(maxlen=STREAM_EVENT_BACKLOG)
+        self.event_seq = 0
+        self.changed = threading.Condition()
+        self.last_seen = time.monotonic()
+        self.closed = False
+        self.stats = {"frames": 0, "recognitions": 0, "skippedLowQuality": 0}
+
+    def _publish(self, events):
+        with self.changed:
+            for event in events:
+                self.event_seq += 1
+                event["seq"] = self.event_seq
+                self.events.append(event)
+            if events:
+                self.changed.notify_all()
+
+    def wait_events(self, after_seq, timeout):
+        """Events with seq > after_seq, waiting up to timeout seconds for one"""
+        with self.changed:
+            if self.event_seq <= after_seq and not self.closed:
+                self.changed.wait(timeout)
+            return [event for event in self.events if event["seq"] > after_seq]
+
+    def close(self):
+        with self.changed:
+            self.closed = True
+            self.changed.notify_all()
+
+    def process_frame(self, image_bytes, boxes=None):
+        """
+        Track the faces in one frame and recognise the ones that need it.
+        Returns (events, tracks) for this frame; events are also published
+        to the session's event stream.
+        """
+        with self.frame_lock:
+            self.last_seen = now = time.monotonic()
+            self.stats["frames"] += 1
+            seen, ended = self.tracker.update(image_bytes, boxes, now)
+            events = [{"type": "lost", "trackId": track.id, "faceId": track.identity["faceId"]}
+                      for track in ended if track.identity]
+
+            due = [track for track in seen if track.needs_recognition(now)]
+            if due and check_image_quality(image_bytes, saved_calls=len(due)):
+                # Unusable frame: wait for a better one rather than paying for a search
+                self.stats["skippedLowQuality"] += 1
+                due = []
+            for track in due:
+                track.attempted_at = now
+                track.attempts += 1
+                self.stats["recognitions"] += 1
+                # With a single face the full frame is searched as-is
+                image = image_bytes if len(seen) == 1 else crop(image_bytes, track.box)
+                result = self.recognizer(image, self.shard)
+                if result:
+                    previous = track.identity
+                    track.identity = result
+                    track.recognized_at = now
+                    if not previous or previous["faceId"] != result["faceId"]:
+                        events.append(dict(result, type="match", trackId=track.id))
+                elif not track.identity and track.attempts == 1:
+                    events.append({"type": "unknown", "trackId": track.id})
+
+            for event in events:
+                event["timestamp"] = time.time()
+            self._publish(events)
+            return events, [track.to_dict(now) for track in seen]
+
+
+class SessionStore:
+    def __init__(self, recognizer):
+        self.recognizer = recognizer
+        self.sessions = {}
+        self.lock = threading.Lock()
+
+    def _expire(self):
+        cutoff = time.monotonic() - STREAM_SESSION_TTL
+        for session_id, session in list(self.sessions.items()):
+            if session.last_seen < cutoff:
+                del self.sessions[session_id]
+                session.close()
+
+    def create(self, shard=""):
+        with self.lock:
+            self._expire()
+            if len(self.sessions) >= STREAM_MAX_SESSIONS:
+                return None
+            session = StreamSession(shard, self.recognizer)
+            self.sessions[session.id] = session
+            return session
+
+    def get(self, session_id):
+        with self.lock:
+            self._expire()
+            return self.sessions.get(session_id)
+
+    def close(self, session_id):
+        with self.lock:
+            session = self.sessions.pop(session_id, None)
+        if session:
+            session.close()
+        return session
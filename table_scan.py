@@ -0,0 +1,193 @@
+import json
+import os
+import queue
+import threading
+import time
+
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+
+# Defaults for table-wide maintenance scans
+SCAN_SEGMENTS = int(os.environ.get("SCAN_SEGMENTS", "8"))
+SCAN_QUEUE_PAGES = int(os.environ.get("SCAN_QUEUE_PAGES", "16"))
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+class CapacityBudgetExhausted(Exception):
+    """Raised once the scan has consumed its capacity_limit; resume from the checkpoint"""
+
+
+class ParallelScan:
+    """
+    Parallel segmented scan of a DynamoDB table.
+
+    Each of `segments` workers scans its own Segment of the table, following
+    LastEvaluatedKey, and hands pages to the consumer through a bounded queue,
+    so at most SCAN_QUEUE_PAGES pages are held in memory however large the
+    table is. Iterating yields items in no particular order.
+
+        for item in ParallelScan(table, projection="faceId, s3Key"):
+            ...
+
+    projection / filter_expression / expression_names / expression_values
+        passed through as ProjectionExpression, FilterExpression (a string
+        or a boto3 Attr condition) and the ExpressionAttribute* maps.
+    capacity_per_second
+        read capacity units per second the scan may use; workers pause to
+        stay under it so maintenance does not starve production traffic.
+    capacity_limit
+        total read capacity units; once spent the scan stops and raises
+        CapacityBudgetExhausted (resume later from the checkpoint).
+    checkpoint_file
+        JSON file recording, per segment, the last key whose page the
+        consumer has finished with. A rerun with the same file skips
+        completed segments and resumes the others; the file is removed when
+        the scan completes. Items of a page the consumer was part-way
+        through when it stopped are yielded again on resume.
+    """
+
+    def __init__(self, table, segments=SCAN_SEGMENTS, projection=None, filter_expression=None,
+                 expression_names=None, expression_values=None, page_size=None,
+                 capacity_per_second=None, capacity_limit=None, checkpoint_file=None):
+        self.table = table
+        self.segments = segments
+        self.capacity_per_second = capacity_per_second
+        self.capacity_limit = capacity_limit
+        self.checkpoint_file = checkpoint_file
+
+        self.params = {"TotalSegments": segments, "ReturnConsumedCapacity": "TOTAL"}
+        if projection:
+            self.params["ProjectionExpression"] = projection
+        if filter_expression is not None:
+            self.params["FilterExpression"] = filter_expression
+        if expression_names:
+            self.params["ExpressionAttributeNames"] = expression_names
+        if expression_values:
+            self.params["ExpressionAttributeValues"] = expression_values
+        if page_size:
+            self.params["Limit"] = page_size
+
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.started = None
+        self.stats = {"items": 0, "scanned": 0, "pages": 0, "capacityUnits": 0.0}
+        self.state = self._load_checkpoint()
+
+    # -- checkpoints --------------------------------------------------------
+    def _load_checkpoint(self):
+        fresh = {str(segment): {"lastKey": None, "done": False} for segment in range(self.segments)}
+        if not self.checkpoint_file or not os.path.exists(self.checkpoint_file):
+            return fresh
+        with open(self.checkpoint_file) as f:
+            saved = json.load(f)
+        if saved.get("totalSegments") != self.segments:
+            raise ValueError(f"Checkpoint {self.checkpoint_file} was written for "
+                             f"{saved.get('totalSegments')} segments, not {self.segments}")
+        return saved["segments"]
+
+    def _save_checkpoint(self):
+        if not self.checkpoint_file:
+            return
+        temporary = self.checkpoint_file + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump({"totalSegments": self.segments, "segments": self.state}, f)
+        os.replace(temporary, self.checkpoint_file)
+
+    def _complete(self, segment, last_key):
+        """The consumer has finished every item of a page"""
+        entry = self.state[str(segment)]
+        if last_key is None:
+            entry["done"] = True
+            entry["lastKey"] = None
+        else:
+            entry["lastKey"] = {k: _serializer.serialize(v) for k, v in last_key.items()}
+        self._save_checkpoint()
+
+    def _start_key(self, segment):
+        saved = self.state[str(segment)]["lastKey"]
+        return {k: _deserializer.deserialize(v) for k, v in saved.items()} if saved else None
+
+    # -- workers ------------------------------------------------------------
+    def _throttle(self):
+        """Sleep while the scan is running ahead of capacity_per_second"""
+        if not self.capacity_per_second:
+            return
+        with self.lock:
+            ahead = self.stats["capacityUnits"] / self.capacity_per_second - (time.monotonic() - self.started)
+        if ahead > 0:
+            self.stop.wait(ahead)
+
+    def _put(self, pages, entry):
+        while not self.stop.is_set():
+            try:
+                pages.put(entry, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _worker(self, segment, pages):
+        params = dict(self.params, Segment=segment)
+        start_key = self._start_key(segment)
+        try:
+            while not self.stop.is_set():
+                self._throttle()
+                with self.lock:
+                    if self.capacity_limit and self.stats["capacityUnits"] >= self.capacity_limit:
+                        raise CapacityBudgetExhausted(
+                            f"Scan used its {self.capacity_limit} capacity unit budget; rerun to resume")
+                if start_key:
+                    params["ExclusiveStartKey"] = start_key
+                response = self.table.scan(**params)
+                with self.lock:
+                    self.stats["pages"] += 1
+                    self.stats["scanned"] += response.get("ScannedCount", 0)
+                    self.stats["capacityUnits"] += response.get("ConsumedCapacity", {}).get("CapacityUnits", 0)
+                start_key = response.get("LastEvaluatedKey")
+                if not self._put(pages, ("page", segment, response.get("Items", []), start_key)):
+                    return
+                if not start_key:
+                    return
+        except Exception as e:
+            self._put(pages, ("error", segment, e, None))
+        finally:
+            self._put(pages, ("exit", segment, None, None))
+
+    # -- consumer -----------------------------------------------------------
+    def __iter__(self):
+        pending = [segment for segment in range(self.segments) if not self.state[str(segment)]["done"]]
+        if not pending:
+            return
+        pages = queue.Queue(maxsize=SCAN_QUEUE_PAGES)
+        self.started = time.monotonic()
+        workers = [threading.Thread(target=self._worker, args=(segment, pages), daemon=True,
+                                    name=f"scan-{segment}") for segment in pending]
+        for worker in workers:
+            worker.start()
+
+        running = len(workers)
+        try:
+            while running:
+                kind, segment, payload, last_key = pages.get()
+                if kind == "exit":
+                    running -= 1
+                elif kind == "error":
+                    raise payload
+                else:
+                    for item in payload:
+                        self.stats["items"] += 1
+                        yield item
+                    self._complete(segment, last_key)
+            if self.checkpoint_file and os.path.exists(self.checkpoint_file):
+                os.remove(self.checkpoint_file)
+        finally:
+            # Also reached when the consumer stops early or a worker failed
+            self.stop.set()
+            for worker in workers:
+                worker.join(timeout=5)
+
+
+def parallel_scan(table, **kwargs):
+    """Iterate every item of table (see ParallelScan for the options)"""
+    return iter(ParallelScan(table, **kwargs))
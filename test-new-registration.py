@@ -1,5 +1,7 @@
 import boto3
 import json
+from gallery import all_collections
+from table_scan import parallel_scan
 
 def test_new_registration():
     """
@@ -9,24 +11,29 @@ def test_new_registration():
         rekognition = boto3.client('rekognition', region_name='us-east-1')
         dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
         
-        collection_id = 'face-collection'
-        
         print("🔍 Testing New Registration System...")
         print("=" * 50)
         
-        # Check Rekognition collection
-        try:
-            response = rekognition.describe_collection(CollectionId=collection_id)
-            print(f"✅ Collection face count: {response['FaceCount']}")
-        except Exception as e:
-            print(f"❌ Collection error: {str(e)}")
-            return
+        # Check Rekognition collections (one per gallery shard)
+        collections = []
+        for collection_id in all_collections():
+            try:
+                response = rekognition.describe_collection(CollectionId=collection_id)
+                print(f"✅ Collection {collection_id} face count: {response['FaceCount']}")
+                collections.append(collection_id)
+            except rekognition.exceptions.ResourceNotFoundException:
+                print(f"⚠️  Collection {collection_id} does not exist yet")
+            except Exception as e:
+                print(f"❌ Collection error: {str(e)}")
+                return
         
-        # List faces in collection
-        print(f"\n📋 Faces in Rekognition Collection:")
+        # List faces in collections
+        print(f"\n📋 Faces in Rekognition Collections:")
         try:
-            list_response = rekognition.list_faces(CollectionId=collection_id)
-            faces = list_response.get('Faces', [])
+            faces = []
+            for collection_id in collections:
+                list_response = rekognition.list_faces(CollectionId=collection_id)
+                faces.extend(list_response.get('Faces', []))
             
             for i, face in enumerate(faces, 1):
                 print(f"   {i}. Face ID: {face['FaceId']}")
@@ -39,20 +46,26 @@ def test_new_registration():
         print(f"\n📋 DynamoDB Records:")
         try:
             table = dynamodb.Table('face-metadata')
-            response = table.scan()
-            items = response.get('Items', [])
             
             indexed_count = 0
-            for item in items:
+            total = 0
+            for item in parallel_scan(
+                table,
+                projection='faceId, firstName, lastName, rekognitionFaceId, #status, galleryShard',
+                expression_names={'#status': 'status'}
+            ):
+                total += 1
                 face_id = item.get('faceId', 'N/A')
                 name = f"{item.get('firstName', 'N/A')} {item.get('lastName', 'N/A')}"
                 rekognition_id = item.get('rekognitionFaceId', 'N/A')
                 status = item.get('status', 'N/A')
+                shard = item.get('galleryShard') or 'default'
                 
                 print(f"   - {name}")
                 print(f"     Face ID: {face_id}")
                 print(f"     Rekognition ID: {rekognition_id}")
                 print(f"     Status: {status}")
+                print(f"     Gallery shard: {shard}")
                 
                 if rekognition_id != 'N/A' and status == 'indexed':
                     indexed_count += 1
@@ -60,7 +73,7 @@ def test_new_registration():
                 else:
                     print(f"     ❌ NOT indexed")
             
-            print(f"\n📊 Summary: {indexed_count}/{len(items)} faces properly indexed")
+            print(f"\n📊 Summary: {indexed_count}/{total} faces properly indexed")
             
         except Exception as e:
             print(f"❌ DynamoDB error: {str(e)}")
@@ -18,7 +18,16 @@ class FaceVerify {
         // AWS Configuration
         this.awsConfig = {
             region: 'us-east-1',
-            apiGatewayUrl: 'https://58z5i6ahil.execute-api.us-east-1.amazonaws.com/prod' // Replace with your actual API Gateway URL
+            apiGatewayUrl: 'https://58z5i6ahil.execute-api.us-east-1.amazonaws.com/prod', // Replace with your actual API Gateway URL
+            galleryShard: '', // This kiosk's site/department gallery shard ('' = default collection)
+            directUpload: true // Upload frames to S3 with a presigned URL instead of inline base64
+        };
+        
+        // Burst capture: the server scores the frames (inline or uploaded) and
+        // recognizes only the best one
+        this.burstConfig = {
+            frames: 3,
+            intervalMs: 150
         };
         
         this.initializeEventListeners();
@@ -100,16 +109,31 @@ class FaceVerify {
         this.showMessage('Image captured successfully!', 'success');
     }
     
+    async captureBurst() {
+        const frames = [];
+        for (let i = 0; i < this.burstConfig.frames; i++) {
+            if (i > 0) {
+                await new Promise(resolve => setTimeout(resolve, this.burstConfig.intervalMs));
+            }
+            this.captureImage();
+            if (!this.capturedImage) {
+                break;
+            }
+            frames.push(this.capturedImage);
+        }
+        return frames;
+    }
+    
     async verifyImage() {
         if (!this.stream) {
             this.showMessage('Please start the webcam first.', 'error');
             return;
         }
         
-        // Capture image first
-        this.captureImage();
+        // Capture a short burst of frames first
+        const frames = await this.captureBurst();
         
-        if (!this.capturedImage) {
+        if (frames.length === 0) {
             return;
         }
         
@@ -118,7 +142,7 @@ class FaceVerify {
             this.setLoading(true);
             
             // Call AWS API Gateway
-            const result = await this.verifyFaceAPI(this.capturedImage);
+            const result = await this.verifyFaceAPI(frames);
             
             this.displayResult(result);
             
@@ -139,21 +163,64 @@ class FaceVerify {
         this.resultDiv.style.display = 'none';
     }
     
-    async verifyFaceAPI(imageData) {
+    // Upload a burst straight to S3: one call for all the presigned URLs,
+    // then the PUTs in parallel
+    async uploadFrames(dataUrls) {
+        const response = await fetch(`${this.awsConfig.apiGatewayUrl}/upload-url`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ purpose: 'verify', count: dataUrls.length })
+        });
+        if (!response.ok) {
+            throw new Error(`Upload URL error! status: ${response.status}`);
+        }
+        const { uploads } = await response.json();
+        return Promise.all(dataUrls.map(async (dataUrl, i) => {
+            const blob = await (await fetch(dataUrl)).blob();
+            const put = await fetch(uploads[i].uploadUrl, { method: 'PUT', headers: uploads[i].headers, body: blob });
+            if (!put.ok) {
+                throw new Error(`S3 upload failed! status: ${put.status}`);
+            }
+            return uploads[i].s3Key;
+        }));
+    }
+    
+    async verifyFaceAPI(frames) {
         console.log('🔍 Calling real API...');
         console.log('API URL:', this.awsConfig.apiGatewayUrl);
         
+        let payload = { images: frames, shard: this.awsConfig.galleryShard };
+        if (this.awsConfig.directUpload) {
+            try {
+                const s3Keys = await this.uploadFrames(frames);
+                payload = { s3Keys, shard: this.awsConfig.galleryShard };
+            } catch (error) {
+                // Fall back to sending the frames in the request body
+                console.warn('Direct upload failed, sending frames inline:', error);
+            }
+        }
+        
         try {
             const response = await fetch(`${this.awsConfig.apiGatewayUrl}/verify`, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({ image: imageData })
+                body: JSON.stringify(payload)
             });
             
             console.log('Response status:', response.status);
             
+            // Image rejected by the server-side quality check: recapture
+            if (response.status === 400) {
+                const rejected = await response.json();
+                if (rejected.reason) {
+                    return rejected;
+                }
+            }
+            
             if (!response.ok) {
                 const errorText = await response.text();
                 console.error('API Error Response:', errorText);